@@ -0,0 +1,68 @@
+from __future__ import division, print_function
+
+import tracemalloc
+
+import physical
+from physical import vector, meter, second, kg, color
+
+N = 10000
+
+def bytes_per(make):
+    '''The number of bytes allocated per object by make().'''
+    objects = []
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(N):
+        objects.append(make(i))
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before - 8*N)/N # do not count the list itself
+
+print(bytes_per(lambda i: vector(i, 0, 0)*meter), 'bytes per vector')
+print(bytes_per(lambda i: i*meter), 'bytes per scalar')
+# We create the sphere objects directly, so that no window is needed.
+print(bytes_per(lambda i: physical._Sphere(vector(i,0,0)*meter, 0.1*meter,
+                                           color.red)),
+      'bytes per sphere')
+
+def with_velocity(i):
+    s = physical._Sphere(vector(i,0,0)*meter, 0.1*meter, color.red)
+    s.v = vector(0,0,0)*meter/second
+    return s
+print(bytes_per(with_velocity), 'bytes per sphere with velocity s.v')
+
+# Count the scalars and vectors created while taking a time step
+# of a falling ball, by counting calls to their __new__.
+created = [0]
+def counting_new(cls, *args):
+    created[0] += 1
+    return object.__new__(cls)
+
+ball = with_velocity(0)
+ball.m = 1*kg
+g = vector(0,0,-9.8)*meter/second**2
+dt = 0.01*second
+def timestep():
+    F = ball.m*g
+    ball.v += F/ball.m*dt
+    ball.pos += ball.v*dt
+
+def measure_timestep(name):
+    steps = 1000
+    created[0] = 0
+    for cls in (physical.scalar, vector):
+        cls.__new__ = staticmethod(counting_new)
+    tracemalloc.start()
+    for i in range(steps):
+        timestep()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    for cls in (physical.scalar, vector):
+        del cls.__new__
+    print(created[0]/steps, 'scalars and vectors allocated per timestep' + name)
+    print(peak, 'bytes peak memory while stepping' + name)
+
+measure_timestep('')
+physical.mutable_vectors()
+measure_timestep(' with mutable_vectors')
+physical.mutable_vectors(False)
@@ -0,0 +1,35 @@
+from __future__ import division, print_function
+
+import time
+
+import numpy
+
+from physical import VectorArray, QuantityArray, Newton, meter, kg
+from physical.nbody import InverseSquareForce
+
+# Compare the time taken by the Barnes-Hut tree and by the exact sum
+# over pairs for a cluster of stars, and the error of the tree.
+
+G = 6.674e-11*Newton*meter**2/kg**2
+
+def seconds(f):
+    start = time.time()
+    result = f()
+    return time.time() - start, result
+
+random = numpy.random.RandomState(0)
+print('%8s %6s %10s %10s %12s %12s' % ('N', 'theta', 'tree (s)', 'exact (s)',
+                                       'median err', 'max err'))
+for N in (300, 1000, 3000, 10000, 30000):
+    positions = VectorArray(random.normal(size=(N, 3)))*meter
+    masses = QuantityArray(random.uniform(1, 2, N))*kg
+    exact_time, exact = seconds(lambda: InverseSquareForce(-G).exact_forces(positions, masses))
+    # The error is relative to the typical force, since the force is
+    # nearly zero near the center of the cluster.
+    typical = numpy.sqrt((exact._data**2).sum(axis=1).mean())
+    for theta in (0.3, 0.5, 0.8):
+        gravity = InverseSquareForce(-G, theta=theta, direct_below=0)
+        tree_time, F = seconds(lambda: gravity.forces(positions, masses))
+        error = numpy.sqrt(((F._data - exact._data)**2).sum(axis=1))/typical
+        print('%8d %6.1f %10.3f %10.3f %12.2e %12.2e' % (N, theta, tree_time, exact_time,
+                                                         numpy.median(error), error.max()))
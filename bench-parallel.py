@@ -0,0 +1,48 @@
+from __future__ import division, print_function
+
+import os, time
+
+import numpy
+
+from physical import VectorArray, QuantityArray, Newton, meter, kg
+from physical.neighbors import ShortRangeForce
+from physical.nbody import InverseSquareForce
+from physical.parallel import WorkerPool
+
+# Compare the time taken to find the forces with the work shared
+# between different numbers of worker processes, for the cell list of
+# ShortRangeForce and the exact sum over pairs of InverseSquareForce.
+
+L = 1*meter
+law = lambda dr, r: 0.1*L**5*dr/r**6*Newton
+
+def seconds(f, repeats=5):
+    f()
+    start = time.time()
+    for i in range(repeats):
+        f()
+    return (time.time() - start)/repeats
+
+random = numpy.random.RandomState(0)
+N = 30000
+positions = VectorArray(random.uniform(0, 0.9*N**(1/3), (N, 3)))*meter
+stars = VectorArray(random.normal(size=(5000, 3)))*meter
+masses = QuantityArray(random.uniform(1, 2, len(stars)))*kg
+
+serial_short = seconds(lambda: ShortRangeForce(2*L, law).forces(positions))
+serial_exact = seconds(lambda: InverseSquareForce(-Newton*meter**2/kg**2)
+                       .exact_forces(stars, masses), 1)
+print('%10s %14s %10s %14s %10s' % ('processes', 'short (s)', 'speedup',
+                                    'exact (s)', 'speedup'))
+print('%10s %14.3f %10s %14.3f %10s' % ('serial', serial_short, '', serial_exact, ''))
+processes = 1
+while processes <= (os.cpu_count() or 1):
+    with WorkerPool(processes) as pool:
+        short = ShortRangeForce(2*L, law, pool=pool)
+        gravity = InverseSquareForce(-Newton*meter**2/kg**2, pool=pool)
+        # each call rebuilds the lists of neighbors, as in the serial case
+        t_short = seconds(lambda: ShortRangeForce(2*L, law, pool=pool).forces(positions))
+        t_exact = seconds(lambda: gravity.exact_forces(stars, masses), 1)
+    print('%10d %14.3f %10.2f %14.3f %10.2f' % (processes, t_short, serial_short/t_short,
+                                                t_exact, serial_exact/t_exact))
+    processes *= 2
@@ -0,0 +1,54 @@
+from __future__ import division, print_function
+
+import time
+
+import physical
+from physical import vector, meter, Newton, color
+from physical.springs import SpringNetwork
+
+# Time the spring forces of a cubic lattice like the one in crystal.py,
+# first with a Python loop over the helices, and then with a
+# SpringNetwork.  We create the objects directly, so that no window is
+# needed.
+
+N = 20
+kspring = 10*Newton/meter
+L = 1*meter
+
+balls = physical._ParticleSet([vector(i,j,k)*meter for i in range(N)
+                               for j in range(N) for k in range(N)],
+                              0.2*meter, color.blue)
+springs = []
+def index(i, j, k):
+    return (i*N + j)*N + k
+for i in range(N):
+    for j in range(N):
+        for k in range(N):
+            s = balls[index(i,j,k)]
+            for neighbor in ((i-1,j,k), (i,j-1,k), (i,j,k-1)):
+                if min(neighbor) >= 0:
+                    springs.append(physical._Helix(s, balls[index(*neighbor)], 0.02*meter,
+                                                   color.white, 2*meter, 5))
+balls.pos += vector(0.01,0.02,0.03)*meter
+print(len(balls), 'particles and', len(springs), 'springs')
+
+start = time.time()
+for b in balls:
+    b.F = vector(0,0,0)*Newton
+for h in springs:
+    dr = h.pos2.pos - h.pos1.pos
+    dist = abs(dr)
+    F = kspring*(dist - L)*dr/dist
+    h.pos2.F -= F
+    h.pos1.F += F
+print(time.time() - start, 's for the spring forces with a loop over the helices')
+
+start = time.time()
+network = SpringNetwork(springs, kspring, rest_length=L)
+print(time.time() - start, 's to create the SpringNetwork')
+
+steps = 100
+start = time.time()
+for step in range(steps):
+    balls.F = network.forces(balls)
+print((time.time() - start)/steps, 's for the spring forces with a SpringNetwork')
@@ -94,3 +94,58 @@ except:
     b = -.5''',
        '{module}.scalar div')
 
+
+timing('a=a+b',
+       '''try:
+    from {module} import vector, meter
+    a = vector(0,0,0)*meter
+    b = vector(0,0,0.001)*meter
+except:
+    from {module} import vector
+    a = vector(0,0,0)
+    b = vector(0,0,0.001)''',
+       '{module}.vector addition with units')
+
+timing('c=a*s',
+       '''try:
+    from {module} import vector, second
+    a = vector(1,2,0)*second
+    s = 1.1/second
+except:
+    from {module} import vector
+    a = vector(1,2,0)
+    s = 1.1''',
+       '{module}.vector scalar multiplication with units')
+
+timing('c = t < tmax',
+       '''try:
+    from {module} import second
+    t = 1.5*second
+    tmax = 10*second
+except:
+    t = 1.5
+    tmax = 10''',
+       '{module}.scalar comparison')
+
+timing('c = t > 0',
+       '''try:
+    from {module} import second
+    t = 1.5*second
+except:
+    t = 1.5''',
+       '{module}.scalar comparison with zero')
+
+timing('c = sin(x)',
+       'from {module} import sin; x = 0.5',
+       '{module}.sin of float')
+
+timing('c = atan2(y, x)',
+       '''try:
+    from {module} import atan2, meter
+    y = 0.5*meter
+    x = 2*meter
+except:
+    from {module} import atan2
+    y = 0.5
+    x = 2''',
+       '{module}.atan2 with units')
@@ -4,6 +4,7 @@ from __future__ import division, print_function
 
 import time
 from physical import *
+from physical.springs import SpringNetwork
 
 N = 2
 kspring = 10*Newton/meter
@@ -36,6 +37,8 @@ for i in range(N):
 
 camera_range(2*N*meter)
 
+network = SpringNetwork(springs, kspring, rest_length=L)
+
 all_balls[0].pos += vector(0.01,0.02,0.03)*meter
 all_balls[1].pos -= vector(0.01,0.02,0.03)*meter
 
@@ -53,12 +56,8 @@ while t < 10.0*second:
                 F = 0.1*L**5*dr/dist**6*Newton
                 b2.F += F
                 b.F -= F
-    for h in springs:
-        dr = h.pos2.pos - h.pos1.pos
-        dist = abs(dr)
-        F = kspring*(dist - L)*dr/dist
-        h.pos2.F -= F
-        h.pos1.F += F
+    for b, F in zip(network.objects, network.forces()):
+        b.F += F
     for b in all_balls:
         b.pos += b.v*dt
         b.v += b.F*dt/mass
@@ -23,12 +23,13 @@ messages and assignment semantics.
 
 from __future__ import division, print_function
 
-__all__ = ('vector',
+__all__ = ('vector', 'VectorArray', 'QuantityArray',
            'color', 'display',
            'check_units', 'dimensionless',
+           'mutable_vectors', 'fuse',
            'sqrt', 'exp', 'sin', 'cos', 'tan', 'atan2',
            'pi',
-           'sphere', 'helix', 'cylinder', 'box',
+           'sphere', 'particles', 'helix', 'cylinder', 'box',
            'trail',
            'plot', 'hline',
            'timestep', 'savepng',
@@ -48,7 +49,7 @@ try:
 except:
     print('Using math instead of numpy, things may break')
     import math as numpy
-import os, sys, math, atexit, time
+import os, sys, math, atexit, time, inspect
 import functools
 
 import physical.color
@@ -56,12 +57,74 @@ import physical.color
 def is_vector(v):
     if type(v) == Units:
         v = v.value
-    return type(v) == vector
+    return type(v) == vector or type(v) == VectorArray
 def is_scalar(s):
     return not is_vector(s)
+# The dimensions of a quantity are stored as a single integer code,
+# with the exponents of meter, kg and second packed into fields of
+# _UNIT_BITS bits each.  Exponents are stored as multiples of
+# 1/_UNIT_DENOMINATOR, so that the results of sqrt and other
+# fractional powers can be represented.  Because the packing is
+# linear, multiplying two quantities adds their codes, dividing
+# subtracts them, raising to an integer power multiplies the code,
+# and comparing dimensions is a single integer comparison.
+_UNIT_BITS = 16
+_UNIT_DENOMINATOR = 12
+_UNIT_MASK = (1 << _UNIT_BITS) - 1
+_UNIT_HALF = 1 << (_UNIT_BITS - 1)
+
+def _encode_units(m, kg, s):
+    code = 0
+    for i, e in enumerate((m, kg, s)):
+        n = int(round(e*_UNIT_DENOMINATOR))
+        if abs(n - e*_UNIT_DENOMINATOR) > 1e-9 or abs(n) >= _UNIT_HALF:
+            raise Exception('cannot represent dimensions meter**({})*kg**({})*second**({}), '
+                            'since the powers of units must be multiples of 1/{}'
+                            .format(m, kg, s, _UNIT_DENOMINATOR))
+        code += n << (_UNIT_BITS*i)
+    return code
+
+_decoded_units = {}
+def _decode_units(code):
+    '''Return the (m, kg, s) exponents of a unit code.
+
+    Decoding is only needed to display units, so the results are
+    cached rather than computed on every operation.
+
+    '''
+    try:
+        return _decoded_units[code]
+    except KeyError:
+        pass
+    c = code
+    mks = []
+    for i in range(3):
+        n = ((c + _UNIT_HALF) & _UNIT_MASK) - _UNIT_HALF
+        c = (c - n) >> _UNIT_BITS
+        if n % _UNIT_DENOMINATOR == 0:
+            mks.append(n // _UNIT_DENOMINATOR)
+        else:
+            mks.append(n/_UNIT_DENOMINATOR)
+    _decoded_units[code] = tuple(mks)
+    return _decoded_units[code]
+
+def _as_units(mks):
+    '''Accept dimensions either as a unit code or as an (m, kg, s) triple.'''
+    if type(mks) == tuple:
+        return _encode_units(*mks)
+    return mks
+
+def _pow_units(code, b):
+    if type(b) == int:
+        return code*b
+    if b == int(b):
+        return code*int(b)
+    return _encode_units(*[e*b for e in _decode_units(code)])
+
 class Units(object):
+    __slots__ = ('_mks',)
     def __init__(self, m, kg, s):
-        self._mks = (m,kg,s)
+        self._mks = _encode_units(m, kg, s)
     def _add(self, b):
         if self._mks != units(b):
             raise Exception('you cannot add quantities with differing units: {} + {}'.format(self,b))
@@ -71,26 +134,19 @@ class Units(object):
             raise Exception('you cannot subtract quantities with differing units: {} + {}'.format(self,b))
         return self._mks
     def _mul(self, b):
-        a = self._mks
-        b = units(b)
-        return (a[0]+b[0], a[1]+b[1], a[2]+b[2])
+        return self._mks + units(b)
     def _div(self, b):
-        a = self._mks
-        b = units(b)
-        return (a[0]-b[0], a[1]-b[1], a[2]-b[2])
+        return self._mks - units(b)
     def _rdiv(self, b):
-        a = self._mks
-        b = units(b)
-        return (b[0]-a[0], b[1]-a[1], b[2]-a[2])
+        return units(b) - self._mks
     def _pow(self, b):
-        if units(b) != (0,0,0):
+        if units(b) != 0:
             raise Exception('you cannot take quantity to a power with dimensions %s' % Units.__repr__(b))
-        a = self._mks
-        return (a[0]*b, a[1]*b, a[2]*b)
+        return _pow_units(self._mks, b)
     def _eq(self, b):
         return self._mks == b._mks
     def _repr(self):
-        (m,kg,s) =self._mks
+        (m,kg,s) = _decode_units(self._mks)
         r = []
         if m == 1:
             r.append('meter')
@@ -107,11 +163,126 @@ class Units(object):
         return '*'.join(r)
 
 def units(v):
-    return getattr(v, '_mks', (0,0,0))
+    return getattr(v, '_mks', 0)
 def value(v):
     return getattr(v, 'v', v)
 def position(v):
     return getattr(v, 'pos', v)
+# mutable_vectors() installs these in-place operators on vector and
+# scalar.  A vector or scalar that is being updated has _unshared_refs
+# references when nothing but the variable (or attribute) being
+# updated refers to it; otherwise we fall back to creating a new one.
+_unshared_refs = 0
+
+class _RefcountProbe(object):
+    def __iadd__(self, b):
+        self.refs = sys.getrefcount(self)
+        return self
+
+def _vector_iadd(self, b):
+    if type(b) != vector or sys.getrefcount(self) > _unshared_refs:
+        return self + b
+    if self._mks != b._mks:
+        raise Exception('dimensions do not match in vector addition: %s vs %s'
+                        % (self, b))
+    self._x += b._x
+    self._y += b._y
+    self._z += b._z
+    return self
+def _vector_isub(self, b):
+    if type(b) != vector or sys.getrefcount(self) > _unshared_refs:
+        return self - b
+    if self._mks != b._mks:
+        raise Exception('dimensions do not match in vector subtraction: %s vs %s'
+                        % (self, b))
+    self._x -= b._x
+    self._y -= b._y
+    self._z -= b._z
+    return self
+def _vector_imul(self, b):
+    if type(b) not in _number_types and type(b) != scalar or \
+       sys.getrefcount(self) > _unshared_refs:
+        return self*b
+    s = getattr(b,'v',b)
+    self._mks += getattr(b, '_mks', 0)
+    self._x *= s
+    self._y *= s
+    self._z *= s
+    return self
+def _vector_itruediv(self, b):
+    if type(b) not in _number_types and type(b) != scalar or \
+       sys.getrefcount(self) > _unshared_refs:
+        return self/b
+    s = getattr(b,'v',b)
+    self._mks -= getattr(b, '_mks', 0)
+    self._x /= s
+    self._y /= s
+    self._z /= s
+    return self
+def _scalar_iadd(self, b):
+    if type(b) != scalar or sys.getrefcount(self) > _unshared_refs:
+        return self + b
+    Units._add(self, b)
+    self.v += b.v
+    return self
+def _scalar_isub(self, b):
+    if type(b) != scalar or sys.getrefcount(self) > _unshared_refs:
+        return self - b
+    Units._sub(self, b)
+    self.v -= b.v
+    return self
+
+def mutable_vectors(enabled=True):
+    """Choose whether `+=`, `-=`, `*=` and `/=` may update vectors and
+    scalars in place.
+
+    Args:
+        enabled: if True, `a += b` changes the vector `a` in place
+            rather than creating a new vector, which saves time and
+            memory in loops such as `ball.pos += ball.v*dt`.
+    Raises:
+        Exception: this version of python cannot tell whether a vector
+            is shared
+
+    Units are checked exactly as before.  The danger in updating a
+    vector in place is that some other name may refer to the same
+    vector, and would see it change.  To prevent this, a vector is
+    only updated in place when nothing else refers to it; otherwise
+    a new vector is created just as usual.  So in
+
+    .. testcode :: mutable_vectors
+
+        mutable_vectors()
+        a = vector(1,0,0)*meter
+        b = a
+        a += vector(0,1,0)*meter
+        mutable_vectors(False)
+
+    `b` still holds its old value.  Note that `sphere` and the other
+    objects copy the vectors they are given, so updating `s.pos` in
+    place never changes the vector that was passed to `sphere`.
+    """
+    global _unshared_refs
+    if enabled and not hasattr(sys, 'getrefcount'):
+        raise Exception('mutable vectors require sys.getrefcount')
+    operators = [(vector, '__iadd__', _vector_iadd),
+                 (vector, '__isub__', _vector_isub),
+                 (vector, '__imul__', _vector_imul),
+                 (vector, '__itruediv__', _vector_itruediv),
+                 (vector, '__idiv__', _vector_itruediv),
+                 (scalar, '__iadd__', _scalar_iadd),
+                 (scalar, '__isub__', _scalar_isub)]
+    if enabled:
+        probe = _RefcountProbe()
+        probe += 0
+        _unshared_refs = probe.refs
+        for cls, name, method in operators:
+            setattr(cls, name, method)
+    else:
+        for cls, name, method in operators:
+            if name in cls.__dict__:
+                delattr(cls, name)
+
 def check_units(err, *vals):
     """Verifies that the arguments have the same units.
 
@@ -123,14 +294,14 @@ def check_units(err, *vals):
     # values of zero do not need units
     def is_not_boring(v):
         return not ((not hasattr(v, '_mks') and v == 0)
-                    or (type(v) == vector and v._mks == (0,0,0) and
+                    or (type(v) == vector and v._mks == 0 and
                         v.x == 0 and v.y == 0 and v.z == 0))
-    vals = list(filter(is_not_boring, vals))
-    if len(vals) >= 2:
-        mks = units(vals[0])
-        for v in vals[1:]:
+    checked = list(filter(is_not_boring, vals))
+    if len(checked) >= 2:
+        mks = units(checked[0])
+        for v in checked[1:]:
             if units(v) != mks:
-                raise Exception(err + ': %s vs %s' % (v, vals[0]))
+                raise Exception(err + ': %s vs %s' % (v, checked[0]))
     return True
 
 def check_units_pair(err, a, b):
@@ -144,7 +315,7 @@ def check_units_pair(err, a, b):
     # values of zero do not need units
     def is_boring(v):
         return ((not hasattr(v, '_mks') and v == 0)
-                or (type(v) == vector and v._mks == (0,0,0) and
+                or (type(v) == vector and v._mks == 0 and
                     v._x == 0 and v._y == 0 and v._z == 0))
     if is_boring(a) or is_boring(b):
         return True
@@ -163,7 +334,7 @@ def check_units_pair_vectors(err, a, b):
     # values of zero do not need units
     if type(b) != vector:
         raise Exception('need vector')
-    if (a._mks == (0,0,0) and a._x == 0 and a._y == 0 and a._z == 0) or (b._mks == (0,0,0) and b._x == 0 and b._y == 0 and b._z == 0):
+    if (a._mks == 0 and a._x == 0 and a._y == 0 and a._z == 0) or (b._mks == 0 and b._x == 0 and b._y == 0 and b._z == 0):
         return True
     if a._mks != b._mks:
         raise Exception(err + ': %s vs %s' % (v, vals[0]))
@@ -171,19 +342,87 @@ def check_units_pair_vectors(err, a, b):
 
 def __is_not_boring(v):
     return not ((not hasattr(v, '_mks') and v == 0)
-                or (type(v) == vector and v._mks == (0,0,0) and
+                or (type(v) == vector and v._mks == 0 and
                     v.x == 0 and v.y == 0 and v.z == 0)
                 or type(v) == type(None))
+
+def _check_matching_units(err, vals):
+    vals = list(filter(__is_not_boring, vals))
+    if len(vals) >= 2:
+        mks = units(vals[0])
+        for v in vals[1:]:
+            if units(v) != mks:
+                raise Exception(err + ': %s vs %s' % (v, vals[0]))
+
+def _check_dimensionless(err, vals):
+    for v in vals:
+        if units(v) != 0:
+            raise Exception(err + ': %s' % v)
+
+# Plain numbers have no units, so they can be passed straight through.
+_plain_numbers = frozenset([float, int, bool, type(2**64),
+                            getattr(numpy, 'float64', float)])
+
+def _units_expression(name):
+    return "(0 if _type(%s) in _plain else _getattr(%s, '_mks', 0))" \
+        % (name, name)
+
+# The names by which a compiled wrapper refers to the function it wraps
+# and to its helpers, which must not be the names of its arguments.
+_specialise_names = frozenset(['_func', '_err', '_check', '_type', '_getattr', '_plain'])
+
+def _positional_arguments(func):
+    """The names of the arguments of func, if it takes a fixed number
+    of positional arguments with no defaults, and None otherwise."""
+    code = getattr(func, '__code__', None)
+    if code is None or func.__defaults__ or code.co_flags & 0x0C \
+       or getattr(code, 'co_kwonlyargcount', 0):
+        return None
+    names = code.co_varnames[:code.co_argcount]
+    if _specialise_names.intersection(names):
+        return None
+    return names
+
+def _specialise(func, err, fast, check):
+    """Compile a wrapper for func that takes exactly the same
+    arguments, so that no lists need to be built on each call.  If
+    the expression `fast` is true the arguments are passed straight
+    through; otherwise they are given as a tuple to the function
+    `check`, which raises an exception if their units are wrong."""
+    names = _positional_arguments(func)
+    if names is None:
+        return None
+    arguments = ', '.join(names)
+    values = '(%s)' % ''.join(n + ', ' for n in names)
+    # The helpers are passed in rather than looked up as globals, so
+    # that the wrapper works whatever the arguments are called.
+    source = '\n'.join([
+        'def specialise(_func, _err, _check, _type, _getattr, _plain):',
+        '    def checked(%s):' % arguments,
+        '        if %s:' % fast(names),
+        '            return _func(%s)' % arguments,
+        '        _check(_err, %s)' % values,
+        '        return _func(%s)' % arguments,
+        '    return checked',
+        ''])
+    namespace = {}
+    exec(compile(source, '<%s checker>' % func.__name__, 'exec'), namespace)
+    return functools.wraps(func)(namespace['specialise'](func, err, check, type,
+                                                         getattr, _plain_numbers))
+
 def units_match(err):
+    def match_fast(names):
+        if len(names) < 2:
+            return 'True'
+        return ' == '.join(map(_units_expression, names))
     def decorator(func):
+        specialised = _specialise(func, err, match_fast, _check_matching_units)
+        if specialised is not None:
+            return specialised
         @functools.wraps(func)
         def unit_checking(*args, **kwargs):
-            vals = list(filter(__is_not_boring, list(args) + list(kwargs.values())))
-            if len(vals) >= 2:
-                mks = units(vals[0])
-                for v in vals[1:]:
-                    if units(v) != mks:
-                        raise Exception(err + ': %s vs %s' % (v, vals[0]))
+            allvals = args + tuple(kwargs.values()) if kwargs else args
+            _check_matching_units(err, allvals)
             return func(*args, **kwargs)
         return unit_checking
     return decorator
@@ -210,12 +449,18 @@ def dimensionless(err):
           ...
         Exception: arguments to myfunction should be dimensionless: 4 meter
     '''
+    def dimensionless_fast(names):
+        if not names:
+            return 'True'
+        return ' == '.join(map(_units_expression, names)) + ' == 0'
     def decorator(func):
+        specialised = _specialise(func, err, dimensionless_fast, _check_dimensionless)
+        if specialised is not None:
+            return specialised
         @functools.wraps(func)
         def is_dimensionless(*args, **kwargs):
-            for v in list(args) + list(kwargs.values()):
-                if units(v) != (0,0,0):
-                    raise Exception(err + ': %s' % v)
+            allvals = args + tuple(kwargs.values()) if kwargs else args
+            _check_dimensionless(err, allvals)
             return func(*args, **kwargs)
         return is_dimensionless
     return decorator
@@ -223,15 +468,19 @@ def dimensionless(err):
 class scalar(Units):
     '''A scalar value with units attached.
     '''
-    def __init__(self,v, mks=(0,0,0)):
+    __slots__ = ('v',)
+    def __init__(self,v, mks=0):
         """Construct a new 'scalar' object.
 
         Args:
            v: The value of the object, usually a float or an int
-           mks: A triple containing the units in terms of meters, kg, and seconds
+           mks: The units, either as a triple containing the powers of
+               meters, kg, and seconds, or as a packed unit code
         Returns:
            returns nothing
         """
+        if type(mks) == tuple:
+            mks = _encode_units(*mks)
         self._mks = mks
         self.v = v
     def __abs__(self):
@@ -239,25 +488,49 @@ class scalar(Units):
     def __neg__(self):
         return scalar(-self.v, self._mks)
     def __add__(self, b):
+        try:
+            handler = _add[type(self), type(b)]
+        except KeyError:
+            handler = scalar.__add
+        return handler(self, b)
+    def __add(self, b):
         mks = Units._add(self, b)
         return scalar(self.v + value(b), mks)
     def __sub__(self, b):
+        try:
+            handler = _subtract[type(self), type(b)]
+        except KeyError:
+            handler = scalar.__sub
+        return handler(self, b)
+    def __sub(self, b):
         mks = Units._sub(self, b)
         return scalar(self.v - value(b), mks)
     def __pow__(self, b):
-        if units(b) != (0,0,0):
+        '''Raise a scalar to a dimensionless power.
+
+        The powers of the units must be multiples of 1/12, which
+        allows square and cube roots (and their products), so that
+        `meter**0.5` is fine but `meter**0.3` raises an exception.  A
+        dimensionless scalar may be raised to any power.
+        '''
+        if units(b) != 0:
             raise Exception('you cannot take quantity to a power with dimensions %s' % Units.__repr__(b))
         a = self._mks
-        return scalar(self.v **value(b), (a[0]*b, a[1]*b, a[2]*b))
+        return scalar(self.v **value(b), _pow_units(a, b))
     def __mul__(self, b):
-        smks = self._mks; bmks = getattr(b, '_mks', (0,0,0))
-        mks = (smks[0]+bmks[0], smks[1]+bmks[1], smks[2]+bmks[2])
-        if type(b) == vector:
+        try:
+            handler = _multiply[type(self), type(b)]
+        except KeyError:
+            handler = scalar.__mul
+        return handler(self, b)
+    def __mul(self, b):
+        smks = self._mks; bmks = getattr(b, '_mks', 0)
+        mks = smks + bmks
+        if is_vector(b):
             return b*self
-        else:
-            if mks == (0,0,0):
-                return self.v*getattr(b,'v',b)
-            return scalar(self.v*getattr(b,'v',b), mks)
+        if mks == 0:
+            return self.v*getattr(b,'v',b)
+        return scalar(self.v*getattr(b,'v',b), mks)
     def __rmul__(self, b):
         '''We assume here than any object with units (or that is a vector)
         will implement __mul__, so __rmul__ will only be invoked with
@@ -268,13 +541,16 @@ class scalar(Units):
     def __div__(self,b):
         return self.__truediv__(b)
     def __truediv__(self, b):
+        try:
+            handler = _divide[type(self), type(b)]
+        except KeyError:
+            handler = scalar.__truediv
+        return handler(self, b)
+    def __truediv(self, b):
         mks = Units._div(self, b)
-        if type(b) == vector:
-            raise Exception('cannot divide scalar by vector')
-        else:
-            if mks == (0,0,0):
-                return self.v/value(b)
-            return scalar(self.v/value(b), mks)
+        if mks == 0:
+            return self.v/value(b)
+        return scalar(self.v/value(b), mks)
     def __rdiv__(self,b):
         return self.__rtruediv__(b)
     def __rtruediv__(self, b):
@@ -301,6 +577,189 @@ class scalar(Units):
     def __repr__(self):
         return '%s %s' % (self.v, Units._repr(self))
 
+def _is_boring_number(v):
+    '''A plain number equal to zero, which needs no units.'''
+    return not hasattr(v, '_mks') and not hasattr(v, 'shape') and v == 0
+
+def _is_boring_vector(v):
+    '''A dimensionless vector or VectorArray of zeros, which needs no units.'''
+    if type(v) == vector:
+        return v._mks == 0 and v._x == 0 and v._y == 0 and v._z == 0
+    return type(v) == VectorArray and v._mks == 0 and not v._data.any()
+
+class QuantityArray(Units):
+    '''An array of scalar values that all share the same units.
+
+    A QuantityArray is the array companion of a scalar: it holds a
+    numpy array of numbers in `v` together with a single set of
+    units.  The units are checked once per operation, after which the
+    arithmetic is done with a single numpy operation.  Comparisons
+    return arrays of booleans, which may be used to select elements.
+
+    .. doctest :: quantityarray
+
+        >>> d = QuantityArray([1, 2, 3])*meter
+        >>> d.sum()
+        6 meter
+        >>> d[d > 1.5*meter]
+        [2 3] meter
+        >>> d > 1.5*second
+        Traceback (most recent call last):
+          ...
+        Exception: can only compare values with same dimensions: 1.5 second vs [1 2 3] meter
+    '''
+    __slots__ = ('v',)
+    # Make numpy hand binary operators with a QuantityArray back to
+    # us, rather than trying to treat us as an array of objects.
+    __array_ufunc__ = None
+
+    def __new(self, v, mks):
+        ''' A faster version of __init__ that does no checking. '''
+        if mks == 0:
+            return v
+        q = QuantityArray.__new__(QuantityArray)
+        q._mks = mks
+        q.v = v
+        return q
+    def __init__(self, values, mks=0):
+        """Construct a new 'QuantityArray' object.
+
+        Args:
+           values: a list of scalars, a QuantityArray, or an array of numbers
+           mks: A triple containing the powers of meters, kg, and
+               seconds (or a packed unit code), used when values are
+               plain numbers
+        Raises:
+           Exception: the values do not all have the same dimensions
+        """
+        if not hasattr(numpy, 'ndarray'):
+            raise Exception('QuantityArray requires numpy')
+        if type(values) == QuantityArray:
+            self._mks = values._mks
+            self.v = values.v.copy()
+            return
+        mks = _as_units(mks)
+        if hasattr(values, 'shape'):
+            self._mks = mks
+            self.v = numpy.asarray(values)
+            return
+        values = list(values)
+        self._mks = mks
+        for x in values:
+            if units(x) != 0:
+                self._mks = units(x)
+                break
+        for x in values:
+            if units(x) != self._mks and not _is_boring_number(x):
+                raise Exception('values in a QuantityArray must have same dimensions: %s vs %s'
+                                % (x, Units._repr(self)))
+        self.v = numpy.array([value(x) for x in values])
+    def scalars(self):
+        '''Return a list containing each of the values as a scalar.
+        '''
+        mks = self._mks
+        return [scalar(x, mks) for x in self.v.tolist()]
+    def __len__(self):
+        return len(self.v)
+    def __iter__(self):
+        return iter(self.scalars())
+    def __getitem__(self, i):
+        v = self.v[i]
+        if getattr(v, 'ndim', 0) == 0:
+            return scalar(v.item(), self._mks)
+        return self.__new(v, self._mks)
+    def __setitem__(self, i, x):
+        if units(x) != self._mks and not _is_boring_number(x):
+            raise Exception('value must have dimensions of array: %s vs %s'
+                            % (x, Units._repr(self)))
+        self.v[i] = value(x)
+    @property
+    def shape(self):
+        return self.v.shape
+
+    def sum(self):
+        '''The sum of all the values.'''
+        return scalar(self.v.sum().item(), self._mks)
+    def mean(self):
+        '''The average of all the values.'''
+        return scalar(self.v.mean().item(), self._mks)
+    def min(self):
+        '''The smallest of the values.'''
+        return scalar(self.v.min().item(), self._mks)
+    def max(self):
+        '''The largest of the values.'''
+        return scalar(self.v.max().item(), self._mks)
+
+    def __abs__(self):
+        return self.__new(abs(self.v), self._mks)
+    def __neg__(self):
+        return self.__new(-self.v, self._mks)
+    def __add__(self, b):
+        if type(b) == _Lazy:
+            return NotImplemented # let fuse trace the expression
+        mks = Units._add(self, b)
+        return self.__new(self.v + value(b), mks)
+    def __sub__(self, b):
+        if type(b) == _Lazy:
+            return NotImplemented
+        mks = Units._sub(self, b)
+        return self.__new(self.v - value(b), mks)
+    def __pow__(self, b):
+        '''Raise each element to a dimensionless power, which like the
+        power of a scalar must make the powers of the units multiples
+        of 1/12.'''
+        if units(b) != 0:
+            raise Exception('you cannot take quantity to a power with dimensions %s' % Units.__repr__(b))
+        a = self._mks
+        return self.__new(self.v**value(b), _pow_units(a, b))
+    def __mul__(self, b):
+        if type(b) == _Lazy:
+            return NotImplemented
+        if type(b) == vector or type(b) == VectorArray:
+            return b*self
+        smks = self._mks; bmks = getattr(b, '_mks', 0)
+        mks = smks + bmks
+        return self.__new(self.v*value(b), mks)
+    def __rmul__(self, b):
+        return self.__new(self.v*b, self._mks)
+    def __div__(self,b):
+        return self.__truediv__(b)
+    def __truediv__(self, b):
+        if type(b) == _Lazy:
+            return NotImplemented
+        if type(b) == vector or type(b) == VectorArray:
+            raise Exception('cannot divide scalar by vector')
+        mks = Units._div(self, b)
+        return self.__new(self.v/value(b), mks)
+    def __rdiv__(self,b):
+        return self.__rtruediv__(b)
+    def __rtruediv__(self, b):
+        mks = Units._rdiv(self, b)
+        return self.__new(value(b)/self.v, mks)
+
+    def __check_comparable(self, b):
+        if units(b) != self._mks and not _is_boring_number(b):
+            raise Exception('can only compare values with same dimensions: %s vs %s'
+                            % (b, self))
+        return value(b)
+    def __eq__(self, b):
+        return self.v == self.__check_comparable(b)
+    def __ne__(self, b):
+        return self.v != self.__check_comparable(b)
+    def __lt__(self, b):
+        return self.v < self.__check_comparable(b)
+    def __gt__(self, b):
+        return self.v > self.__check_comparable(b)
+    def __ge__(self, b):
+        return self.v >= self.__check_comparable(b)
+    def __le__(self, b):
+        return self.v <= self.__check_comparable(b)
+    __hash__ = None
+    def __repr__(self):
+        return '%s %s' % (self.v, Units._repr(self))
+    def copy(self):
+        return self.__new(self.v.copy(), self._mks)
+
 def sqrt(v):
     r'''Compute :math:`\sqrt{x}`.
 
@@ -411,6 +870,7 @@ def atan2(y,x):
     return numpy.arctan2(value(y),value(x))
 
 class vector(Units):
+    __slots__ = ('_x', '_y', '_z')
     def __new(self,x,y,z,mks):
         ''' A faster version of __init__ that does zero checking. '''
         v = vector.__new__(vector)
@@ -419,12 +879,13 @@ class vector(Units):
         v._y = y
         v._z = z
         return v
-    def __init__(self,x,y,z, mks=(0,0,0)):
+    def __init__(self,x,y,z, mks=0):
         ux = units(x)
         if ux != units(y) or ux != units(z):
             raise Exception('vector components must have same dimensions')
+        mks = _as_units(mks)
         self._mks = mks
-        if mks == (0,0,0):
+        if mks == 0:
             if units(x) != mks:
                 self._mks = units(x)
             elif units(y) != mks:
@@ -439,6 +900,8 @@ class vector(Units):
         return scalar(self._x, self._mks)
     @x.setter
     def x(self,v):
+        if _particle_vectors and id(self) in _particle_vectors:
+            _refuse_component(self, 'x')
         if self._mks != units(v):
             raise Exception('x component must have dimensions of vector: %s vs %s'
                             % (self, v))
@@ -449,6 +912,8 @@ class vector(Units):
         return scalar(self._y, self._mks)
     @y.setter
     def y(self,v):
+        if _particle_vectors and id(self) in _particle_vectors:
+            _refuse_component(self, 'y')
         if self._mks != units(v):
             raise Exception('y component must have dimensions of vector: %s vs %s'
                             % (self, v))
@@ -459,24 +924,30 @@ class vector(Units):
         return scalar(self._z, self._mks)
     @z.setter
     def z(self,v):
+        if _particle_vectors and id(self) in _particle_vectors:
+            _refuse_component(self, 'z')
         if self._mks != units(v):
             raise Exception('z component must have dimensions of vector: %s vs %s'
                             % (self, v))
         self._z = value(v)
     def cross(self,b):
+        if type(b) == _Lazy:
+            return _lazy(self).cross(b)
         if type(b) != vector:
             raise Exception('cannot take cross product of vector with %s' % type(b))
         sx = self._x; sy = self._y; sz = self._z
         bx = b._x; by = b._y; bz = b._z
         smks = self._mks; bmks = b._mks
         return self.__new(sy*bz - sz*by, sz*bx - sx*bz, sx*by - sy*bx,
-                          (smks[0]+bmks[0], smks[1]+bmks[1], smks[2]+bmks[2]))
+                          smks + bmks)
     def dot(self,b):
+        if type(b) == _Lazy:
+            return _lazy(self).dot(b)
         if type(b) != vector:
             raise Exception('cannot take dot product of vector with %s' % type(b))
         smks = self._mks; bmks = b._mks
         return scalar(self._x*b._x + self._y*b._y + self._z*b._z,
-                      (smks[0]+bmks[0], smks[1]+bmks[1], smks[2]+bmks[2]))
+                      smks + bmks)
     def abs(self):
         return abs(self)
     def __abs__(self):
@@ -487,24 +958,36 @@ class vector(Units):
     def __neg__(self):
         return self.__new(-self._x, -self._y, -self._z, self._mks)
     def __add__(self, b):
+        try:
+            handler = _add[type(self), type(b)]
+        except KeyError:
+            handler = vector.__add
+        return handler(self, b)
+    def __add(self, b):
         if type(b) != vector:
             raise Exception('cannot add vector to %s' % type(b))
-        if self._mks != b._mks:
-            raise Exception('dimensions do not match in vector addition: %s vs %s'
-                            % (self, b))
-        return self.__new(self._x+b._x, self._y + b._y, self._z + b._z, self._mks)
+        return _add_vectors(self, b)
     def __sub__(self, b):
+        try:
+            handler = _subtract[type(self), type(b)]
+        except KeyError:
+            handler = vector.__sub
+        return handler(self, b)
+    def __sub(self, b):
         if type(b) != vector:
             raise Exception('cannot subtract %s from vector' % type(b))
-        if self._mks != b._mks:
-            raise Exception('dimensions do not match in vector subtraction: %s vs %s'
-                            % (self, b))
-        return self.__new(self._x-b._x, self._y - b._y, self._z - b._z, self._mks)
+        return _sub_vectors(self, b)
     def __mul__(self, b):
+        try:
+            handler = _multiply[type(self), type(b)]
+        except KeyError:
+            handler = vector.__mul
+        return handler(self, b)
+    def __mul(self, b):
         if not is_scalar(b):
             raise Exception('can only multipy vectors with scalars')
-        smks = self._mks; bmks = getattr(b, '_mks', (0,0,0))
-        mks = (smks[0]+bmks[0], smks[1]+bmks[1], smks[2]+bmks[2])
+        smks = self._mks; bmks = getattr(b, '_mks', 0)
+        mks = smks + bmks
         s = getattr(b,'v',b)
         return self.__new(s*self._x, s*self._y, s*self._z, mks)
     def __rmul__(self, s):
@@ -517,10 +1000,16 @@ class vector(Units):
     def __div__(self,b):
         return self.__truediv__(b)
     def __truediv__(self, b):
+        try:
+            handler = _divide[type(self), type(b)]
+        except KeyError:
+            handler = vector.__truediv
+        return handler(self, b)
+    def __truediv(self, b):
         if not is_scalar(b):
             raise Exception('can only divide vectors by scalars')
-        smks = self._mks; bmks = getattr(b, '_mks', (0,0,0))
-        mks = (smks[0]-bmks[0], smks[1]-bmks[1], smks[2]-bmks[2])
+        smks = self._mks; bmks = getattr(b, '_mks', 0)
+        mks = smks - bmks
         s = getattr(b,'v',b)
         return self.__new(self._x/s, self._y/s, self._z/s, mks)
     def __eq__(self,b):
@@ -530,25 +1019,843 @@ class vector(Units):
     def copy(self):
         return self.__new(self._x, self._y, self._z, self._mks)
 
-meter = scalar(1, (1, 0, 0))
-kg = scalar(1, (0, 1, 0))
-second = scalar(1, (0, 0, 1))
+def _make_vector(x, y, z, mks):
+    ''' Construct a vector without any checking. '''
+    v = vector.__new__(vector)
+    v._mks = mks
+    v._x = x
+    v._y = y
+    v._z = z
+    return v
+
+def _per_row(s):
+    '''Reshape an array of N values so that it multiplies the N rows of
+    an N x 3 array rather than its 3 columns.
+
+    '''
+    if getattr(s, 'ndim', 0) == 1:
+        return s[:, numpy.newaxis]
+    return s
+
+class VectorArray(Units):
+    '''An array of vectors that all share the same units.
+
+    A VectorArray stores N vectors as a single N x 3 numpy array,
+    together with a single set of units.  Arithmetic on a VectorArray
+    checks the units once for the whole array, and then does the
+    arithmetic with a single numpy operation, which is much faster
+    than looping over a list of `vector` objects.
+
+    .. doctest :: vectorarray
+
+        >>> r = VectorArray([vector(1,0,0), vector(0,2,0)])*meter
+        >>> r[1]
+        <0.0,2.0,0.0> meter
+        >>> len(r + vector(0,0,1)*meter)
+        2
+        >>> r + vector(0,0,1)*second
+        Traceback (most recent call last):
+          ...
+        Exception: dimensions do not match in vector addition: <0,0,1> second vs meter
+    '''
+    __slots__ = ('_data',)
+    # Make numpy hand binary operators with a VectorArray back to us,
+    # rather than trying to treat us as an array of objects.
+    __array_ufunc__ = None
+
+    def __new(self, data, mks):
+        ''' A faster version of __init__ that does no checking. '''
+        v = VectorArray.__new__(VectorArray)
+        v._mks = mks
+        v._data = data
+        return v
+    def __init__(self, vectors, mks=0):
+        """Construct a new 'VectorArray' object.
+
+        Args:
+           vectors: a list of vectors, a VectorArray, or an N x 3 array
+               of numbers
+           mks: A triple containing the powers of meters, kg, and
+               seconds (or a packed unit code), used when vectors is an
+               array of numbers
+        Raises:
+           Exception: the vectors do not all have the same dimensions
+        """
+        if not hasattr(numpy, 'ndarray'):
+            raise Exception('VectorArray requires numpy')
+        if type(vectors) == VectorArray:
+            self._mks = vectors._mks
+            self._data = vectors._data.copy()
+            return
+        mks = _as_units(mks)
+        if hasattr(vectors, 'shape'):
+            self._mks = mks
+            self._data = numpy.array(vectors, dtype=float).reshape(-1, 3)
+            return
+        vectors = list(vectors)
+        self._mks = mks
+        for v in vectors:
+            if type(v) != vector:
+                raise Exception('VectorArray must be made of vectors, not %s' % type(v))
+            if v._mks != 0:
+                self._mks = v._mks
+                break
+        for v in vectors:
+            if v._mks != self._mks and not (v._mks == 0 and
+                                            v._x == 0 and v._y == 0 and v._z == 0):
+                raise Exception('vectors in a VectorArray must have same dimensions: %s vs %s'
+                                % (v, Units._repr(self)))
+        self._data = numpy.array([(v._x, v._y, v._z) for v in vectors],
+                                 dtype=float).reshape(-1, 3)
+    def vectors(self):
+        '''Return a list containing each of the vectors in the array.
+        '''
+        mks = self._mks
+        return [_make_vector(x, y, z, mks)
+                for x, y, z in self._data.tolist()]
+    def __len__(self):
+        return len(self._data)
+    def __iter__(self):
+        return iter(self.vectors())
+    def __getitem__(self, i):
+        d = self._data[i]
+        if d.ndim == 1:
+            return _make_vector(float(d[0]), float(d[1]), float(d[2]), self._mks)
+        return self.__new(d, self._mks)
+    def __setitem__(self, i, v):
+        # a zero vector needs no units
+        if units(v) != self._mks and not _is_boring_vector(v):
+            raise Exception('vector must have dimensions of array: %s vs %s'
+                            % (v, Units._repr(self)))
+        if type(v) == vector:
+            self._data[i] = (v._x, v._y, v._z)
+        elif type(v) == VectorArray:
+            self._data[i] = v._data
+        else:
+            raise Exception('cannot store %s in a VectorArray' % type(v))
+
+    @property
+    def x(self):
+        return QuantityArray(self._data[:, 0], self._mks)
+    @property
+    def y(self):
+        return QuantityArray(self._data[:, 1], self._mks)
+    @property
+    def z(self):
+        return QuantityArray(self._data[:, 2], self._mks)
+
+    def __other_data(self, b, operation):
+        '''Return the numbers stored in b, which must be a vector or
+        VectorArray, in a form that broadcasts against our data.
+
+        '''
+        if type(b) == VectorArray:
+            return b._data
+        if type(b) == vector:
+            return numpy.array((b._x, b._y, b._z))
+        raise Exception('cannot take %s of VectorArray with %s' % (operation, type(b)))
+    def cross(self, b):
+        d = self.__other_data(b, 'cross product')
+        smks = self._mks; bmks = b._mks
+        return self.__new(numpy.cross(self._data, d),
+                          smks + bmks)
+    def dot(self, b):
+        d = self.__other_data(b, 'dot product')
+        smks = self._mks; bmks = b._mks
+        return QuantityArray((self._data*d).sum(axis=1),
+                             smks + bmks)
+    def abs(self):
+        return abs(self)
+    def __abs__(self):
+        d = self._data
+        return QuantityArray(numpy.sqrt(numpy.einsum('ij,ij->i', d, d)), self._mks)
+    def normalized(self):
+        return self / abs(self)
+
+    def __neg__(self):
+        return self.__new(-self._data, self._mks)
+    def __add__(self, b):
+        if type(b) == _Lazy:
+            return NotImplemented # let fuse trace the expression
+        if type(b) != vector and type(b) != VectorArray:
+            raise Exception('cannot add vector to %s' % type(b))
+        if self._mks != b._mks:
+            raise Exception('dimensions do not match in vector addition: %s vs %s'
+                            % (b, Units._repr(self)))
+        return self.__new(self._data + self.__other_data(b, 'sum'), self._mks)
+    def __radd__(self, b):
+        return self + b
+    def __sub__(self, b):
+        if type(b) == _Lazy:
+            return NotImplemented
+        if type(b) != vector and type(b) != VectorArray:
+            raise Exception('cannot subtract %s from vector' % type(b))
+        if self._mks != b._mks:
+            raise Exception('dimensions do not match in vector subtraction: %s vs %s'
+                            % (b, Units._repr(self)))
+        return self.__new(self._data - self.__other_data(b, 'difference'), self._mks)
+    def __mul__(self, b):
+        if type(b) == _Lazy:
+            return NotImplemented
+        if not is_scalar(b):
+            raise Exception('can only multipy vectors with scalars')
+        smks = self._mks; bmks = getattr(b, '_mks', 0)
+        mks = smks + bmks
+        return self.__new(self._data*_per_row(getattr(b,'v',b)), mks)
+    def __rmul__(self, s):
+        '''We assume here than any object with units (or that is a vector)
+        will implement __mul__, so __rmul__ will only be invoked with
+        a scalar type as input.
+
+        '''
+        return self.__new(self._data*_per_row(s), self._mks)
+    def __div__(self,b):
+        return self.__truediv__(b)
+    def __truediv__(self, b):
+        if type(b) == _Lazy:
+            return NotImplemented
+        if not is_scalar(b):
+            raise Exception('can only divide vectors by scalars')
+        smks = self._mks; bmks = getattr(b, '_mks', 0)
+        mks = smks - bmks
+        return self.__new(self._data/_per_row(getattr(b,'v',b)), mks)
+    def __eq__(self, b):
+        '''Compare element by element, returning an array of booleans.
+        '''
+        if type(b) != vector and type(b) != VectorArray:
+            return numpy.zeros(len(self._data), dtype=bool)
+        if self._mks != b._mks:
+            return numpy.zeros(len(self._data), dtype=bool)
+        return (self._data == self.__other_data(b, 'comparison')).all(axis=1)
+    def __ne__(self, b):
+        return ~(self == b)
+    __hash__ = None
+    def __repr__(self):
+        return 'VectorArray(%s) %s' % (self._data.tolist(), Units._repr(self))
+    def copy(self):
+        return self.__new(self._data.copy(), self._mks)
+
+# Arithmetic dispatch.  The binary operators of scalar and vector look
+# up the pair (type(a), type(b)) in one of the tables below, and call
+# the handler found there, which does the unit bookkeeping and the
+# arithmetic with no further tests of type.  Pairs that are not in a
+# table fall back to the generic method, which gives the same results
+# (and error messages) more slowly.
+_number_types = set([int, float, bool, type(2**64)])
+for _t in ('float64', 'float32', 'int64', 'int32'):
+    if hasattr(numpy, _t):
+        _number_types.add(getattr(numpy, _t))
+
+def _cannot(message):
+    def handler(a, b):
+        raise Exception(message)
+    return handler
+
+def _add_scalars(a, b):
+    if a._mks != b._mks:
+        raise Exception('you cannot add quantities with differing units: {} + {}'.format(a,b))
+    return scalar(a.v + b.v, a._mks)
+def _add_scalar_number(a, b):
+    if a._mks != 0:
+        raise Exception('you cannot add quantities with differing units: {} + {}'.format(a,b))
+    return scalar(a.v + b, 0)
+def _add_vectors(a, b):
+    if a._mks != b._mks:
+        raise Exception('dimensions do not match in vector addition: %s vs %s'
+                        % (a, b))
+    v = vector.__new__(vector)
+    v._mks = a._mks
+    v._x = a._x + b._x
+    v._y = a._y + b._y
+    v._z = a._z + b._z
+    return v
+
+def _sub_scalars(a, b):
+    if a._mks != b._mks:
+        raise Exception('you cannot subtract quantities with differing units: {} + {}'.format(a,b))
+    return scalar(a.v - b.v, a._mks)
+def _sub_scalar_number(a, b):
+    if a._mks != 0:
+        raise Exception('you cannot subtract quantities with differing units: {} + {}'.format(a,b))
+    return scalar(a.v - b, 0)
+def _sub_vectors(a, b):
+    if a._mks != b._mks:
+        raise Exception('dimensions do not match in vector subtraction: %s vs %s'
+                        % (a, b))
+    v = vector.__new__(vector)
+    v._mks = a._mks
+    v._x = a._x - b._x
+    v._y = a._y - b._y
+    v._z = a._z - b._z
+    return v
+
+def _mul_scalars(a, b):
+    mks = a._mks + b._mks
+    if mks == 0:
+        return a.v*b.v
+    return scalar(a.v*b.v, mks)
+def _mul_scalar_number(a, b):
+    if a._mks == 0:
+        return a.v*b
+    return scalar(a.v*b, a._mks)
+def _mul_scalar_vector(a, b):
+    s = a.v
+    v = vector.__new__(vector)
+    v._mks = a._mks + b._mks
+    v._x = s*b._x
+    v._y = s*b._y
+    v._z = s*b._z
+    return v
+def _mul_vector_scalar(a, b):
+    s = b.v
+    v = vector.__new__(vector)
+    v._mks = a._mks + b._mks
+    v._x = s*a._x
+    v._y = s*a._y
+    v._z = s*a._z
+    return v
+def _mul_vector_number(a, b):
+    v = vector.__new__(vector)
+    v._mks = a._mks
+    v._x = b*a._x
+    v._y = b*a._y
+    v._z = b*a._z
+    return v
+def _mul_vector_quantities(a, b):
+    return VectorArray(numpy.outer(b.v, (a._x, a._y, a._z)), a._mks + b._mks)
+
+def _div_scalars(a, b):
+    mks = a._mks - b._mks
+    if mks == 0:
+        return a.v/b.v
+    return scalar(a.v/b.v, mks)
+def _div_scalar_number(a, b):
+    if a._mks == 0:
+        return a.v/b
+    return scalar(a.v/b, a._mks)
+def _div_vector_scalar(a, b):
+    s = b.v
+    v = vector.__new__(vector)
+    v._mks = a._mks - b._mks
+    v._x = a._x/s
+    v._y = a._y/s
+    v._z = a._z/s
+    return v
+def _div_vector_number(a, b):
+    v = vector.__new__(vector)
+    v._mks = a._mks
+    v._x = a._x/b
+    v._y = a._y/b
+    v._z = a._z/b
+    return v
+def _div_vector_quantities(a, b):
+    return VectorArray(numpy.outer(1/b.v, (a._x, a._y, a._z)), a._mks - b._mks)
+
+_add = {(scalar, scalar): _add_scalars,
+        (scalar, QuantityArray): lambda a, b: b + a,
+        (vector, vector): _add_vectors,
+        (vector, VectorArray): lambda a, b: b + a}
+_subtract = {(scalar, scalar): _sub_scalars,
+             (scalar, QuantityArray): lambda a, b: -(b - a),
+             (vector, vector): _sub_vectors,
+             (vector, VectorArray): lambda a, b: -(b - a)}
+_multiply = {(scalar, scalar): _mul_scalars,
+             (scalar, vector): _mul_scalar_vector,
+             (scalar, VectorArray): lambda a, b: b*a,
+             (scalar, QuantityArray): lambda a, b: b*a,
+             (vector, scalar): _mul_vector_scalar,
+             (vector, vector): _cannot('can only multipy vectors with scalars'),
+             (vector, VectorArray): _cannot('can only multipy vectors with scalars'),
+             (vector, QuantityArray): _mul_vector_quantities}
+_divide = {(scalar, scalar): _div_scalars,
+           (scalar, vector): _cannot('cannot divide scalar by vector'),
+           (scalar, VectorArray): _cannot('cannot divide scalar by vector'),
+           (scalar, QuantityArray): lambda a, b: b.__rtruediv__(a),
+           (vector, scalar): _div_vector_scalar,
+           (vector, vector): _cannot('can only divide vectors by scalars'),
+           (vector, VectorArray): _cannot('can only divide vectors by scalars'),
+           (vector, QuantityArray): _div_vector_quantities}
+for _t in _number_types:
+    _add[scalar, _t] = _add_scalar_number
+    _subtract[scalar, _t] = _sub_scalar_number
+    _multiply[scalar, _t] = _mul_scalar_number
+    _multiply[vector, _t] = _mul_vector_number
+    _divide[scalar, _t] = _div_scalar_number
+    _divide[vector, _t] = _div_vector_number
+
+# Expression fusion.  A function decorated with fuse is first called
+# with _Lazy placeholders in place of its arguments, so that its
+# operators build an expression tree as well as computing their
+# results.  The units are checked as the tree is built, and the tree
+# is then compiled into python code that works directly on the
+# components of the vectors, creating no temporary vector or scalar
+# objects.  Each placeholder also holds the value it stands for, so
+# that a function that does something we cannot trace (such as
+# comparing values) simply goes on with those values, and is still
+# only run once.
+
+# The traces being made, the innermost last, each of which is a list
+# of the things done during it that cannot be traced.
+_traces = []
+
+def _untraceable(result):
+    '''Note that the trace being made cannot be compiled, and return
+    the result of the untraceable operation.'''
+    if _traces:
+        _traces[-1].append(result)
+    return result
+
+def _concrete(v):
+    '''The value that a placeholder stands for.'''
+    return v.concrete if type(v) == _Lazy else v
+
+class _Lazy(object):
+    '''A placeholder for a vector or scalar in an expression that is
+    being traced by `fuse`, which holds its value as `concrete`.'''
+    __slots__ = ('_mks', 'is_vector', 'is_array', 'op', 'args', 'concrete')
+    def __init__(self, op, args, concrete, mks, is_vector, is_array=None):
+        self.op = op
+        self.args = args
+        self.concrete = concrete
+        self._mks = mks
+        self.is_vector = is_vector
+        if is_array is None:
+            is_array = any(type(a) == _Lazy and a.is_array for a in args)
+        self.is_array = is_array
+    def __repr__(self):
+        return repr(self.concrete)
+
+    # Each operator first computes its result as usual, which raises
+    # the usual exception if the units are wrong, so that the checks
+    # here only find the cases (such as adding a zero without units)
+    # that we do not trace.
+    def __add__(self, b):
+        b = _lazy(b)
+        c = self.concrete + b.concrete
+        if self.is_vector != b.is_vector or self._mks != b._mks:
+            return _untraceable(c)
+        return _Lazy('+', (self, b), c, self._mks, self.is_vector)
+    def __radd__(self, b):
+        return _lazy(b) + self
+    def __sub__(self, b):
+        b = _lazy(b)
+        c = self.concrete - b.concrete
+        if self.is_vector != b.is_vector or self._mks != b._mks:
+            return _untraceable(c)
+        return _Lazy('-', (self, b), c, self._mks, self.is_vector)
+    def __rsub__(self, b):
+        return _lazy(b) - self
+    def __mul__(self, b):
+        b = _lazy(b)
+        c = self.concrete*b.concrete
+        if self.is_vector and b.is_vector:
+            return _untraceable(c)
+        return _Lazy('*', (self, b), c, self._mks + b._mks,
+                     self.is_vector or b.is_vector)
+    def __rmul__(self, b):
+        return _lazy(b)*self
+    def __truediv__(self, b):
+        b = _lazy(b)
+        c = self.concrete/b.concrete
+        if b.is_vector:
+            return _untraceable(c)
+        return _Lazy('/', (self, b), c, self._mks - b._mks, self.is_vector)
+    def __rtruediv__(self, b):
+        return _lazy(b)/self
+    __div__ = __truediv__
+    __rdiv__ = __rtruediv__
+    def __neg__(self):
+        return _Lazy('neg', (self,), -self.concrete, self._mks, self.is_vector)
+    def __pos__(self):
+        return self
+    def __abs__(self):
+        return _Lazy('abs', (self,), abs(self.concrete), self._mks, False)
+    def __pow__(self, b):
+        c = self.concrete**_concrete(b)
+        if self.is_vector or type(b) not in _number_types:
+            # the units of the result would depend on the value of b
+            return _untraceable(c)
+        return _Lazy('**', (self, b), c, _pow_units(self._mks, b), False)
+    def __rpow__(self, b):
+        return _untraceable(b**self.concrete)
+
+    def dot(self, b):
+        b = _lazy(b)
+        c = self.concrete.dot(b.concrete)
+        if not (self.is_vector and b.is_vector):
+            return _untraceable(c)
+        return _Lazy('dot', (self, b), c, self._mks + b._mks, False)
+    def cross(self, b):
+        b = _lazy(b)
+        c = self.concrete.cross(b.concrete)
+        if not (self.is_vector and b.is_vector):
+            return _untraceable(c)
+        return _Lazy('cross', (self, b), c, self._mks + b._mks, True)
+    def abs(self):
+        return abs(self)
+    def normalized(self):
+        return self/abs(self)
+    @property
+    def x(self):
+        return _Lazy('x', (self,), self.concrete.x, self._mks, False)
+    @property
+    def y(self):
+        return _Lazy('y', (self,), self.concrete.y, self._mks, False)
+    @property
+    def z(self):
+        return _Lazy('z', (self,), self.concrete.z, self._mks, False)
+    @property
+    def v(self):
+        '''The numbers of a scalar, without its units, which `value`
+        gives before `sin` and friends call numpy.'''
+        if self.is_vector:
+            raise AttributeError('v') # which __getattr__ then looks for
+        return _Lazy('v', (self,), value(self.concrete), 0, False)
+
+    # numpy calls these methods when sin() and friends are given a _Lazy
+    def sin(self):
+        return _Lazy('sin', (self,), numpy.sin(value(self.concrete)), 0, False)
+    def cos(self):
+        return _Lazy('cos', (self,), numpy.cos(value(self.concrete)), 0, False)
+    def tan(self):
+        return _Lazy('tan', (self,), numpy.tan(value(self.concrete)), 0, False)
+    def exp(self):
+        return _Lazy('exp', (self,), numpy.exp(value(self.concrete)), 0, False)
+    def arctan2(self, x):
+        x = _lazy(x)
+        return _Lazy('atan2', (self, x),
+                     numpy.arctan2(value(self.concrete), value(x.concrete)), 0, False)
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        traced = _traced_ufuncs.get(ufunc.__name__)
+        if traced is not None and method == '__call__' and not kwargs:
+            return traced(*[_lazy(i) for i in inputs])
+        return _untraceable(getattr(ufunc, method)(*[_concrete(i) for i in inputs],
+                                                   **kwargs))
+
+    # Anything else is done to the value, and stops the trace from
+    # being compiled.
+    def __getattr__(self, name):
+        if name in _Lazy.__slots__ or name.startswith('__'):
+            raise AttributeError(name)
+        return _untraceable(getattr(self.concrete, name))
+    def __bool__(self):
+        return _untraceable(bool(self.concrete))
+    __nonzero__ = __bool__
+    def __float__(self):
+        return _untraceable(float(self.concrete))
+    def __int__(self):
+        return _untraceable(int(self.concrete))
+    def __len__(self):
+        return _untraceable(len(self.concrete))
+    def __iter__(self):
+        return _untraceable(iter(self.concrete))
+    def __getitem__(self, i):
+        return _untraceable(self.concrete[_concrete(i)])
+    def __eq__(self, b):
+        return _untraceable(self.concrete == _concrete(b))
+    def __ne__(self, b):
+        return _untraceable(self.concrete != _concrete(b))
+    def __lt__(self, b):
+        return _untraceable(self.concrete < _concrete(b))
+    def __gt__(self, b):
+        return _untraceable(self.concrete > _concrete(b))
+    def __le__(self, b):
+        return _untraceable(self.concrete <= _concrete(b))
+    def __ge__(self, b):
+        return _untraceable(self.concrete >= _concrete(b))
+    __hash__ = object.__hash__
+
+# The numpy functions that are traced when given a _Lazy.
+_traced_ufuncs = {'add': lambda a, b: a + b,
+                  'subtract': lambda a, b: a - b,
+                  'multiply': lambda a, b: a*b,
+                  'true_divide': lambda a, b: a/b,
+                  'divide': lambda a, b: a/b,
+                  'negative': lambda a: -a,
+                  'absolute': abs,
+                  'sqrt': lambda a: a**0.5,
+                  'power': lambda a, b: a**_concrete(b),
+                  'sin': _Lazy.sin,
+                  'cos': _Lazy.cos,
+                  'tan': _Lazy.tan,
+                  'exp': _Lazy.exp,
+                  'arctan2': _Lazy.arctan2}
+
+def _lazy(v):
+    '''Treat a value that is not being traced as a constant.'''
+    if type(v) == _Lazy:
+        return v
+    if type(v) == vector:
+        return _Lazy('const', (v,), v, v._mks, True, False)
+    if type(v) == VectorArray:
+        return _Lazy('const', (v,), v, v._mks, True, True)
+    if type(v) == QuantityArray or hasattr(v, 'shape'):
+        return _Lazy('const', (v,), v, units(v), False, True)
+    if type(v) == scalar or type(v) in _number_types:
+        return _Lazy('const', (v,), v, units(v), False, False)
+    # something we cannot compile, which is only used for its value
+    return _untraceable(_Lazy('const', (v,), v, units(v), False, False))
+
+def _stack_columns(x, y, z):
+    n = max(len(c) for c in (x, y, z) if hasattr(c, 'shape'))
+    data = numpy.empty((n, 3))
+    data[:, 0] = x
+    data[:, 1] = y
+    data[:, 2] = z
+    r = VectorArray.__new__(VectorArray)
+    r._mks = 0
+    r._data = data
+    return r
+
+def _compile_fused(name, inputs, outputs, single):
+    '''Generate a function that computes the outputs, which are
+    _Lazy expressions, from the arguments described by inputs.'''
+    lines = []
+    constants = []
+    names = {}
+    def component_names(n):
+        return [n + c for c in 'xyz']
+    def emit(node):
+        if id(node) in names:
+            return names[id(node)]
+        if type(node) != _Lazy:
+            return repr(node)
+        args = [emit(a) if type(a) == _Lazy else a for a in node.args]
+        n = 't%d' % len(names)
+        maths = 'numpy' if node.is_array else 'math'
+        if node.op == 'input':
+            i, kind, example = node.args
+            if kind == vector:
+                lines.extend(['%s = a%d._%s' % (c, i, c[-1])
+                              for c in component_names(n)])
+            elif kind == VectorArray:
+                lines.append('%s = a%d._data' % (n, i))
+                lines.extend(['%s = %s[:,%d]' % (c, n, k)
+                              for k, c in enumerate(component_names(n))])
+            elif kind == scalar or kind == QuantityArray:
+                lines.append('%s = a%d.v' % (n, i))
+            else:
+                lines.append('%s = a%d' % (n, i))
+        elif node.op == 'const':
+            v = node.args[0]
+            if type(v) == vector:
+                constants.extend([v._x, v._y, v._z])
+                lines.extend(['%s = c%d' % (c, len(constants) - 3 + k)
+                              for k, c in enumerate(component_names(n))])
+            elif type(v) == VectorArray:
+                constants.extend([v._data[:,0], v._data[:,1], v._data[:,2]])
+                lines.extend(['%s = c%d' % (c, len(constants) - 3 + k)
+                              for k, c in enumerate(component_names(n))])
+            else:
+                constants.append(value(v))
+                lines.append('%s = c%d' % (n, len(constants) - 1))
+        elif node.op in ('+', '-', '*', '/'):
+            a, b = node.args
+            if node.is_vector:
+                ac = component_names(args[0]) if a.is_vector else [args[0]]*3
+                bc = component_names(args[1]) if b.is_vector else [args[1]]*3
+                lines.extend(['%s = %s %s %s' % (c, x, node.op, y)
+                              for c, x, y in zip(component_names(n), ac, bc)])
+            else:
+                lines.append('%s = %s %s %s' % (n, args[0], node.op, args[1]))
+        elif node.op == 'neg':
+            if node.is_vector:
+                lines.extend(['%s = -%s' % (c, x) for c, x in
+                              zip(component_names(n), component_names(args[0]))])
+            else:
+                lines.append('%s = -%s' % (n, args[0]))
+        elif node.op == 'abs':
+            if node.args[0].is_vector:
+                x, y, z = component_names(args[0])
+                lines.append('%s = %s.sqrt(%s*%s + %s*%s + %s*%s)'
+                             % (n, maths, x, x, y, y, z, z))
+            else:
+                lines.append('%s = abs(%s)' % (n, args[0]))
+        elif node.op == '**':
+            lines.append('%s = %s**%r' % (n, args[0], args[1]))
+        elif node.op == 'dot':
+            a = component_names(args[0])
+            b = component_names(args[1])
+            lines.append('%s = %s*%s + %s*%s + %s*%s'
+                         % (n, a[0], b[0], a[1], b[1], a[2], b[2]))
+        elif node.op == 'cross':
+            ax, ay, az = component_names(args[0])
+            bx, by, bz = component_names(args[1])
+            x, y, z = component_names(n)
+            lines.append('%s = %s*%s - %s*%s' % (x, ay, bz, az, by))
+            lines.append('%s = %s*%s - %s*%s' % (y, az, bx, ax, bz))
+            lines.append('%s = %s*%s - %s*%s' % (z, ax, by, ay, bx))
+        elif node.op == 'v':
+            lines.append('%s = %s' % (n, args[0]))
+        elif node.op in ('x', 'y', 'z'):
+            lines.append('%s = %s%s' % (n, args[0], node.op))
+        elif node.op == 'atan2':
+            lines.append('%s = %s.%s(%s, %s)' % (n, maths, 'arctan2' if node.is_array
+                                                 else 'atan2', args[0], args[1]))
+        else:
+            lines.append('%s = %s.%s(%s)' % (n, maths, node.op, args[0]))
+        names[id(node)] = n
+        return n
+    results = []
+    for out in outputs:
+        n = emit(out)
+        if out.is_vector and out.is_array:
+            results.append('_set_units(_stack_columns(%s), %d)'
+                           % (', '.join(component_names(n)), out._mks))
+        elif out.is_vector:
+            results.append('_make_vector(%s, %d)'
+                           % (', '.join(component_names(n)), out._mks))
+        elif out._mks == 0:
+            results.append(n)
+        elif out.is_array:
+            results.append('QuantityArray(%s, %d)' % (n, out._mks))
+        else:
+            results.append('scalar(%s, %d)' % (n, out._mks))
+    source = ['def make(%s):' % ', '.join(['c%d' % i for i in range(len(constants))]),
+              '    def %s(%s):' % (name, ', '.join(['a%d' % i for i in range(len(inputs))]))]
+    source += ['        ' + l for l in lines]
+    if single:
+        source.append('        return ' + results[0])
+    else:
+        source.append('        return (%s,)' % ', '.join(results))
+    source.append('    return %s' % name)
+    namespace = {}
+    exec(compile('\n'.join(source), '<fused %s>' % name, 'exec'),
+         globals(), namespace)
+    return namespace['make'](*constants)
+
+def _set_units(v, mks):
+    v._mks = mks
+    return v
+
+def fuse(func):
+    """A decorator that evaluates a function of vectors and scalars in
+    a single fused pass, without creating a new vector for each
+    operation.
+
+    The first time the function is called with arguments of given
+    types and units, it is traced: its operators build a tree
+    describing the whole calculation, the units of the whole tree are
+    checked once, and the tree is compiled into a function that works
+    directly on the numbers in the vectors.  Later calls with the same
+    types and units run the compiled function.  The arguments may be
+    numbers, scalars, vectors, or the arrays `VectorArray` and
+    `QuantityArray`.
+
+    .. testcode :: fuse
+
+        @fuse
+        def rotate(v, axis, cosalpha, sinalpha):
+            vpar = v.dot(axis)*axis
+            vperp = v - vpar
+            return vperp*cosalpha + axis.cross(v)*sinalpha + vpar
+
+    .. doctest :: fuse
+
+        >>> rotate(vector(1,0,0)*meter, vector(0,0,1), 0, 1)
+        <0,1,0> meter
+
+    Any value that is not an argument, such as a global variable, is
+    treated as a constant the first time the function is traced.  A
+    function that compares values, or calls anything other than the
+    arithmetic operators, `abs`, `sqrt`, `sin`, `cos`, `tan`, `exp`,
+    `atan2` and the methods of vectors, is simply called as usual.
+    Tracing computes the result as well, so the function is only run
+    once even when it turns out that it cannot be fused.
+    """
+    compiled = {}
+    signature = []
+    @functools.wraps(func)
+    def fused(*args, **kwargs):
+        if kwargs:
+            # Pass the keyword arguments by position, if we can.
+            if not signature:
+                signature.append(getattr(inspect, 'signature', lambda f: None)(func))
+            if signature[0] is None:
+                return func(*args, **kwargs)
+            bound = signature[0].bind(*args, **kwargs)
+            if bound.kwargs:
+                return func(*args, **kwargs)
+            args = bound.args
+        key = tuple([(type(a), getattr(a, '_mks', 0)) for a in args])
+        f = compiled.get(key)
+        if f is not None:
+            return f(*args)
+        if key in compiled:
+            return func(*args)
+        inputs = []
+        for i, a in enumerate(args):
+            t = type(a)
+            if t == vector or t == VectorArray:
+                inputs.append(_Lazy('input', (i, t, a), a, a._mks, True, t == VectorArray))
+            elif t == scalar or t == QuantityArray or t in _number_types:
+                inputs.append(_Lazy('input', (i, t, a), a, units(a), False, t == QuantityArray))
+            else:
+                compiled[key] = None
+                return func(*args)
+        trace = []
+        _traces.append(trace)
+        try:
+            result = func(*inputs)
+            single = type(result) != tuple and type(result) != list
+            outputs = [_lazy(out) for out in ((result,) if single else result)]
+        finally:
+            _traces.pop()
+        if trace:
+            # The function does something we cannot trace, so from now
+            # on we just call it as usual.
+            compiled[key] = None
+            if single:
+                return outputs[0].concrete
+            return type(result)([out.concrete for out in outputs])
+        compiled[key] = _compile_fused(func.__name__, inputs, outputs, single)
+        if single:
+            return outputs[0].concrete
+        return tuple([out.concrete for out in outputs])
+    return fused
+
+for _t in (scalar, vector):
+    _add[_t, _Lazy] = lambda a, b: b.__radd__(a)
+    _subtract[_t, _Lazy] = lambda a, b: b.__rsub__(a)
+    _multiply[_t, _Lazy] = lambda a, b: b.__rmul__(a)
+    _divide[_t, _Lazy] = lambda a, b: b.__rtruediv__(a)
+
+meter = scalar(1, _encode_units(1, 0, 0))
+kg = scalar(1, _encode_units(0, 1, 0))
+second = scalar(1, _encode_units(0, 0, 1))
 Newton = kg*meter/second**2
 Joule = Newton*meter
 pi = math.pi
 
 class _rotation(object):
+    __slots__ = ('angle', 'axis')
     def __init__(self,angle,axis):
         self.angle = angle
         self.axis = axis.normalized()
     def rotate(self,v):
-        vpar = v.dot(self.axis)*self.axis
-        vperp = v - vpar
-        cosalpha = math.cos(self.angle)
-        sinalpha = math.sin(self.angle)
-        return vperp*cosalpha + self.axis.cross(v)*sinalpha + vpar
+        return _rotate(v, self.axis, math.cos(self.angle), math.sin(self.angle))
+
+@fuse
+def _rotate(v, axis, cosalpha, sinalpha):
+    vpar = v.dot(axis)*axis
+    vperp = v - vpar
+    return vperp*cosalpha + axis.cross(v)*sinalpha + vpar
+
+class _SceneObject(object):
+    '''The base of the objects that are drawn on the screen.
+
+    Each kind of object lists the properties it draws in its
+    `__slots__`, so that they take little memory and are quick to
+    reach.  Students also attach their own properties to objects, such
+    as the velocity `s.v` of a sphere.  These are kept in a dictionary
+    that is only created when the first such property is attached, so
+    objects without them do not pay for it.
+    '''
+    __slots__ = ('__dict__', '__weakref__')
 
-class _Plot(object):
+class _Plot(_SceneObject):
+    __slots__ = ('_x', '_y', '__ymax', '__xmax', '__ymin', '__xmin',
+                 'color', '__display')
     def __init__(self, color, display):
         self._x = []
         self._y = []
@@ -617,7 +1924,8 @@ class _Plot(object):
             gl.glVertex2f(x(i+skip), y(i+skip));
         gl.glEnd()
 
-class _Hline(object):
+class _Hline(_SceneObject):
+    __slots__ = ('_y', 'color', '__display')
     def __init__(self, value, color, display):
         self._y = value
         self.color = color
@@ -651,7 +1959,8 @@ class _Hline(object):
         gl.glVertex2f( 1, y_on_screen);
         gl.glEnd()
 
-class _Trail(object):
+class _Trail(_SceneObject):
+    __slots__ = ('__object', '__stats', 'color', 'duration', 'dash_time')
     def __init__(self, object, color=None, duration=None, dash_time=0.2*second):
         check_units('dash_time must be a time', dash_time, second)
         if duration is not None:
@@ -699,7 +2008,8 @@ class _Trail(object):
     def __repr__(self):
         return str(self)
 
-class _Sphere(object):
+class _Sphere(_SceneObject):
+    __slots__ = ('pos', 'radius', 'color', 'glows')
     def __init__(self, pos, radius, color):
         check_units('position must have dimensions of distance', pos, meter)
         self.pos = pos
@@ -730,7 +2040,229 @@ class _Sphere(object):
     def __repr__(self):
         return 'sphere(%s, %s)' % (self.pos, self.radius)
 
-class _Helix(object):
+class _ParticleSet(_SceneObject):
+    '''Many spheres whose positions, velocities, forces, masses, radii
+    and colors are stored together in arrays.
+
+    The whole set may be updated at once through its `pos`, `v` and
+    `F` arrays, which are `VectorArray` objects, and its masses `m`
+    (1 kg each unless set), or one particle at a time by indexing or
+    iterating over the set, which gives particles that behave like
+    the objects returned by `sphere`.
+    '''
+    __slots__ = ('_pos', '_v', '_F', '_m', '_radius', '_colors', '_elements', 'glows')
+    def __init__(self, positions, radius, color):
+        if type(positions) == VectorArray:
+            positions = positions.copy()
+        else:
+            positions = VectorArray(positions)
+        if positions._mks == 0 and not positions._data.any():
+            positions._mks = meter._mks # all zero vectors
+        check_units('position must have dimensions of distance', positions, meter)
+        N = len(positions)
+        if type(radius) == QuantityArray or type(radius) == list:
+            radius = QuantityArray(radius)
+            if len(radius) != N:
+                raise Exception('need one radius for each of the %d particles, not %d'
+                                % (N, len(radius)))
+        else:
+            radius = QuantityArray(numpy.full(N, float(value(radius))), units(radius))
+        check_units('radius must have dimensions of distance', radius, meter)
+        self._pos = positions
+        self._v = VectorArray(numpy.zeros((N, 3)), (meter/second)._mks)
+        self._F = VectorArray(numpy.zeros((N, 3)), Newton._mks)
+        self._m = QuantityArray(numpy.ones(N), kg._mks)
+        self._radius = radius
+        self.color = color
+        self._elements = [None]*N
+        self.glows = False
+    def __rows(self, v, name, unit, err):
+        N = len(self._pos)
+        if type(v) == vector:
+            v = VectorArray(numpy.tile((v._x, v._y, v._z), (N, 1)), v._mks)
+        elif type(v) != VectorArray:
+            v = VectorArray(v)
+        if len(v) != N:
+            raise Exception('%s must have one vector for each of the %d particles, not %d'
+                            % (name, N, len(v)))
+        if _is_boring_vector(v):
+            # zeros need no units, so they are given the usual ones
+            v = VectorArray(v._data, unit._mks)
+        check_units(err, v, unit)
+        return v
+
+    @property
+    def pos(self):
+        '''the positions of the particles, as a VectorArray'''
+        return self._pos
+    @pos.setter
+    def pos(self, p):
+        self._pos = self.__rows(p, 'pos', meter, 'position must have dimensions of distance')
+    @property
+    def v(self):
+        '''the velocities of the particles, as a VectorArray'''
+        return self._v
+    @v.setter
+    def v(self, v):
+        self._v = self.__rows(v, 'v', meter/second,
+                              'velocity must have dimensions of distance per time')
+    @property
+    def F(self):
+        '''the forces on the particles, as a VectorArray'''
+        return self._F
+    @F.setter
+    def F(self, F):
+        self._F = self.__rows(F, 'F', Newton, 'force must have dimensions of force')
+    @property
+    def m(self):
+        '''the masses of the particles, as a QuantityArray'''
+        return self._m
+    @m.setter
+    def m(self, m):
+        if type(m) == QuantityArray or type(m) == list:
+            m = QuantityArray(m)
+            if len(m) != len(self._pos):
+                raise Exception('m must have one mass for each of the %d particles, not %d'
+                                % (len(self._pos), len(m)))
+        else:
+            m = QuantityArray(numpy.full(len(self._pos), float(value(m))), units(m))
+        check_units('mass must have dimensions of mass', m, kg)
+        self._m = m
+    @property
+    def radius(self):
+        '''the radii of the particles, as a QuantityArray'''
+        return self._radius
+    @radius.setter
+    def radius(self, r):
+        if type(r) != QuantityArray:
+            r = QuantityArray(numpy.full(len(self._pos), float(value(r))), units(r))
+        check_units('radius must have dimensions of distance', r, meter)
+        self._radius = r
+    @property
+    def color(self):
+        '''the colors of the particles, as a list'''
+        return [color.RGB(*c) for c in self._colors.tolist()]
+    @color.setter
+    def color(self, c):
+        if type(c) == color.RGB:
+            self._colors = numpy.tile(c.rgb(), (len(self._pos), 1)).astype(float)
+        else:
+            self._colors = numpy.array([x.rgb() for x in c], dtype=float).reshape(-1, 3)
+
+    def __len__(self):
+        return len(self._pos)
+    def __getitem__(self, i):
+        p = self._elements[i]
+        if p is None:
+            p = _Particle(self, i)
+            self._elements[i] = p
+        return p
+    def __iter__(self):
+        for i in range(len(self._pos)):
+            yield self[i]
+    def __str__(self):
+        return 'particles(%d)' % len(self._pos)
+    def __repr__(self):
+        return str(self)
+    def _pass_time(self,t):
+        pass
+    def _draw(self):
+        q = glu.gluNewQuadric()
+        for p, r, c in zip(self._pos._data.tolist(), self._radius.v.tolist(),
+                           self._colors.tolist()):
+            gl.glPushMatrix()
+            gl.glTranslate(p[0], p[1], p[2])
+            gl.glMaterialfv(gl.GL_FRONT,gl.GL_DIFFUSE,c)
+            glu.gluSphere(q, r, 20, 20)
+            gl.glPopMatrix()
+
+# The vectors given out by the pos, v and F of particles, keyed by
+# their ids, along with the name of the property.  Each is a copy of a
+# row of the arrays of a particle set, so setting one of its
+# components would change nothing, and is refused instead.  The
+# vectors that nothing else refers to any more are dropped whenever
+# there are more than _particle_vectors_limit[0] of them.
+_particle_vectors = {}
+_particle_vectors_limit = [64]
+
+def _particle_vector(v, name):
+    if len(_particle_vectors) >= _particle_vectors_limit[0]:
+        # the entry keyed by None holds a vector that nothing else
+        # refers to, to count the references of one that is unused
+        _particle_vectors[None] = (vector.__new__(vector), None)
+        refs = dict((key, sys.getrefcount(entry[0]))
+                    for key, entry in _particle_vectors.items())
+        unused = refs.pop(None)
+        for key, n in refs.items():
+            if n <= unused:
+                del _particle_vectors[key]
+        del _particle_vectors[None]
+        _particle_vectors_limit[0] = 2*len(_particle_vectors) + 64
+    _particle_vectors[id(v)] = (v, name)
+    return v
+
+def _refuse_component(v, component):
+    name = _particle_vectors[id(v)][1]
+    meaning = {'pos': 'position', 'v': 'velocity', 'F': 'force'}[name]
+    raise Exception('p.%s is a copy of the %s of a particle, so setting its %s component '
+                    'would not change the particle: assign a whole vector to p.%s instead'
+                    % (name, meaning, component, name))
+
+class _Particle(object):
+    '''One of the spheres of a particle set.  Its properties read and
+    write its own row of the arrays of the set, so `p.pos` always
+    gives the current position.  Note that `p.pos` is a new vector
+    each time, so you must assign to `p.pos` (for instance with
+    `p.pos += dr`) to move it, and setting `p.pos.x` raises an
+    exception rather than silently doing nothing.
+    '''
+    __slots__ = ('_set', '_i', '__dict__', '__weakref__')
+    def __init__(self, particles, i):
+        self._set = particles
+        self._i = i
+    @property
+    def pos(self):
+        return _particle_vector(self._set._pos[self._i], 'pos')
+    @pos.setter
+    def pos(self, p):
+        self._set._pos[self._i] = p
+    @property
+    def v(self):
+        return _particle_vector(self._set._v[self._i], 'v')
+    @v.setter
+    def v(self, v):
+        self._set._v[self._i] = v
+    @property
+    def F(self):
+        return _particle_vector(self._set._F[self._i], 'F')
+    @F.setter
+    def F(self, F):
+        self._set._F[self._i] = F
+    @property
+    def m(self):
+        return self._set._m[self._i]
+    @m.setter
+    def m(self, m):
+        self._set._m[self._i] = m
+    @property
+    def radius(self):
+        return self._set._radius[self._i]
+    @radius.setter
+    def radius(self, r):
+        self._set._radius[self._i] = r
+    @property
+    def color(self):
+        return color.RGB(*self._set._colors[self._i].tolist())
+    @color.setter
+    def color(self, c):
+        self._set._colors[self._i] = c.rgb()
+    def __str__(self):
+        return 'sphere(%s, %s)' % (self.pos, self.radius)
+    def __repr__(self):
+        return str(self)
+
+class _Helix(_SceneObject):
+    __slots__ = ('pos1', 'pos2', 'length', 'radius', 'color', 'twists')
     def __init__(self, pos1, pos2, radius, color, length, twists):
         self.pos1 = pos1
         self.pos2 = pos2
@@ -779,7 +2311,8 @@ class _Helix(object):
     def __repr__(self):
         return 'helix(%s, %s, %s)' % (self.pos1, self.pos2, self.radius)
 
-class _Cylinder(object):
+class _Cylinder(_SceneObject):
+    __slots__ = ('pos1', 'pos2', 'radius', 'color')
     def __init__(self, pos1, pos2, radius, color):
         self.pos1 = pos1
         self.pos2 = pos2
@@ -821,13 +2354,14 @@ class _Cylinder(object):
     def __repr__(self):
         return 'cylinder(%s, %s, %s)' % (self.pos1, self.pos2, self.radius)
 
-class _Box(object):
+class _Box(_SceneObject):
     '''A box is a rectangular prism oriented along the x, y, and z axes.
 
     While it would be reasonable to be able to rotate the orientation
     of a box, we do not currently permit this.
 
     '''
+    __slots__ = ('pos', 'wx', 'wy', 'wz', 'color')
     def __init__(self, pos, wx, wy, wz, color):
         check_units('box dimensions must be distances', pos, wx, wy, wz)
         self.pos = pos
@@ -1170,6 +2704,11 @@ class __display(object):
         self.__objects.append(s)
         self.init()
         return s
+    def create_particles(self, positions, radius, color):
+        s = _ParticleSet(positions, radius, color)
+        self.__objects.append(s)
+        self.init()
+        return s
     def create_helix(self, pos1, pos2, radius, color, length, twists):
         h = _Helix(pos1, pos2, radius, color, length, twists)
         self.__objects.append(h)
@@ -1206,7 +2745,7 @@ class Camera(object):
         return self.__position
     @position.setter
     def position(self, v):
-        if units(position(v)) != (1,0,0):
+        if units(position(v)) != meter._mks:
             raise Exception('position must have dimensions of distance: %s' % (v))
         self.__position = v
     @property
@@ -1223,7 +2762,7 @@ class Camera(object):
         if type(v) != vector:
             raise Exception('up be a vector: %s' % (v))
         self.__up = v
-        self.__up._mks = (1,0,0)
+        self.__up._mks = meter._mks
     @property
     def center(self):
         '''the position at which the camera points
@@ -1236,7 +2775,7 @@ class Camera(object):
         return self.__center
     @center.setter
     def center(self,v):
-        if units(position(v)) != (1,0,0):
+        if units(position(v)) != meter._mks:
             raise Exception('center must have dimensions of distance: %s' % (v))
         self.__center = v
 
@@ -1254,7 +2793,7 @@ class Camera(object):
         return abs(position(self.__center) - position(self.__position))
     @range.setter
     def range(self,v):
-        if units(v) != (1,0,0):
+        if units(v) != meter._mks:
             raise Exception('range must be a distance: %s' % (v))
         if type(v) == vector:
             raise Exception('range must be a scalar: %s' % (v))
@@ -1333,6 +2872,39 @@ def sphere(pos = vector(0,0,0)*meter, radius=1.0*meter, color=color.RGB(1,1,1)):
     check_units('radius must have dimensions of distance', radius, meter)
     return __x.create_sphere(pos.copy(), radius, color.copy())
 
+def particles(positions, radius=0.1*meter, color=color.RGB(1,1,1)):
+    """Create many spheres at once.
+
+    Args:
+        positions: the initial positions of the spheres in meters,
+            either as a list of vectors or as a VectorArray
+        radius: the radius of the spheres in meters, or a list or
+            QuantityArray giving a radius for each sphere
+        color: the color of the spheres, or a list giving a color for
+            each sphere
+    Raises:
+        Exception: the dimensions are not distances
+
+    The positions, velocities `v`, forces `F`, radii and colors of the
+    spheres are stored together in arrays, so that they can be
+    updated all at once, as in
+
+    .. code-block :: python
+
+        balls = particles([vector(i,0,0)*meter for i in range(1000)])
+        balls.v = vector(0,0,1)*meter/second
+        while True:
+            balls.pos += balls.v*dt
+            timestep(dt)
+
+    Indexing or looping over the set gives spheres which may be
+    used just like those returned by `sphere`, and whose `pos`, `v`
+    and `F` read and write the arrays of the set.  The units are
+    checked once for the whole set, which makes creating thousands of
+    spheres much faster than calling `sphere` for each one.
+    """
+    return __x.create_particles(positions, radius, color)
+
 def helix(pos1, pos2,
           radius=0.1*meter, color=color.RGB(1,1,1),
           length=None,
@@ -1364,8 +2936,8 @@ def helix(pos1, pos2,
     """
     check_units('position must be a distance',
                 position(pos1), position(pos2), meter)
-    pos1._mks = (1,0,0) # in case it is the zero vector
-    pos2._mks = (1,0,0) # in case it is the zero vector
+    position(pos1)._mks = meter._mks # in case it is the zero vector
+    position(pos2)._mks = meter._mks # in case it is the zero vector
     check_units('radius must have dimensions of distance', radius, meter)
     if length == None:
         d = abs(position(pos2) - position(pos1))
@@ -1403,8 +2975,8 @@ def cylinder(pos1, pos2,
     """
     check_units('position must be a distance',
                 position(pos1), position(pos2), meter)
-    pos1._mks = (1,0,0) # in case it is the zero vector
-    pos2._mks = (1,0,0) # in case it is the zero vector
+    position(pos1)._mks = meter._mks # in case it is the zero vector
+    position(pos2)._mks = meter._mks # in case it is the zero vector
     check_units('radius must have dimensions of distance', radius, meter)
     return __x.create_cylinder(pos1, pos2,
                                radius, color.copy())
@@ -1516,3 +3088,19 @@ def exit_visualization():
     __x._window_closed = True
     __x = __display()
 
+# The engines need numpy, so they are only imported here when it is
+# available.  They are not in __all__, so that "from physical import *"
+# gives students only the basics; import them from their own modules,
+# such as physical.integrators.
+if numpy.__name__ == 'numpy':
+    from physical.neighbors import ShortRangeForce
+    from physical.nbody import InverseSquareForce
+    from physical.springs import SpringNetwork
+    from physical.integrators import (integrate, AdaptiveIntegrator, ImplicitIntegrator,
+                                      MultirateIntegrator)
+    from physical.constraints import DistanceConstraints
+    from physical.parallel import WorkerPool
+    from physical.periodic import PeriodicBox
+    from physical.hardspheres import HardSpheres
+    from physical.contacts import collisions, CollisionDetector
+    from physical.sleeping import SleepTracker
@@ -14,6 +14,7 @@ __all__ = ('RGB',
 class RGB(object):
     """A color stored in the RGB color space.
     """
+    __slots__ = ('__r', '__g', '__b')
     def __init__(self, r,g,b):
         """Generate a color from the RGB values provided, which should range
            from 0 to 1.
@@ -0,0 +1,176 @@
+"""The physical.constraints module holds particles at fixed distances
+from each other, or from fixed points, like the rigid rod of a
+pendulum or the links of a chain.  Modelling a rod as a very stiff
+spring forces us to take tiny time steps to follow its vibrations,
+while a constraint has no vibrations at all, so the time step only
+needs to be short enough to follow the motion we care about.
+
+The constraints are enforced by `integrate` using the velocity Verlet
+method, with the SHAKE and RATTLE algorithms: after each step, the
+positions are corrected, over and over, until every distance is right
+to within a tolerance, and then the velocities are corrected so that
+no link is stretching.  All of the constraints are corrected at once,
+by solving the linear equations for the tension of every link with
+the conjugate gradient method.
+
+.. testcode :: constraints
+
+    from physical.constraints import DistanceConstraints
+    from physical.integrators import integrate
+
+    g = vector(0,0,-9.8)*meter/second**2
+    bob = particles([vector(1,0,0)*meter])
+    rod = cylinder(vector(0,0,0)*meter, bob[0], radius=0.02*meter)
+    integrate(bob, lambda pos, v: bob.m[0]*g, 0.05*second, steps=100,
+              constraints=DistanceConstraints([rod]))
+
+.. doctest :: constraints
+
+    >>> abs(abs(bob.pos[0]) - 1*meter) < 1e-9*meter
+    True
+
+"""
+
+from __future__ import division, print_function
+
+__all__ = ('DistanceConstraints',)
+
+import numpy
+
+from physical import vector, QuantityArray, check_units, units, value, meter
+from physical.integrators import _conjugate_gradient
+
+class DistanceConstraints(object):
+    '''Rigid links holding pairs of particles from one particle set (or
+    a particle and a fixed point) at fixed distances from each other.
+
+    Args:
+        links: a list of cylinders (or of pairs), each of which joins
+            two particles of the same particle set, or a particle and
+            a fixed position
+        length: the distance to hold each pair at, either one for all
+            links, or a QuantityArray (or list) with one for each link.
+            It defaults to the length of each link when the
+            constraints are created.
+        tolerance: the error allowed in each distance, relative to the
+            distance
+    Raises:
+        Exception: the ends of a link are not particles of one set or
+            fixed positions, or the dimensions are wrong
+    '''
+    def __init__(self, links, length=None, tolerance=1e-10):
+        self.particles = None
+        anchors = []
+        ends = []
+        for link in links:
+            pair = (link.pos1, link.pos2) if hasattr(link, 'pos1') else tuple(link)
+            ends.append(pair)
+            if type(pair[0]) == vector and type(pair[1]) == vector:
+                raise Exception('a link must hold at least one particle')
+            for end in pair:
+                particles = getattr(end, '_set', None)
+                if particles is None:
+                    if type(end) != vector:
+                        raise Exception('links must join particles or fixed positions, not %s'
+                                        % (end,))
+                    check_units('a fixed position must be a distance', end, meter)
+                elif self.particles is None:
+                    self.particles = particles
+                elif particles is not self.particles:
+                    raise Exception('links must join particles of the same set')
+        if self.particles is None:
+            raise Exception('need at least one link')
+        N = len(self.particles)
+        # Fixed positions are numbered after the particles.
+        def index(end):
+            if type(end) == vector:
+                anchors.append((end._x, end._y, end._z))
+                return N + len(anchors) - 1
+            return end._i
+        self.i = numpy.array([index(a) for a, b in ends], dtype=int)
+        self.j = numpy.array([index(b) for a, b in ends], dtype=int)
+        self.anchors = numpy.array(anchors, dtype=float).reshape(-1, 3)
+        if length is None:
+            x = self.__extend(self.particles.pos._data)
+            length = QuantityArray(numpy.sqrt(((x[self.i] - x[self.j])**2).sum(axis=1)),
+                                   meter._mks)
+        elif type(length) != QuantityArray and type(length) != list:
+            length = QuantityArray(numpy.full(len(ends), float(value(length))), units(length))
+        length = QuantityArray(length)
+        if len(length) != len(ends):
+            raise Exception('need one length for each of the %d links, not %d'
+                            % (len(ends), len(length)))
+        check_units('length must have dimensions of distance', length, meter)
+        self.length = length
+        self.tolerance = tolerance
+        #: the most iterations allowed before giving up
+        self.max_iterations = 100
+        #: the number of iterations taken by the last step
+        self.iterations = 0
+
+    def __len__(self):
+        return len(self.i)
+
+    def __extend(self, data):
+        return numpy.concatenate([data, self.anchors])
+
+    def __solve(self, r, w, b, tolerance):
+        '''Find how hard each link must pull (or push) along the
+        direction r to change its length by b, allowing for the pull of
+        every other link on the same particles.'''
+        n = len(w)
+        def apply(pull):
+            f = pull[:,numpy.newaxis]*r
+            moved = numpy.empty((n, 3))
+            for c in range(3):
+                moved[:, c] = (numpy.bincount(self.i, weights=f[:, c], minlength=n)
+                               - numpy.bincount(self.j, weights=f[:, c], minlength=n))
+            moved *= w[:,numpy.newaxis]
+            return numpy.einsum('ij,ij->i', r, moved[self.i] - moved[self.j])
+        diagonal = (w[self.i] + w[self.j])*numpy.einsum('ij,ij->i', r, r)
+        pull, iterations = _conjugate_gradient(apply, b, diagonal, tolerance,
+                                               10*len(b) + 100)
+        if pull is None:
+            raise Exception('the distance constraints cannot all be satisfied at once, '
+                            'which happens when links contradict each other, such as '
+                            'two links of different lengths joining the same particles')
+        return pull
+
+    def __move(self, x, r, w, pull):
+        f = pull[:,numpy.newaxis]*r
+        for c in range(3):
+            x[:, c] -= w*(numpy.bincount(self.i, weights=f[:, c], minlength=len(x))
+                          - numpy.bincount(self.j, weights=f[:, c], minlength=len(x)))
+
+    def _correct_positions(self, before, after, w):
+        '''Move the particles from the positions after a step so that
+        the links have their lengths, with each correction along the
+        link as it was before the step.  w holds the inverse masses.'''
+        x = self.__extend(after)
+        old = self.__extend(before)
+        w = numpy.concatenate([w, numpy.zeros(len(self.anchors))])
+        r = old[self.i] - old[self.j]
+        d2 = self.length.v**2
+        for iterations in range(self.max_iterations + 1):
+            s = x[self.i] - x[self.j]
+            error = numpy.einsum('ij,ij->i', s, s) - d2
+            if abs(error/d2).max() < 2*self.tolerance:
+                self.iterations = iterations
+                return x[:len(after)]
+            # This linearizes the lengths using the old direction of
+            # each link, so it converges a little more slowly than
+            # Newton's method, but keeps the equations symmetric.
+            self.__move(x, r, w, self.__solve(r, w, 0.5*error, 1e-3))
+        raise Exception('the distance constraints could not be satisfied after %d '
+                        'iterations; try a smaller time step' % self.max_iterations)
+
+    def _correct_velocities(self, positions, u, w):
+        '''Remove from the velocities u any motion that would change the
+        length of a link.'''
+        x = self.__extend(positions)
+        u = numpy.concatenate([u, numpy.zeros_like(self.anchors)])
+        w = numpy.concatenate([w, numpy.zeros(len(self.anchors))])
+        r = x[self.i] - x[self.j]
+        stretching = numpy.einsum('ij,ij->i', r, u[self.i] - u[self.j])
+        self.__move(u, r, w, self.__solve(r, w, stretching, self.tolerance))
+        return u[:len(positions)]
@@ -0,0 +1,314 @@
+"""The physical.contacts module finds which spheres and boxes overlap
+each other, which is the first thing needed to make them bounce off
+each other or come to rest on the ground.  Checking every pair of
+objects takes a time proportional to the square of the number of
+objects, so instead the objects are sorted by where they begin along
+one axis, and only objects whose extents along that axis overlap are
+checked further.  This is called sweep and prune.
+
+From one step of a simulation to the next, the objects move only a
+little, so their order hardly changes, and sorting them again takes
+little time.  The contacts between objects that have not moved since
+the last step are remembered, so a scene in which little moves costs
+almost nothing.
+
+.. testcode :: contacts
+
+    from physical.contacts import collisions
+
+    ground = box(vector(0,0,-0.5)*meter, 10*meter, 10*meter, 1*meter)
+    ball = sphere(vector(0,0,0.9)*meter, radius=1*meter)
+    contacts = collisions([ground, ball])
+
+.. doctest :: contacts
+
+    >>> len(contacts)
+    1
+    >>> contacts[0].normal == vector(0,0,1)
+    True
+    >>> abs(contacts[0].depth - 0.1*meter) < 1e-9*meter
+    True
+
+"""
+
+from __future__ import division, print_function
+
+__all__ = ('collisions', 'CollisionDetector')
+
+import numpy
+
+from physical import vector, scalar, check_units, meter
+
+class _Contact(object):
+    '''Two objects that overlap.'''
+    __slots__ = ('a', 'b', 'normal', 'depth')
+    def __init__(self, a, b, normal, depth):
+        #: the first object, which comes earlier in the list of objects
+        self.a = a
+        #: the second object
+        self.b = b
+        #: the unit vector pointing from a toward b, along which they
+        #: should be pushed apart
+        self.normal = normal
+        #: how far the objects overlap along the normal
+        self.depth = depth
+    def __repr__(self):
+        return 'contact(%s, %s, %s, %s)' % (self.a, self.b, self.normal, self.depth)
+
+def _sphere_box(s, r, c, h):
+    '''The normal from each box (centered at c with half widths h) to
+    each sphere, and how far they overlap.'''
+    d = s - numpy.clip(s, c - h, c + h)
+    dist = numpy.sqrt(numpy.einsum('ij,ij->i', d, d))
+    outside = dist > 0
+    normal = numpy.zeros_like(d)
+    normal[outside] = d[outside]/dist[outside,numpy.newaxis]
+    depth = r - dist
+    if not outside.all():
+        # The center of the sphere is inside the box, so it is pushed
+        # out through the nearest face.
+        inside = ~outside
+        offset = s[inside] - c[inside]
+        face = h[inside] - abs(offset)
+        axis = numpy.argmin(face, axis=1)
+        rows = numpy.arange(len(axis))
+        n = numpy.zeros_like(offset)
+        n[rows, axis] = numpy.where(offset[rows, axis] < 0, -1, 1)
+        normal[inside] = n
+        depth[inside] = r[inside] + face[rows, axis]
+    return normal, depth
+
+def _narrow(ci, hi, ri, bi, cj, hj, rj, bj):
+    '''The normal from i to j, and the depth of overlap, of pairs of
+    spheres (of radius r) or boxes (of half widths h), where b says
+    which are boxes.'''
+    normal = numpy.zeros_like(ci)
+    depth = numpy.zeros(len(ci))
+    spheres = ~bi & ~bj
+    if spheres.any():
+        d = cj[spheres] - ci[spheres]
+        dist = numpy.sqrt(numpy.einsum('ij,ij->i', d, d))
+        n = numpy.zeros_like(d)
+        n[:, 2] = 1 # for spheres at the same place
+        apart = dist > 0
+        n[apart] = d[apart]/dist[apart,numpy.newaxis]
+        normal[spheres] = n
+        depth[spheres] = ri[spheres] + rj[spheres] - dist
+    boxes = bi & bj
+    if boxes.any():
+        d = cj[boxes] - ci[boxes]
+        overlap = hi[boxes] + hj[boxes] - abs(d)
+        axis = numpy.argmin(overlap, axis=1)
+        rows = numpy.arange(len(axis))
+        n = numpy.zeros_like(d)
+        n[rows, axis] = numpy.where(d[rows, axis] < 0, -1, 1)
+        normal[boxes] = n
+        depth[boxes] = overlap[rows, axis]
+    mixed = bi & ~bj
+    if mixed.any():
+        normal[mixed], depth[mixed] = _sphere_box(cj[mixed], rj[mixed], ci[mixed], hi[mixed])
+    mixed = ~bi & bj
+    if mixed.any():
+        n, depth[mixed] = _sphere_box(ci[mixed], ri[mixed], cj[mixed], hj[mixed])
+        normal[mixed] = -n
+    return normal, depth
+
+class CollisionDetector(object):
+    '''Finds the overlapping pairs of a list of spheres and boxes, and
+    remembers what it found, so that it is quick to find them again
+    after the objects have moved a little.  `collisions` uses a
+    CollisionDetector of its own, so you only need to make one if you
+    want to find the collisions within several lists of objects.
+    '''
+    def __init__(self):
+        #: the number of pairs whose overlap was computed in the last
+        #: call, which is zero if nothing moved
+        self.tested = 0
+        self.__objects = None
+        self.__order = None
+        self.__axis = 0
+        self.__contacts = {}
+        self.__touching = {}
+
+    def __read(self, objects):
+        '''The centers, half widths and radii of the objects, and which
+        of them are boxes.'''
+        N = len(objects)
+        centers = numpy.empty((N, 3))
+        half = numpy.empty((N, 3))
+        radius = numpy.zeros(N)
+        boxes = numpy.zeros(N, dtype=bool)
+        for k, o in enumerate(objects):
+            p = o.pos
+            centers[k] = (p._x, p._y, p._z)
+            if hasattr(o, 'wx'):
+                boxes[k] = True
+                half[k] = (0.5*o.wx.v, 0.5*o.wy.v, 0.5*o.wz.v)
+            else:
+                radius[k] = half[k] = o.radius.v
+        return centers, half, radius, boxes
+
+    def __restart(self, objects):
+        for o in objects:
+            if hasattr(o, 'wx'):
+                check_units('box dimensions must be distances', o.pos, o.wx, o.wy, o.wz, meter)
+            elif hasattr(o, 'radius'):
+                check_units('sphere dimensions must be distances', o.pos, o.radius, meter)
+            else:
+                raise Exception('collisions are found between spheres and boxes, not %s' % (o,))
+        self.__objects = objects
+        self.__order = numpy.arange(len(objects))
+        self.__contacts = {}
+        self.__touching = {}
+        self.__centers, self.__half, self.__radius, self.__boxes = self.__read(objects)
+        self.__low = self.__centers - self.__half
+        self.__high = self.__centers + self.__half
+        # sweep along the axis on which the objects are most spread out
+        self.__axis = int(numpy.argmax(self.__centers.var(axis=0))) if len(objects) else 0
+
+    def collisions(self, objects, moving=None):
+        '''Find the pairs of objects that overlap.
+
+        Args:
+            objects: a list of spheres and boxes (or particles of
+                particle sets)
+            moving: the indices in objects of the only objects that
+                may have moved since the last call (as kept by a
+                `SleepTracker`), in which case the others are not
+                looked at again, and only the contacts of the moving
+                objects are returned
+        Returns:
+            a list of contacts, each with attributes `a` and `b`
+            holding the two objects, `normal` holding the unit vector
+            from `a` toward `b`, and `depth` holding the distance by
+            which they overlap
+        Raises:
+            Exception: an object is not a sphere or box, or its
+                dimensions are not distances
+        '''
+        if moving is None:
+            objects = list(objects)
+        if self.__objects is None or len(objects) != len(self.__objects) or \
+           (moving is None and any(a is not b for a, b in zip(objects, self.__objects))):
+            self.__restart(list(objects))
+            moved = numpy.ones(len(objects), dtype=bool)
+        else:
+            moved = self.__reread(numpy.arange(len(objects)) if moving is None
+                                  else numpy.asarray(moving, dtype=int))
+        self.tested = 0
+        if moved.any():
+            self.__update(moved)
+        if moving is None:
+            keys = self.__contacts
+        else:
+            keys = set()
+            for k in numpy.asarray(moving, dtype=int).tolist():
+                keys.update(self.__touching.get(k, ()))
+        return [self.__contacts[key] for key in sorted(keys)]
+
+    def __reread(self, index):
+        '''Read the objects at the given indices again, returning which
+        of all the objects have moved.'''
+        centers, half, radius, boxes = self.__read([self.__objects[k] for k in index.tolist()])
+        low, high = centers - half, centers + half
+        moved = numpy.zeros(len(self.__objects), dtype=bool)
+        moved[index] = (low != self.__low[index]).any(axis=1) | \
+            (high != self.__high[index]).any(axis=1)
+        self.__centers[index], self.__half[index] = centers, half
+        self.__radius[index], self.__boxes[index] = radius, boxes
+        self.__low[index], self.__high[index] = low, high
+        return moved
+
+    def __sweep(self, order):
+        '''Every pair i < j whose extents overlap along the axis.'''
+        low, high, axis = self.__low, self.__high, self.__axis
+        start = low[order, axis]
+        end = numpy.searchsorted(start, high[order, axis], 'right')
+        count = end - numpy.arange(len(order)) - 1
+        first = numpy.repeat(numpy.arange(len(order)), count)
+        second = numpy.arange(count.sum()) - numpy.repeat(numpy.cumsum(count) - count, count) \
+            + first + 1
+        i, j = order[first], order[second]
+        return numpy.minimum(i, j), numpy.maximum(i, j)
+
+    def __sweep_moved(self, order, moved):
+        '''The pairs i < j whose extents overlap along the axis, at least
+        one of which has moved, found by looking only near the objects
+        that moved.'''
+        low, high, axis = self.__low, self.__high, self.__axis
+        start = low[order, axis]
+        extent = high[:, axis] - low[:, axis]
+        # An object overlapping a moved one starts no further before it
+        # than its own extent.  The few objects much wider than the
+        # others (such as the ground) would make that reach too long,
+        # so they are paired with every moved object instead.
+        wide = extent > 4*numpy.median(extent)
+        reach = extent[~wide].max()
+        m = numpy.flatnonzero(moved)
+        first = numpy.searchsorted(start, low[m, axis] - reach, 'left')
+        count = numpy.searchsorted(start, high[m, axis], 'right') - first
+        i = numpy.repeat(m, count)
+        j = order[numpy.repeat(first, count) + numpy.arange(count.sum())
+                  - numpy.repeat(numpy.cumsum(count) - count, count)]
+        keep = ~wide[j]
+        w = numpy.flatnonzero(wide)
+        i = numpy.concatenate([i[keep], numpy.repeat(m, len(w))])
+        j = numpy.concatenate([j[keep], numpy.tile(w, len(m))])
+        # a pair of moved objects is found from both of them
+        keep = (i != j) & (~moved[j] | (i < j))
+        i, j = i[keep], j[keep]
+        return numpy.minimum(i, j), numpy.maximum(i, j)
+
+    def __update(self, moved):
+        low, high, axis = self.__low, self.__high, self.__axis
+        # The order from the last call is nearly right, which the
+        # stable sort (a merge sort) takes advantage of.
+        order = self.__order
+        order = self.__order = order[numpy.argsort(low[order, axis], kind='stable')]
+        if 4*moved.sum() < len(moved):
+            i, j = self.__sweep_moved(order, moved)
+        else:
+            i, j = self.__sweep(order)
+        keep = (moved[i] | moved[j]) & \
+            (low[i] <= high[j]).all(axis=1) & (low[j] <= high[i]).all(axis=1)
+        i, j = i[keep], j[keep]
+        self.tested = len(i)
+        touching = self.__touching
+        for k in numpy.flatnonzero(moved).tolist():
+            for key in touching.pop(k, ()):
+                del self.__contacts[key]
+                other = key[0] if key[1] == k else key[1]
+                touching[other].discard(key)
+        c, h, r, b = self.__centers, self.__half, self.__radius, self.__boxes
+        normal, depth = _narrow(c[i], h[i], r[i], b[i], c[j], h[j], r[j], b[j])
+        close = depth > 0
+        objects = self.__objects
+        for a, z, n, d in zip(i[close].tolist(), j[close].tolist(),
+                              normal[close].tolist(), depth[close].tolist()):
+            self.__contacts[a, z] = _Contact(objects[a], objects[z], vector(n[0], n[1], n[2]),
+                                             scalar(d, meter._mks))
+            # the contacts of each object, so that those of a moving
+            # object are found without looking at all of them
+            touching.setdefault(a, set()).add((a, z))
+            touching.setdefault(z, set()).add((a, z))
+
+_detector = CollisionDetector()
+
+def collisions(objects):
+    '''Find the pairs of spheres and boxes that overlap, such as a ball
+    that has hit the ground.  This remembers the objects it was given,
+    and is fastest when given the same list of objects each time.
+
+    Args:
+        objects: a list of spheres and boxes (or particles of
+            particle sets)
+    Returns:
+        a list of contacts, each with attributes `a` and `b` holding
+        the two objects, `normal` holding the unit vector from `a`
+        toward `b`, and `depth` holding the distance by which they
+        overlap
+    Raises:
+        Exception: an object is not a sphere or box, or its dimensions
+            are not distances
+    '''
+    return _detector.collisions(objects)
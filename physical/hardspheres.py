@@ -0,0 +1,241 @@
+"""The physical.hardspheres module moves hard spheres, such as the
+molecules of an ideal gas, which fly in straight lines until they
+collide elastically with each other or with the walls of a box.
+Rather than taking small time steps and checking for spheres that
+overlap, which misses collisions unless the steps are very small,
+it predicts when each sphere will next hit another sphere or a wall,
+and jumps straight from one collision to the next.  This gives the
+exact motion, and for a dilute gas it is much faster than taking
+time steps, since the spheres fly a long way between collisions.
+
+The predicted collisions are kept in a priority queue.  The box is
+divided into cells at least as wide as a sphere, so that each sphere
+need only be checked against the spheres in the cells around it, and
+a sphere moving into a new cell is an event too.  When a sphere
+collides, the collisions predicted for it before are simply left in
+the queue, and thrown away when they come up.
+
+.. testcode :: hardspheres
+
+    from physical.hardspheres import HardSpheres
+
+    walls = box(vector(0,0,0)*meter, 10*meter, 10*meter, 10*meter)
+    gas = particles([vector(-2,0,0)*meter, vector(2,0,0)*meter], radius=0.5*meter)
+    gas.v = VectorArray([vector(1,0,0), vector(-1,0,0)])*meter/second
+    engine = HardSpheres(walls)
+    engine.advance(gas, 2.5*second)
+
+.. doctest :: hardspheres
+
+    >>> gas.v
+    VectorArray([[-1.0, 0.0, 0.0], [1.0, 0.0, 0.0]]) meter*second**(-1)
+    >>> engine.collisions
+    1
+
+"""
+
+from __future__ import division, print_function
+
+__all__ = ('HardSpheres',)
+
+import heapq
+
+import numpy
+
+from physical import VectorArray, scalar, check_units, value, meter, second, kg
+from physical.neighbors import _pairs_within
+
+# The kinds of event, in the order in which simultaneous events happen.
+_COLLISION, _WALL, _CELL = range(3)
+
+class HardSpheres(object):
+    '''An event-driven engine for hard spheres bouncing around inside
+    a box, with no other forces.
+
+    Call `advance` once for each frame of an animation, followed by
+    `timestep` with the same time.  If you change the positions or
+    velocities between frames, the collisions are predicted afresh.
+
+    Args:
+        walls: the box (as made by `box`) holding the spheres, which
+            the spheres bounce off from the inside
+    Raises:
+        Exception: the dimensions of the box are not distances
+    '''
+    def __init__(self, walls):
+        check_units('box dimensions must be distances',
+                    walls.pos, walls.wx, walls.wy, walls.wz, meter)
+        self.walls = walls
+        #: the time, which is zero when the engine is created
+        self.t = 0*second
+        #: the number of collisions between spheres
+        self.collisions = 0
+        #: the number of collisions with the walls
+        self.wall_collisions = 0
+        #: the total momentum given to the walls by the spheres, which
+        #: divided by the time and the area of the walls is the pressure
+        self.wall_impulse = 0*kg*meter/second
+        self.__left = None
+
+    def __start(self, system):
+        '''Read the spheres and the box, and predict every event.'''
+        check_units('positions must be distances', system.pos, meter)
+        check_units('velocities must be distances per time', system.v, meter/second)
+        check_units('masses must be masses', system.m, kg)
+        b = self.walls
+        widths = numpy.array([b.wx.v, b.wy.v, b.wz.v], dtype=float)
+        self.__low = numpy.array([b.pos._x, b.pos._y, b.pos._z], dtype=float) - 0.5*widths
+        self.__high = self.__low + widths
+        self.__x = system.pos._data.copy()
+        self.__u = system.v._data.copy()
+        self.__m = numpy.asarray(system.m.v, dtype=float)
+        self.__r = numpy.asarray(system.radius.v, dtype=float)
+        N = len(self.__x)
+        r = self.__r[:,numpy.newaxis]
+        if ((self.__x - r < self.__low) | (self.__x + r > self.__high)).any():
+            raise Exception('the spheres must be inside the box')
+        if N > 1:
+            i, j = _pairs_within(self.__x, 2*self.__r.max())
+            dr = self.__x[j] - self.__x[i]
+            if (numpy.einsum('ij,ij->i', dr, dr) < (self.__r[i] + self.__r[j])**2).any():
+                raise Exception('the spheres must not overlap')
+        # the time at which each sphere was at x
+        self.__since = numpy.full(N, float(value(self.t)))
+        # how many times each sphere has changed course (or cell), which
+        # tells us which predicted events are out of date
+        self.__changes = numpy.zeros(N, dtype=int)
+        self.__shape = numpy.maximum(1, numpy.floor(widths/(2*self.__r.max()))).astype(int)
+        self.__cell_width = widths/self.__shape
+        cells = numpy.minimum(self.__shape - 1,
+                              numpy.floor((self.__x - self.__low)/self.__cell_width).astype(int))
+        self.__cell = [tuple(c) for c in cells.tolist()]
+        self.__members = {}
+        for k, c in enumerate(self.__cell):
+            self.__members.setdefault(c, set()).add(k)
+        self.__offsets = [(a, c, d) for a in (-1, 0, 1) for c in (-1, 0, 1) for d in (-1, 0, 1)]
+        self.__queue = []
+        self.__count = 0
+        for k in range(N):
+            self.__predict(k)
+
+    def __push(self, time, kind, i, j):
+        self.__count += 1
+        heapq.heappush(self.__queue, (time, kind, self.__count, i, j, self.__changes[i],
+                                      self.__changes[j] if kind == _COLLISION else 0))
+
+    def __neighbors(self, i):
+        c = self.__cell[i]
+        found = []
+        for offset in self.__offsets:
+            found.extend(self.__members.get((c[0] + offset[0], c[1] + offset[1],
+                                             c[2] + offset[2]), ()))
+        found = numpy.array(found, dtype=int)
+        return found[found != i]
+
+    def __predict(self, i):
+        '''Predict the next collision of sphere i with each sphere
+        nearby, its next collision with a wall, and when it will leave
+        its cell.'''
+        t = self.__since[i]
+        x, u = self.__x[i], self.__u[i]
+        others = self.__neighbors(i)
+        if len(others):
+            # where the others are at time t
+            dr = (self.__x[others] - x
+                  + self.__u[others]*(t - self.__since[others])[:,numpy.newaxis])
+            dv = self.__u[others] - u
+            b = numpy.einsum('ij,ij->i', dr, dv)
+            v2 = numpy.einsum('ij,ij->i', dv, dv)
+            gap = numpy.einsum('ij,ij->i', dr, dr) - (self.__r[others] + self.__r[i])**2
+            disc = b*b - v2*gap
+            hit = (b < 0) & (disc >= 0)
+            for j, when in zip(others[hit].tolist(),
+                               (t + numpy.maximum(0, gap[hit]/(numpy.sqrt(disc[hit]) - b[hit])))
+                               .tolist()):
+                self.__push(when, _COLLISION, i, j)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            # the time to the wall, and to the edge of the cell, along each axis
+            wall = numpy.where(u > 0, self.__high - self.__r[i] - x,
+                               self.__low + self.__r[i] - x)/u
+            c = numpy.array(self.__cell[i])
+            edge = self.__low + self.__cell_width*(c + (u > 0))
+            cross = (edge - x)/u
+        wall[~(u != 0)] = numpy.inf
+        cross[~(u != 0) | ((u > 0) & (c == self.__shape - 1)) | ((u < 0) & (c == 0))] = numpy.inf
+        axis = int(numpy.argmin(wall))
+        if wall[axis] < numpy.inf:
+            self.__push(t + max(0, wall[axis]), _WALL, i, axis)
+        axis = int(numpy.argmin(cross))
+        if cross[axis] < numpy.inf:
+            self.__push(t + max(0, cross[axis]), _CELL, i, axis)
+
+    def __move(self, i, t):
+        self.__x[i] += self.__u[i]*(t - self.__since[i])
+        self.__since[i] = t
+
+    def __process(self, t, kind, i, j):
+        self.__move(i, t)
+        if kind == _COLLISION:
+            self.__move(j, t)
+            n = self.__x[j] - self.__x[i]
+            n /= numpy.sqrt(n.dot(n))
+            # the impulse on j along the line between the centers
+            m1, m2 = self.__m[i], self.__m[j]
+            J = 2*m1*m2/(m1 + m2)*(self.__u[i] - self.__u[j]).dot(n)
+            self.__u[i] -= J/m1*n
+            self.__u[j] += J/m2*n
+            self.__changes[i] += 1
+            self.__changes[j] += 1
+            self.collisions += 1
+            self.__predict(i)
+            self.__predict(j)
+        elif kind == _WALL:
+            self.wall_impulse += scalar(2*self.__m[i]*abs(self.__u[i, j]), self.wall_impulse._mks)
+            self.__u[i, j] = -self.__u[i, j]
+            self.__changes[i] += 1
+            self.wall_collisions += 1
+            self.__predict(i)
+        else:
+            old = self.__cell[i]
+            c = list(old)
+            c[j] += 1 if self.__u[i, j] > 0 else -1
+            self.__cell[i] = c = tuple(c)
+            self.__members[old].discard(i)
+            self.__members.setdefault(c, set()).add(i)
+            # Spheres that are near the new cell, but were not near the
+            # old one, may now be close enough to hit, so the events of
+            # this sphere are predicted afresh.
+            self.__changes[i] += 1
+            self.__predict(i)
+
+    def advance(self, system, duration):
+        '''Advance the positions and velocities of the spheres by a
+        given time, going through every collision on the way.
+
+        Args:
+            system: the particle set of spheres, whose radii and
+                masses are used
+            duration: the time to advance
+        Raises:
+            Exception: the dimensions are wrong, or the spheres are
+                outside the box or overlap
+        '''
+        check_units('duration must have dimensions of time', duration, second)
+        if self.__left is None or self.__left[0] is not system or \
+           not (numpy.array_equal(system.pos._data, self.__left[1]) and
+                numpy.array_equal(system.v._data, self.__left[2])):
+            self.__start(system)
+        end = value(self.t) + value(duration)
+        queue = self.__queue
+        while queue and queue[0][0] <= end:
+            t, kind, count, i, j, changes_i, changes_j = heapq.heappop(queue)
+            if changes_i != self.__changes[i] or \
+               (kind == _COLLISION and changes_j != self.__changes[j]):
+                continue # this sphere has changed course since the prediction
+            self.__process(t, kind, i, j)
+        self.__x += self.__u*(end - self.__since)[:,numpy.newaxis]
+        self.__since[:] = end
+        self.t = end*second
+        system.pos = VectorArray(self.__x.copy(), meter._mks)
+        system.v = VectorArray(self.__u.copy(), (meter/second)._mks)
+        self.__left = (system, self.__x.copy(), self.__u.copy())
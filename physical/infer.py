@@ -0,0 +1,670 @@
+"""The physical.infer module checks the units in a simulation script
+without running it.  It reads the script, follows the dimensions of
+`meter`, `kg`, `second`, `Newton` and `Joule` through assignments and
+arithmetic, and reports any mistakes in units along with their line
+numbers.  You can run it from the command line with:
+
+.. code-block :: shell
+
+    python -m physical.infer falling.py
+
+If there are no errors, the script may be run knowing that it will
+not stop partway through with a unit error on any of the lines that
+were checked.  The lines that were proven to be consistent can also
+be saved to a manifest using the `--manifest` option:
+
+.. code-block :: shell
+
+    python -m physical.infer falling.py --manifest falling.units.json
+
+The manifest is a record of which lines were checked, such as for a
+teacher reviewing a student's script.  It does not change how the
+script runs: physical still checks the units of every operation as
+the script runs, whether or not its line was proven consistent.
+
+"""
+
+from __future__ import division, print_function
+
+__all__ = ('infer_units', 'write_manifest', 'main')
+
+import ast, json, os, sys
+
+import physical
+from physical import _encode_units, _pow_units
+
+_METER = _encode_units(1, 0, 0)
+_KG = _encode_units(0, 1, 0)
+_SECOND = _encode_units(0, 0, 1)
+
+class _Quantity(object):
+    '''The inferred type of a scalar or vector with known dimensions.'''
+    def __init__(self, code, is_vector=False, zero=False):
+        self.code = code
+        self.is_vector = is_vector
+        self.zero = zero
+    def __eq__(self, b):
+        return (type(b) == _Quantity and self.code == b.code
+                and self.is_vector == b.is_vector and self.zero == b.zero)
+    def __ne__(self, b):
+        return not self == b
+    def __repr__(self):
+        u = physical.scalar(1, self.code)
+        if self.is_vector:
+            return 'vector %s' % physical.Units._repr(u)
+        return physical.Units._repr(u) or 'dimensionless'
+
+class _Object(object):
+    '''The inferred type of an object with attributes, such as a sphere.'''
+    def __init__(self, attrs):
+        self.attrs = attrs
+    def __eq__(self, b):
+        return type(b) == _Object and self.attrs == b.attrs
+    def __ne__(self, b):
+        return not self == b
+
+class _Function(object):
+    '''A function defined in the script, which is checked where it is called.'''
+    def __init__(self, node):
+        self.node = node
+    def __eq__(self, b):
+        return type(b) == _Function and self.node is b.node
+    def __ne__(self, b):
+        return not self == b
+
+class _Tuple(object):
+    def __init__(self, items):
+        self.items = items
+    def __eq__(self, b):
+        return type(b) == _Tuple and self.items == b.items
+    def __ne__(self, b):
+        return not self == b
+
+#: The type of anything whose dimensions cannot be determined.
+UNKNOWN = None
+
+def _number(zero=False):
+    return _Quantity(0, zero=zero)
+
+def _join(a, b):
+    '''The type of a variable that may hold either a or b.'''
+    if a == b:
+        return a
+    if type(a) == _Quantity and type(b) == _Quantity and \
+       a.code == b.code and a.is_vector == b.is_vector:
+        return _Quantity(a.code, a.is_vector)
+    return UNKNOWN
+
+def _known_names():
+    env = {}
+    for name, code in [('meter', _METER), ('kg', _KG), ('second', _SECOND),
+                       ('Newton', physical.Newton._mks),
+                       ('Joule', physical.Joule._mks)]:
+        env[name] = _Quantity(code)
+    env['pi'] = _number()
+    env['minimum_fps'] = _Quantity(physical.minimum_fps._mks)
+    return env
+
+# Functions that require dimensionless arguments and return a
+# dimensionless number.
+_DIMENSIONLESS_FUNCTIONS = ('sin', 'cos', 'tan', 'exp', 'int', 'float', 'round')
+# Modules whose functions act on plain numbers.
+_NUMBER_MODULES = ('math', 'numpy', 'random')
+
+# The dimensions required of the keyword arguments of the objects
+# that physical creates, and the attributes those objects have.
+_OBJECTS = {
+    'sphere': (('pos', 'radius', 'color'),
+               {'pos': _Quantity(_METER, True), 'radius': _Quantity(_METER)}),
+    'box': (('pos', 'wx', 'wy', 'wz', 'color'),
+            {'pos': _Quantity(_METER, True), 'wx': _Quantity(_METER),
+             'wy': _Quantity(_METER), 'wz': _Quantity(_METER)}),
+    'cylinder': (('pos1', 'pos2', 'radius', 'color'),
+                 {'radius': _Quantity(_METER)}),
+    'helix': (('pos1', 'pos2', 'radius', 'color', 'length', 'twists'),
+              {'radius': _Quantity(_METER), 'length': _Quantity(_METER)}),
+    'trail': (('object', 'duration', 'dash_time'),
+              {'duration': _Quantity(_SECOND), 'dash_time': _Quantity(_SECOND)}),
+}
+
+class _Inference(object):
+    '''The results of checking the units of a script.
+
+    Attributes:
+        filename: the name of the script
+        errors: a list of (line number, message) pairs
+        proven: a sorted list of the line numbers on which every
+            operation was checked and found to be consistent
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.errors = []
+        self.proven = []
+        # lines on which at least one operation was checked, and lines
+        # on which some operation could not be checked
+        self._checked = set()
+        self._unchecked = set()
+        self._functions_in_progress = set()
+        self._modules = {}
+        self._line = 0
+        self._failures = 0
+
+    def _error(self, node, message):
+        e = (getattr(node, 'lineno', self._line), message)
+        self._failures += 1
+        if e not in self.errors:
+            self.errors.append(e)
+        self._unchecked.add(e[0])
+    def _checked_line(self):
+        self._checked.add(self._line)
+    def _unchecked_line(self):
+        self._unchecked.add(self._line)
+
+    def _match(self, node, err, types):
+        '''Check that the given types have the same units, in the way
+        that `physical.check_units` does at run time.'''
+        known = []
+        for t in types:
+            if t is UNKNOWN or type(t) != _Quantity:
+                self._unchecked_line()
+                return
+            if not t.zero:
+                known.append(t)
+        for t in known[1:]:
+            if t.code != known[0].code:
+                self._error(node, '%s: %s vs %s' % (err, t, known[0]))
+                return
+        self._checked_line()
+
+    # Statements
+
+    def _run(self, statements, env):
+        for s in statements:
+            self._statement(s, env)
+
+    def _statement(self, s, env):
+        self._line = getattr(s, 'lineno', self._line)
+        if isinstance(s, ast.Assign):
+            t = self._expr(s.value, env)
+            for target in s.targets:
+                self._assign(target, t, env)
+        elif isinstance(s, ast.AugAssign):
+            old = self._expr(s.target, env)
+            failures = self._failures
+            t = self._binop(s, old, s.op, self._expr(s.value, env))
+            if self._failures > failures:
+                # The program would stop here, so report the error once
+                # rather than letting it spoil every later line.
+                t = old
+            self._assign(s.target, t, env)
+        elif isinstance(s, ast.Expr):
+            self._expr(s.value, env)
+        elif isinstance(s, ast.If):
+            self._expr(s.test, env)
+            body = dict(env)
+            orelse = dict(env)
+            self._run(s.body, body)
+            self._run(s.orelse, orelse)
+            self._merge(env, body, orelse)
+        elif isinstance(s, (ast.While, ast.For)):
+            if isinstance(s, ast.For):
+                self._assign(s.target, self._iteration(s.iter, env), env)
+            # Run the loop body until the types of the variables stop
+            # changing, so that we know their types on every iteration.
+            for i in range(4):
+                before = dict(env)
+                if isinstance(s, ast.While):
+                    self._expr(s.test, env)
+                body = dict(env)
+                self._run(s.body, body)
+                self._merge(env, before, body)
+                if env == before:
+                    break
+            self._run(s.orelse, env)
+        elif isinstance(s, ast.FunctionDef):
+            env[s.name] = _Function(s)
+        elif isinstance(s, ast.Return):
+            if s.value is not None:
+                t = self._expr(s.value, env)
+                env['return'] = _join(env['return'], t) if 'return' in env else t
+        elif isinstance(s, ast.ClassDef):
+            env[s.name] = UNKNOWN
+        elif isinstance(s, (ast.Import, ast.ImportFrom)):
+            for alias in s.names:
+                if alias.name == '*':
+                    if s.module != 'physical':
+                        # e.g. "from visual import *" gives objects that
+                        # know nothing of units
+                        for name in _OBJECTS:
+                            env[name] = UNKNOWN
+                    continue
+                name = alias.asname or alias.name.split('.')[0]
+                if isinstance(s, ast.Import) and alias.name in _NUMBER_MODULES:
+                    self._modules[name] = alias.name
+                elif name not in _known_names():
+                    env[name] = UNKNOWN
+        elif hasattr(ast, 'With') and isinstance(s, ast.With):
+            self._run(s.body, env)
+        elif hasattr(ast, 'Try') and isinstance(s, ast.Try):
+            self._run(s.body, env)
+            for h in s.handlers:
+                self._run(h.body, env)
+            self._run(s.orelse, env)
+            self._run(s.finalbody, env)
+
+    def _merge(self, env, a, b):
+        for name in set(a) | set(b):
+            if name in a and name in b:
+                env[name] = _join(a[name], b[name])
+            else:
+                env[name] = UNKNOWN
+
+    def _iteration(self, it, env):
+        if isinstance(it, ast.Call) and isinstance(it.func, ast.Name) and \
+           it.func.id == 'range':
+            for a in it.args:
+                self._match(a, 'range must be given numbers',
+                            [self._expr(a, env), _number()])
+            return _number()
+        self._expr(it, env)
+        return UNKNOWN
+
+    def _assign(self, target, t, env):
+        if isinstance(target, ast.Name):
+            self._forget(target.id, env)
+            env[target.id] = t
+            if type(t) == _Object:
+                for attr, at in t.attrs.items():
+                    env[target.id + '.' + attr] = at
+        elif isinstance(target, ast.Attribute):
+            name = _dotted(target)
+            if name is None:
+                return
+            if name.startswith('camera.') and name[7:] in ('position', 'center'):
+                self._match(target, '%s must have dimensions of distance' % name[7:],
+                            [_position(t), _Quantity(_METER)])
+            old = env.get(name, UNKNOWN)
+            if type(old) == _Quantity and type(t) == _Quantity and \
+               name.split('.')[-1] in ('x', 'y', 'z'):
+                self._match(target, '%s component must have dimensions of vector'
+                            % name.split('.')[-1], [t, old])
+            self._forget(name, env)
+            env[name] = t
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            items = t.items if type(t) == _Tuple and \
+                len(t.items) == len(target.elts) else [UNKNOWN]*len(target.elts)
+            for e, et in zip(target.elts, items):
+                self._assign(e, et, env)
+        # assignments to subscripts are not tracked
+
+    def _forget(self, name, env):
+        '''Forget the attributes of a name that is being reassigned.'''
+        prefix = name + '.'
+        for k in [k for k in env if k.startswith(prefix)]:
+            del env[k]
+
+    # Expressions
+
+    def _expr(self, e, env):
+        if _is_number(e):
+            return _number(zero=_number_value(e) == 0)
+        if isinstance(e, ast.Name):
+            return env.get(e.id, UNKNOWN)
+        if isinstance(e, ast.Attribute):
+            return self._attribute(e, env)
+        if isinstance(e, ast.BinOp):
+            return self._binop(e, self._expr(e.left, env), e.op,
+                               self._expr(e.right, env))
+        if isinstance(e, ast.UnaryOp):
+            t = self._expr(e.operand, env)
+            if isinstance(e.op, ast.Not):
+                return _number()
+            return t
+        if isinstance(e, ast.Compare):
+            types = [self._expr(e.left, env)] + [self._expr(c, env) for c in e.comparators]
+            if not all(isinstance(op, (ast.Is, ast.IsNot, ast.In, ast.NotIn))
+                       for op in e.ops):
+                self._match(e, 'can only compare values with same dimensions',
+                            types)
+            return _number()
+        if isinstance(e, ast.BoolOp):
+            for v in e.values:
+                self._expr(v, env)
+            return _number()
+        if isinstance(e, ast.Call):
+            return self._call(e, env)
+        if isinstance(e, ast.Tuple):
+            return _Tuple([self._expr(x, env) for x in e.elts])
+        if isinstance(e, ast.IfExp):
+            self._expr(e.test, env)
+            return _join(self._expr(e.body, env), self._expr(e.orelse, env))
+        for child in ast.iter_child_nodes(e):
+            if isinstance(child, ast.expr):
+                self._expr(child, env)
+        return UNKNOWN
+
+    def _attribute(self, e, env):
+        name = _dotted(e)
+        if name is not None and name in env:
+            return env[name]
+        if _dotted(e.value) in self._modules:
+            # constants such as math.pi are plain numbers
+            return _number()
+        t = self._expr(e.value, env)
+        if type(t) == _Quantity and t.is_vector and e.attr in ('x', 'y', 'z'):
+            return _Quantity(t.code, zero=t.zero)
+        if type(t) == _Object:
+            return t.attrs.get(e.attr, UNKNOWN)
+        return UNKNOWN
+
+    def _binop(self, node, a, op, b):
+        if isinstance(op, (ast.Add, ast.Sub)):
+            verb = 'add' if isinstance(op, ast.Add) else 'subtract'
+            if type(a) != _Quantity or type(b) != _Quantity:
+                self._unchecked_line()
+                return UNKNOWN
+            if a.is_vector != b.is_vector:
+                self._error(node, 'cannot %s a vector and a scalar' % verb)
+                return UNKNOWN
+            if a.is_vector:
+                if a.code != b.code:
+                    self._error(node, 'dimensions do not match in vector %s: %s vs %s'
+                                % ('addition' if verb == 'add' else 'subtraction', a, b))
+                    return UNKNOWN
+            elif a.code != b.code and not (a.zero and a.code == 0) \
+                 and not (b.zero and b.code == 0):
+                self._error(node, 'you cannot %s quantities with differing units: %s and %s'
+                            % (verb, a, b))
+                return UNKNOWN
+            self._checked_line()
+            if a.zero:
+                return b
+            if b.zero:
+                return a
+            return _Quantity(a.code, a.is_vector)
+        if isinstance(op, (ast.Mult, ast.Div)):
+            if type(a) != _Quantity or type(b) != _Quantity:
+                return UNKNOWN
+            if isinstance(op, ast.Mult):
+                if a.is_vector and b.is_vector:
+                    self._error(node, 'can only multipy vectors with scalars')
+                    return UNKNOWN
+                code = a.code + b.code
+            else:
+                if b.is_vector:
+                    self._error(node, 'can only divide vectors by scalars')
+                    return UNKNOWN
+                code = a.code - b.code
+            return _Quantity(code, a.is_vector or b.is_vector, a.zero or
+                             (isinstance(op, ast.Mult) and b.zero))
+        if isinstance(op, ast.Pow):
+            if type(a) != _Quantity or type(b) != _Quantity:
+                return UNKNOWN
+            if b.code != 0:
+                self._error(node, 'you cannot take quantity to a power with dimensions %s' % b)
+                return UNKNOWN
+            if a.is_vector:
+                self._error(node, 'you cannot take a vector to a power')
+                return UNKNOWN
+            if a.code == 0:
+                return _number()
+            exponent = _constant_exponent(getattr(node, 'right', None))
+            if exponent is None:
+                self._unchecked_line()
+                return UNKNOWN
+            try:
+                return _Quantity(_pow_units(a.code, exponent))
+            except Exception as err:
+                self._error(node, str(err))
+                return UNKNOWN
+        return UNKNOWN
+
+    def _call(self, e, env):
+        args = [self._expr(a, env) for a in e.args]
+        kwargs = dict((k.arg, self._expr(k.value, env)) for k in e.keywords)
+        f = e.func
+        if isinstance(f, ast.Attribute):
+            owner = self._expr(f.value, env)
+            module = _dotted(f.value)
+            if module in self._modules and module not in env:
+                for a, t in zip(e.args, args):
+                    self._match(a, 'argument to %s.%s must be dimensionless'
+                                % (module, f.attr), [t, _number()])
+                return _number()
+            return self._method(e, owner, f.attr, args)
+        if not isinstance(f, ast.Name):
+            self._expr(f, env)
+            return UNKNOWN
+        name = f.id
+        if name in env and type(env[name]) == _Function:
+            return self._user_function(e, env[name], args, kwargs, env)
+        if name in env:
+            return UNKNOWN
+        if name == 'vector':
+            components = args[:3]
+            if len(components) != 3:
+                return UNKNOWN
+            self._match(e, 'vector components must have same dimensions', components)
+            code = 0
+            for c in components:
+                if c is UNKNOWN or type(c) != _Quantity or c.is_vector:
+                    return UNKNOWN
+                if c.code != 0:
+                    code = c.code
+            return _Quantity(code, True, all(c.zero for c in components))
+        if name in _DIMENSIONLESS_FUNCTIONS:
+            for a, t in zip(e.args, args):
+                self._match(a, 'argument to %s must be dimensionless' % name,
+                            [t, _number()])
+            return _number()
+        if name == 'atan2':
+            self._match(e, 'arguments to atan2 must have the same units', args)
+            return _number()
+        if name == 'sqrt':
+            if len(args) == 1 and type(args[0]) == _Quantity:
+                if args[0].is_vector:
+                    self._error(e, 'you cannot take the square root of a vector')
+                    return UNKNOWN
+                return _Quantity(_pow_units(args[0].code, 0.5))
+            return UNKNOWN
+        if name == 'abs':
+            if len(args) == 1 and type(args[0]) == _Quantity:
+                return _Quantity(args[0].code)
+            return UNKNOWN
+        if name in ('max', 'min'):
+            self._match(e, 'can only compare values with same dimensions', args)
+            return args[0] if len(args) == 1 else _join(args[0], args[1]) \
+                if len(args) == 2 else UNKNOWN
+        if name == 'timestep':
+            self._match(e, 'time step dt must be a time', args + [_Quantity(_SECOND)])
+            return UNKNOWN
+        if name in _OBJECTS:
+            return self._create(e, name, args, kwargs)
+        if name in ('len', 'range'):
+            return _number()
+        return UNKNOWN
+
+    def _create(self, e, name, args, kwargs):
+        '''Check the arguments used to create a sphere or other object.'''
+        params, required = _OBJECTS[name]
+        given = dict(zip(params, args))
+        given.update(kwargs)
+        attrs = {}
+        for p in params:
+            if p not in given:
+                if p in required:
+                    attrs[p] = required[p]
+                continue
+            t = given[p]
+            if p in ('pos1', 'pos2', 'object'):
+                t = _position(t)
+                self._match(e, 'position must be a distance', [t, _Quantity(_METER)])
+            elif p in required:
+                if p == 'pos':
+                    err = 'position must have dimensions of distance'
+                elif name == 'box':
+                    err = 'box dimensions must be distances'
+                elif name == 'trail':
+                    err = '%s must be a time' % p
+                else:
+                    err = '%s must have dimensions of distance' % p
+                self._match(e, err, [t, required[p]])
+                if type(t) == _Quantity and not t.zero:
+                    t = _Quantity(t.code, t.is_vector)
+                else:
+                    t = required[p]
+            attrs[p] = t
+        return _Object(attrs)
+
+    def _method(self, e, owner, method, args):
+        if type(owner) != _Quantity or not owner.is_vector:
+            return UNKNOWN
+        if method in ('dot', 'cross'):
+            if len(args) != 1 or type(args[0]) != _Quantity:
+                return UNKNOWN
+            if not args[0].is_vector:
+                self._error(e, 'cannot take %s product of vector with a scalar'
+                            % method)
+                return UNKNOWN
+            return _Quantity(owner.code + args[0].code, method == 'cross')
+        if method == 'normalized':
+            return _Quantity(0, True)
+        if method == 'copy':
+            return owner
+        if method == 'abs':
+            return _Quantity(owner.code)
+        return UNKNOWN
+
+    def _user_function(self, e, f, args, kwargs, env):
+        '''Check a function defined in the script, using the types of the
+        arguments it is called with.'''
+        node = f.node
+        if node in self._functions_in_progress:
+            return UNKNOWN
+        local = dict(env)
+        params = [a.arg if hasattr(a, 'arg') else a.id for a in node.args.args]
+        for p in params:
+            local[p] = UNKNOWN
+        for p, t in zip(params, args):
+            local[p] = t
+        for p, t in kwargs.items():
+            if p in params:
+                local[p] = t
+        local.pop('return', None)
+        line = self._line
+        self._functions_in_progress.add(node)
+        try:
+            self._run(node.body, local)
+        finally:
+            self._functions_in_progress.discard(node)
+            self._line = line
+        return local.get('return', UNKNOWN)
+
+def _dotted(e):
+    '''The dotted name of an expression such as "wizard.pos.x".'''
+    if isinstance(e, ast.Name):
+        return e.id
+    if isinstance(e, ast.Attribute):
+        inner = _dotted(e.value)
+        if inner is not None:
+            return inner + '.' + e.attr
+    return None
+
+def _position(t):
+    if type(t) == _Object:
+        return t.attrs.get('pos', UNKNOWN)
+    return t
+
+def _is_number(e):
+    if hasattr(ast, 'Constant') and isinstance(e, ast.Constant):
+        return type(e.value) in (int, float) and type(e.value) != bool
+    return hasattr(ast, 'Num') and isinstance(e, ast.Num)
+
+def _number_value(e):
+    return e.value if hasattr(e, 'value') else e.n
+
+def _constant_exponent(e):
+    if e is None:
+        return None
+    if _is_number(e):
+        return _number_value(e)
+    if isinstance(e, ast.UnaryOp) and isinstance(e.op, ast.USub):
+        v = _constant_exponent(e.operand)
+        return None if v is None else -v
+    if isinstance(e, ast.BinOp) and isinstance(e.op, ast.Div):
+        a = _constant_exponent(e.left)
+        b = _constant_exponent(e.right)
+        if a is not None and b:
+            return a/b
+    return None
+
+def infer_units(source, filename='<script>'):
+    """Check the units in the source code of a script.
+
+    Args:
+        source: the text of the script
+        filename: the name of the script, used in error messages
+    Returns:
+        an object with an `errors` attribute holding a list of (line
+        number, message) pairs, and a `proven` attribute holding the
+        line numbers on which the units were proven consistent.
+
+    .. doctest :: infer
+
+        >>> from physical.infer import infer_units
+        >>> r = infer_units('''
+        ... x = 3*meter
+        ... t = 2*second
+        ... v = x/t
+        ... bad = x + v
+        ... ''')
+        >>> r.errors
+        [(5, 'you cannot add quantities with differing units: meter and meter*second**(-1)')]
+    """
+    tree = ast.parse(source, filename)
+    result = _Inference(filename)
+    result._run(tree.body, _known_names())
+    result.proven = sorted(result._checked - result._unchecked)
+    return result
+
+def write_manifest(result, path):
+    """Save the lines proven consistent by `infer_units` to a file,
+    as JSON giving the full name of the script and a list of the line
+    numbers.  Nothing in physical reads this file.
+
+    Args:
+        result: the value returned by `infer_units`
+        path: the name of the manifest file to write
+    """
+    with open(path, 'w') as f:
+        json.dump({'filename': os.path.abspath(result.filename),
+                   'proven': result.proven}, f, indent=1)
+
+def main(argv=None):
+    '''Check the units of the scripts named on the command line.'''
+    if argv is None:
+        argv = sys.argv[1:]
+    manifest = None
+    if '--manifest' in argv:
+        i = argv.index('--manifest')
+        if i + 1 >= len(argv):
+            print('--manifest requires a file name')
+            return 2
+        manifest = argv[i+1]
+        argv = argv[:i] + argv[i+2:]
+    if len(argv) != 1:
+        print('usage: python -m physical.infer script.py [--manifest FILE]')
+        return 2
+    filename = argv[0]
+    with open(filename) as f:
+        result = infer_units(f.read(), filename)
+    for line, message in sorted(result.errors):
+        print('%s:%d: %s' % (filename, line, message))
+    print('%s: %d unit errors, %d lines proven consistent'
+          % (filename, len(result.errors), len(result.proven)))
+    if manifest is not None:
+        write_manifest(result, manifest)
+    return 1 if result.errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,755 @@
+"""The physical.integrators module advances the positions and
+velocities of objects through many time steps at once, which is much
+faster than updating `pos` and `v` in a Python loop, since the units
+are checked only once, and each step is done with a few operations on
+arrays.
+
+.. testcode :: integrators
+
+    from physical.integrators import integrate
+
+    k = 4*Newton/meter
+    balls = particles([vector(1,0,0)*meter, vector(0,2,0)*meter])
+    # half a period of oscillation on a spring
+    integrate(balls, lambda pos, v: -k*pos, 0.01*second, steps=157)
+
+.. doctest :: integrators
+
+    >>> abs(balls.pos[0] - vector(-1,0,0)*meter) < 1e-5*meter
+    True
+
+"""
+
+from __future__ import division, print_function
+
+__all__ = ('integrate', 'AdaptiveIntegrator', 'ImplicitIntegrator',
+           'MultirateIntegrator')
+
+import numpy
+
+from physical import (vector, scalar, VectorArray, QuantityArray, check_units,
+                      units, value, meter, second, kg, Newton)
+
+def _wrap(data, mks):
+    '''A VectorArray holding data, without copying or checking.'''
+    v = VectorArray.__new__(VectorArray)
+    v._mks = mks
+    v._data = data
+    return v
+
+class _State(object):
+    '''The positions, velocities and masses of a system as arrays of
+    numbers, in meters, meters per second and kg.'''
+    def __init__(self, system):
+        if not hasattr(system, 'v'):
+            raise Exception('%s must have a velocity v to be integrated' % (system,))
+        if not hasattr(system, 'm'):
+            raise Exception('%s must have a mass m to be integrated' % (system,))
+        self.system = system
+        pos = system.pos
+        v = system.v
+        self.single = type(pos) == vector
+        if self.single:
+            pos = VectorArray([pos])
+            v = VectorArray([v])
+        elif type(pos) != VectorArray:
+            pos = VectorArray(pos)
+        if type(v) != VectorArray:
+            v = VectorArray(v)
+        check_units('position must have dimensions of distance', pos, meter)
+        check_units('velocity must have dimensions of distance/time', v, meter/second)
+        m = system.m
+        check_units('mass must have dimensions of mass', m, kg)
+        self.x = pos._data.copy()
+        self.u = v._data.copy()
+        self.m = numpy.asarray(value(m), dtype=float)
+        if self.m.ndim == 1:
+            self.m = self.m[:,numpy.newaxis]
+
+    def vectors(self, data, units):
+        '''The data as a VectorArray, or as a vector for a single object.'''
+        if self.single:
+            return vector(data[0,0], data[0,1], data[0,2], units)
+        return _wrap(data, units)
+
+    def numbers(self, F):
+        '''The numbers of a VectorArray or vector.'''
+        if type(F) == vector:
+            return numpy.array([[F._x, F._y, F._z]])
+        return F._data
+
+    def store(self, F=None):
+        '''Put the positions and velocities (and the force F, if given)
+        back into the system.'''
+        self.system.pos = self.vectors(self.x, meter._mks)
+        self.system.v = self.vectors(self.u, (meter/second)._mks)
+        if F is not None and hasattr(self.system, 'F'):
+            # the force may be a single vector acting on every particle
+            F = numpy.broadcast_to(F, self.x.shape).copy()
+            self.system.F = self.vectors(F, Newton._mks)
+
+def _euler(x, u, a, accel, dt):
+    x = x + u*dt
+    u = u + a*dt
+    return x, u, accel(x, u)
+
+def _semi_implicit(x, u, a, accel, dt):
+    u = u + a*dt
+    x = x + u*dt
+    return x, u, accel(x, u)
+
+def _verlet(x, u, a, accel, dt):
+    u = u + a*(0.5*dt)
+    x = x + u*dt
+    a = accel(x, u)
+    return x, u + a*(0.5*dt), a
+
+def _rk4(x, u, a, accel, dt):
+    u2 = u + a*(0.5*dt)
+    a2 = accel(x + u*(0.5*dt), u2)
+    u3 = u + a2*(0.5*dt)
+    a3 = accel(x + u2*(0.5*dt), u3)
+    u4 = u + a3*dt
+    a4 = accel(x + u3*dt, u4)
+    x = x + (u + 2*u2 + 2*u3 + u4)*(dt/6)
+    u = u + (a + 2*a2 + 2*a3 + a4)*(dt/6)
+    return x, u, accel(x, u)
+
+_methods = {
+    'euler': _euler,
+    'semi-implicit': _semi_implicit,
+    'verlet': _verlet,
+    'rk4': _rk4,
+}
+
+def integrate(system, force_fn, dt, method='verlet', steps=1, constraints=None):
+    '''Advance the positions and velocities of a system through many
+    time steps.
+
+    The system may be a particle set, or any object with a position
+    `pos`, velocity `v` and mass `m`, such as a sphere.  If it has a
+    force `F`, this is set to the force at the end.  The units are
+    checked when `integrate` is called, after which each step is done
+    with plain arrays of numbers.
+
+    Args:
+        system: the object or particle set to move
+        force_fn: a function `force_fn(pos, v)` giving the force on
+            each particle from the positions and velocities, which are
+            VectorArrays (or vectors, when the system is a single object).
+            It may also give a single vector, which acts on every particle.
+        dt: the time step
+        method: one of `'euler'`, `'semi-implicit'` (the symplectic
+            Euler method, updating the velocity first), `'verlet'`
+            (velocity Verlet) or `'rk4'` (fourth order Runge-Kutta).
+            The semi-implicit and Verlet methods do not drift in
+            energy, and so may take much larger steps for orbits.
+        steps: the number of time steps to take
+        constraints: DistanceConstraints holding particles of the
+            system at fixed distances, which are enforced after each
+            step with the SHAKE and RATTLE algorithms.  This requires
+            the Verlet method.
+    Raises:
+        Exception: the dimensions are wrong, or the method is unknown
+    '''
+    check_units('time step must have dimensions of time', dt, second)
+    if method not in _methods:
+        raise Exception('unknown method %r, which should be one of %s'
+                        % (method, ', '.join(sorted(_methods))))
+    if constraints is not None:
+        if method != 'verlet':
+            raise Exception('constraints require the verlet method, not %r' % (method,))
+        if constraints.particles is not system:
+            raise Exception('the constraints must join particles of the system')
+    state = _State(system)
+    v_units = (meter/second)._mks
+    F = force_fn(state.vectors(state.x, meter._mks), state.vectors(state.u, v_units))
+    if type(F) != VectorArray and type(F) != vector:
+        raise Exception('the force must be a VectorArray or vector, not %s' % type(F))
+    check_units('the force function must give a force', F, Newton)
+    m = state.m
+    def accel(x, u):
+        return state.numbers(force_fn(state.vectors(x, meter._mks),
+                                      state.vectors(u, v_units)))/m
+    step = _methods[method]
+    if constraints is not None:
+        w = numpy.broadcast_to(1/m, (len(state.x), 1))[:,0]
+        def step(x, u, a, accel, dt):
+            u = u + a*(0.5*dt)
+            moved = constraints._correct_positions(x, x + u*dt, w)
+            u = (moved - x)/dt
+            a = accel(moved, u)
+            return moved, constraints._correct_velocities(moved, u + a*(0.5*dt), w), a
+    x, u, a = state.x, state.u, state.numbers(F)/m
+    dt = value(dt)
+    for i in range(steps):
+        x, u, a = step(x, u, a, accel, dt)
+    state.x = x
+    state.u = u
+    state.store(a*m)
+
+# The Dormand-Prince coefficients: the matrix a, whose last row gives
+# the fifth order solution, the difference e between the fifth and
+# fourth order solutions, and the coefficients d of the interpolation
+# between the start and end of a step.
+_a = ((),
+      (1/5,),
+      (3/40, 9/40),
+      (44/45, -56/15, 32/9),
+      (19372/6561, -25360/2187, 64448/6561, -212/729),
+      (9017/3168, -355/33, 46732/5247, 49/176, -5103/18656),
+      (35/384, 0, 500/1113, 125/192, -2187/6784, 11/84))
+_e = (71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40)
+_d = (-12715105075/11282082432, 0, 87487479700/32700410799,
+      -10690763975/1880347072, 701980252875/199316789632,
+      -1453857185/822651844, 69997945/29380423)
+
+def _combine(coefficients, ks):
+    return sum(c*k for c, k in zip(coefficients, ks) if c)
+
+class _Step(object):
+    '''A step taken by the AdaptiveIntegrator, which can give the
+    positions and velocities at any time during the step.'''
+    def __init__(self, t, h, x, u, kx, ku):
+        self.t = t
+        self.h = h
+        self.end = t + h
+        self.x_end = x + h*_combine(_a[6], kx)
+        self.u_end = kx[6]
+        self.a_end = ku[6]
+        self.__x = self.__dense(x, self.x_end, kx)
+        self.__u = self.__dense(u, self.u_end, ku)
+    def __dense(self, y, y_end, k):
+        change = y_end - y
+        slope = self.h*k[0] - change
+        return (y, change, slope, change - self.h*k[6] - slope,
+                self.h*_combine(_d, k))
+    def at(self, t):
+        '''The positions and velocities at time t.'''
+        theta = (t - self.t)/self.h
+        def interpolate(y, change, slope, curve, correction):
+            return y + theta*(change + (1 - theta)*(slope + theta*(curve + (1 - theta)*correction)))
+        return interpolate(*self.__x), interpolate(*self.__u)
+
+class _Event(object):
+    '''A condition watched by the AdaptiveIntegrator.'''
+    def __init__(self, condition, callback, direction, tolerance):
+        self.condition = condition
+        self.callback = callback
+        self.direction = direction
+        self.tolerance = tolerance
+        self.units = None
+        self.last = None # the value at the current time
+    def value(self, system):
+        g = self.condition(system)
+        if type(g) != scalar and not isinstance(g, (int, float)):
+            raise Exception('an event condition must give a scalar, not %s' % (g,))
+        if self.units is None:
+            self.units = units(g)
+        elif units(g) != self.units and g != 0:
+            raise Exception('an event condition must always have the same dimensions: %s vs %s'
+                            % (g, scalar(1, self.units)))
+        return value(g)
+    def crossed(self, before, after):
+        return ((self.direction >= 0 and before < 0 <= after) or
+                (self.direction <= 0 and before > 0 >= after))
+
+class AdaptiveIntegrator(object):
+    '''An integrator that chooses its own time step, taking large steps
+    where the motion is smooth and small ones where it changes
+    quickly, so as to keep the error of each step within a tolerance.
+    It uses the fifth order Dormand-Prince method, whose fourth order
+    companion solution gives an estimate of the error.
+
+    Call `advance` once for each frame of an animation, followed by
+    `timestep` with the same time, so that the animation keeps pace
+    with the simulated time.  A step may be longer than a frame, in
+    which case the positions and velocities in the frames during the
+    step are interpolated, without computing any more forces.  If you
+    change the position or velocity between frames (for instance to
+    make a ball bounce), the next frame starts a new step from there.
+
+    .. code-block :: python
+
+        solver = AdaptiveIntegrator(lambda pos, v: ball.m*g + drag(v))
+        while ball.pos.z > 0*meter:
+            solver.advance(ball, 0.03*second)
+            timestep(0.03*second)
+
+    Args:
+        force_fn: a function `force_fn(pos, v)` giving the force on
+            each particle, as for `integrate`
+        atol: the error allowed in each position
+        atol_v: the error allowed in each velocity
+        rtol: the error allowed relative to each position or velocity
+        max_step: the longest step allowed, if any
+    Raises:
+        Exception: the tolerances or max_step have the wrong dimensions
+    '''
+    def __init__(self, force_fn, atol=1e-6*meter, atol_v=1e-6*meter/second,
+                 rtol=1e-6, max_step=None):
+        check_units('atol must have dimensions of distance', atol, meter)
+        check_units('atol_v must have dimensions of distance/time', atol_v, meter/second)
+        check_units('rtol must be dimensionless', rtol, 1)
+        if max_step is not None:
+            check_units('max_step must have dimensions of time', max_step, second)
+        self.force_fn = force_fn
+        self.atol = atol
+        self.atol_v = atol_v
+        self.rtol = rtol
+        self.max_step = max_step
+        #: the total time advanced so far
+        self.t = 0*second
+        #: the number of times force_fn has been called
+        self.evaluations = 0
+        #: the number of steps that were taken again with a smaller step
+        self.rejected = 0
+        self.__times = []
+        self.__steps = []
+        self.__h = None # the step to try next, in seconds
+        self.__step = None # the step we are in the middle of
+        self.__events = []
+        #: the time and condition of each event that has happened
+        self.events = []
+        self.__left = None # the positions and velocities we left in the system
+
+    @property
+    def times(self):
+        '''the time at the start of each step taken, as a QuantityArray'''
+        return QuantityArray(numpy.array(self.__times, dtype=float), second._mks)
+    @property
+    def step_sizes(self):
+        '''the size of each step taken, as a QuantityArray'''
+        return QuantityArray(numpy.array(self.__steps, dtype=float), second._mks)
+
+    def add_event(self, condition, callback=None, direction=0, tolerance=1e-9*second):
+        '''Watch for the moment when a condition passes through zero,
+        such as when a ball reaches the ground.  The moment is found
+        to within the tolerance by bisection, using the interpolation
+        within a step, so the steps need not be small to catch it.
+
+        .. code-block :: python
+
+            def bounce(ball):
+                ball.v = vector(ball.v.x, ball.v.y, -ball.v.z)
+            solver.add_event(lambda ball: ball.pos.z, bounce, direction=-1)
+
+        Args:
+            condition: a function `condition(system)` giving a scalar,
+                which must always have the same dimensions
+            callback: a function `callback(system)` called with the
+                system as it is at the moment of the event.  It may
+                change the positions or velocities, and if it returns
+                True, `advance` stops at the moment of the event.
+            direction: 1 to watch only for the condition rising through
+                zero, -1 to watch only for it falling through zero, or
+                0 to watch for both
+            tolerance: how precisely to find the time of the event
+        Raises:
+            Exception: the tolerance is not a time
+        '''
+        check_units('event tolerance must have dimensions of time', tolerance, second)
+        self.__events.append(_Event(condition, callback, direction, value(tolerance)))
+
+    def advance(self, system, duration):
+        '''Advance the positions and velocities of a system by a given
+        time, in as many steps as are needed.  Unlike `integrate`, this
+        does not set the force `F` of the system.
+
+        Args:
+            system: the object or particle set to move, as for `integrate`
+            duration: the time to advance
+        Returns:
+            True if the callback of an event stopped the motion before
+            the end of the duration, in which case `t` is the time of
+            the event, and False otherwise
+        Raises:
+            Exception: the dimensions are wrong
+        '''
+        check_units('duration must have dimensions of time', duration, second)
+        state = _State(system)
+        v_units = (meter/second)._mks
+        force_fn = self.force_fn
+        m = state.m
+        def accel(x, u):
+            self.evaluations += 1
+            return numpy.broadcast_to(state.numbers(force_fn(state.vectors(x, meter._mks),
+                                                             state.vectors(u, v_units)))/m,
+                                      x.shape)
+        t = value(self.t)
+        end = t + value(duration)
+        step = self.__step
+        if step is not None and not (numpy.array_equal(state.x, self.__left[0]) and
+                                     numpy.array_equal(state.u, self.__left[1])):
+            step = None # someone has moved things, so we start afresh
+        if step is None:
+            F = force_fn(state.vectors(state.x, meter._mks), state.vectors(state.u, v_units))
+            if type(F) != VectorArray and type(F) != vector:
+                raise Exception('the force must be a VectorArray or vector, not %s' % type(F))
+            check_units('the force function must give a force', F, Newton)
+            self.evaluations += 1
+            x, u = state.x, state.u
+            a = numpy.broadcast_to(state.numbers(F)/m, x.shape)
+        for e in self.__events:
+            e.last = e.value(system)
+        while True:
+            if step is None:
+                step = self.__take_step(t, x, u, a, accel)
+            if self.__events:
+                event = self.__find_event(step, t, min(step.end, end), state)
+                if event is not None:
+                    t = event.time
+                    self.events.append((scalar(t, second._mks), event.condition))
+                    state.x, state.u = step.at(t)
+                    state.store()
+                    stop = event.callback is not None and event.callback(system)
+                    moved = _State(system)
+                    if not (numpy.array_equal(moved.x, state.x) and
+                            numpy.array_equal(moved.u, state.u)):
+                        # the callback changed the motion, so we must
+                        # start a new step from here.
+                        state = moved
+                        x, u = state.x, state.u
+                        a = accel(x, u)
+                        step = None
+                    for e in self.__events:
+                        e.last = e.value(system)
+                    # The state is a hair past the moment the condition
+                    # was zero, so we count it as zero, lest a bounce
+                    # back across zero look like a second event.
+                    event.last = 0.0
+                    if stop:
+                        self.__step = step
+                        self.__left = (state.x.copy(), state.u.copy())
+                        self.t = scalar(t, second._mks)
+                        return True
+                    continue
+            if step.end >= end:
+                break
+            t, x, u, a = step.end, step.x_end, step.u_end, step.a_end
+            step = None
+        state.x, state.u = step.at(end)
+        self.__step = step
+        self.__left = (state.x.copy(), state.u.copy())
+        self.t = scalar(end, second._mks)
+        state.store()
+        return False
+
+    def __find_event(self, step, start, stop, state):
+        '''Find the first event between start and stop, which are
+        within step, returning None if there is none.'''
+        def move_to(t):
+            state.x, state.u = step.at(t)
+            state.store()
+            return state.system
+        move_to(stop)
+        first = None
+        for e, after in zip(self.__events, [e.value(state.system) for e in self.__events]):
+            if e.crossed(e.last, after):
+                lo, hi, before = start, stop, e.last
+                while hi - lo > e.tolerance:
+                    middle = 0.5*(lo + hi)
+                    here = e.value(move_to(middle))
+                    if e.crossed(before, here):
+                        hi = middle
+                    else:
+                        lo, before = middle, here
+                if first is None or hi < first.time:
+                    first = e
+                    e.time = hi
+            e.after = after
+        if first is None:
+            for e in self.__events:
+                e.last = e.after
+        return first
+
+    def __take_step(self, t, x, u, a, accel):
+        '''Take one step from time t, as long as the error allows.'''
+        atol, atol_v, rtol = value(self.atol), value(self.atol_v), value(self.rtol)
+        def size(dx, du, x_new=x, u_new=u):
+            '''How large dx and du are compared with the tolerances.'''
+            return numpy.sqrt(
+                ((dx/(atol + rtol*numpy.maximum(abs(x), abs(x_new))))**2).mean()
+                + ((du/(atol_v + rtol*numpy.maximum(abs(u), abs(u_new))))**2).mean())
+        h = self.__h
+        if h is None:
+            # A first guess, which is corrected after the first step.
+            h = 0.01*size(x, u)/size(u, a) if size(u, a) > 0 else 1e-6
+        if self.max_step is not None:
+            h = min(h, value(self.max_step))
+        while True:
+            kx = [u]
+            ku = [a]
+            for i in range(1, 7):
+                ui = u + h*_combine(_a[i], ku)
+                kx.append(ui)
+                ku.append(accel(x + h*_combine(_a[i], kx), ui))
+            error = size(h*_combine(_e, kx), h*_combine(_e, ku),
+                         x + h*_combine(_a[6], kx), kx[6])
+            factor = 5.0 if error == 0 else min(5.0, max(0.2, 0.9*error**-0.2))
+            if error <= 1:
+                self.__times.append(t)
+                self.__steps.append(h)
+                self.__h = h*factor
+                return _Step(t, h, x, u, kx, ku)
+            self.rejected += 1
+            h *= factor
+
+def _conjugate_gradient(apply, b, preconditioner, tolerance, limit):
+    '''Solve apply(x) = b for x, where apply is a symmetric positive
+    definite linear function, returning x and the number of iterations,
+    or None if apply turns out not to be positive definite.'''
+    x = numpy.zeros_like(b)
+    r = b.copy()
+    z = r/preconditioner
+    p = z.copy()
+    rz = (r*z).sum()
+    goal = tolerance**2*(b*b).sum()
+    for iteration in range(limit):
+        if (r*r).sum() <= goal:
+            return x, iteration
+        Ap = apply(p)
+        pAp = (p*Ap).sum()
+        if pAp <= 0:
+            return None, iteration
+        alpha = rz/pAp
+        x += alpha*p
+        r -= alpha*Ap
+        z = r/preconditioner
+        rz, rz_old = (r*z).sum(), rz
+        p = z + (rz/rz_old)*p
+    return x, limit
+
+class ImplicitIntegrator(object):
+    '''An integrator for particles joined by stiff springs, which stays
+    stable with time steps much longer than the period of vibration of
+    the springs, for which `integrate` would blow up.
+
+    Each step finds the velocity at the end of the step (or at its
+    middle) that agrees with the forces at the end (or middle) of the
+    step, by Newton's method using the stiffness matrix of the
+    springs.  Each iteration solves a sparse set of linear equations
+    by the conjugate gradient method.  The backward Euler method damps
+    vibrations that are too fast for the time step, which may be
+    checked with `damping`, and remains stable however long the step.
+    The implicit midpoint method keeps the energy of vibrations, but
+    not their phase, and may fail to converge for steps much longer
+    than the period of vibration.
+
+    .. code-block :: python
+
+        lattice = SpringNetwork(springs, 10*Newton/meter)
+        solver = ImplicitIntegrator(lattice)
+        while True:
+            solver.advance(balls, 0.03*second)
+            timestep(0.03*second)
+
+    Args:
+        network: the SpringNetwork whose springs are treated implicitly
+        force_fn: a function `force_fn(pos, v)` giving any other forces
+            on the particles, as for `integrate`, which are treated
+            explicitly
+        method: either `'backward-euler'` or `'implicit-midpoint'`
+        tolerance: the accuracy to which the equations are solved,
+            relative to their size
+    Raises:
+        Exception: the method is unknown
+    '''
+    def __init__(self, network, force_fn=None, method='backward-euler', tolerance=1e-5):
+        if method not in ('backward-euler', 'implicit-midpoint'):
+            raise Exception("unknown method %r, which should be 'backward-euler'"
+                            " or 'implicit-midpoint'" % (method,))
+        self.network = network
+        self.force_fn = force_fn
+        self.method = method
+        self.tolerance = tolerance
+        #: the most iterations of Newton's method taken in a step
+        self.newton_limit = 10
+        #: the number of conjugate gradient iterations in the last step
+        self.iterations = 0
+        #: the fraction of the energy of the springs and the motion of
+        #: the particles lost during the last call to advance, which is
+        #: the damping caused by the method when there are no other forces
+        self.damping = 0
+
+    def __energy(self, x, u, m):
+        return (0.5*(m*u**2).sum()
+                + value(self.network.energy(_wrap(x, meter._mks))))
+
+    def __solve(self, x, b, c, m):
+        '''Solve (m - c**2*K)*dv = b for dv, where K is the stiffness
+        matrix of the springs at positions x.'''
+        # Compressed springs can make the equations impossible to
+        # solve this way, in which case we solve them without the
+        # sideways forces of the compressed springs.
+        for definite in (False, True):
+            K = self.network.stiffness_matrix(_wrap(x, meter._mks), definite)
+            def apply(dv):
+                return m*dv - c*c*K.dot(dv)
+            dv, iterations = _conjugate_gradient(apply, b, m - c*c*K.diagonal(),
+                                                 self.tolerance, 10*len(x) + 100)
+            self.iterations += iterations
+            if dv is not None:
+                return dv
+        raise Exception('the stiffness matrix of the springs is not definite')
+
+    def advance(self, system, dt, steps=1):
+        '''Advance the positions and velocities of a system.
+
+        Args:
+            system: the particle set joined by the springs
+            dt: the time step
+            steps: the number of time steps to take
+        Raises:
+            Exception: the dimensions are wrong
+        '''
+        check_units('time step must have dimensions of time', dt, second)
+        state = _State(system)
+        x, u = state.x, state.u
+        m = numpy.broadcast_to(state.m, x.shape)
+        v_units = (meter/second)._mks
+        other = self.force_fn
+        if other is not None:
+            F = other(_wrap(x, meter._mks), _wrap(u, v_units))
+            check_units('the force function must give a force', F, Newton)
+        def force(x, u):
+            F = self.network.forces(_wrap(x, meter._mks))._data
+            if other is not None:
+                F = F + state.numbers(other(_wrap(x, meter._mks), _wrap(u, v_units)))
+            return F
+        # We solve for a velocity w, which is the velocity at the end
+        # of the step for the backward Euler method, and at the middle
+        # of the step for the midpoint method, such that
+        #     m*(w - u) = c*F(x + c*w, w)
+        # where c is dt or dt/2, using Newton's method.
+        h = value(dt)
+        c = h/2 if self.method == 'implicit-midpoint' else h
+        before = self.__energy(x, u, m)
+        for i in range(steps):
+            w = u
+            self.iterations = 0
+            for newton in range(self.newton_limit):
+                xw = x + c*w
+                residual = c*force(xw, w) - m*(w - u)
+                dw = self.__solve(xw, residual, c, m)
+                w = w + dw
+                if (dw**2).sum() <= self.tolerance**2*(w**2).sum():
+                    break
+            x = x + h*w
+            u = 2*w - u if self.method == 'implicit-midpoint' else w
+        after = self.__energy(x, u, m)
+        self.damping = (before - after)/before if before > 0 else 0
+        state.x = x
+        state.u = u
+        state.store()
+
+class MultirateIntegrator(object):
+    '''An integrator for forces that change on very different time
+    scales, such as stiff springs joining neighboring atoms together
+    with the weaker forces between all the atoms, which are expensive
+    to compute but change slowly.  Each force is computed only as often
+    as it asks to be, and its effect over that time is applied as two
+    kicks to the velocities, at the start and end of its interval (the
+    r-RESPA method).  With only one force this is the velocity Verlet
+    method, and like it, does not drift in energy.
+
+    .. code-block :: python
+
+        solver = MultirateIntegrator()
+        solver.add_force(lambda pos, v: bonds.forces(pos))
+        solver.add_force(lambda pos, v: repulsion.forces(pos), every=5)
+        while True:
+            solver.advance(balls, 0.002*second, steps=5)
+            timestep(0.01*second)
+
+    The forces found at the end of one call to `advance` are used again
+    at the start of the next, unless you have changed the positions,
+    velocities or masses in between, so that a call per frame costs no
+    more than one long call.  If a force depends on anything else, such
+    as the time or a spring constant that you change between frames,
+    call `reset` after changing it.
+    '''
+    def __init__(self):
+        self.__forces = []
+        #: the number of times each force has been computed
+        self.evaluations = []
+        # the system, its positions, velocities and masses when we
+        # left it, and the accelerations there
+        self.__left = None
+
+    def add_force(self, force_fn, every=1):
+        '''Add a force to the integrator.
+
+        Args:
+            force_fn: a function `force_fn(pos, v)` giving the force on
+                each particle, as for `integrate`
+            every: the number of steps between computing this force
+        Raises:
+            Exception: every is not a positive whole number
+        '''
+        if every != int(every) or every < 1:
+            raise Exception('every must be a positive whole number of steps, not %s' % (every,))
+        self.__forces.append((force_fn, int(every)))
+        self.evaluations.append(0)
+
+    def reset(self):
+        '''Compute every force afresh at the start of the next call to
+        `advance`, rather than using the forces found at the end of the
+        last one.'''
+        self.__left = None
+
+    def advance(self, system, dt, steps=1):
+        '''Advance the positions and velocities of a system.
+
+        Args:
+            system: the object or particle set to move, as for `integrate`
+            dt: the shortest time step, for the forces computed every step
+            steps: the number of shortest time steps to take, which must
+                be a multiple of the interval of every force
+        Raises:
+            Exception: the dimensions are wrong, or the steps are not a
+                multiple of the interval of some force
+        '''
+        check_units('time step must have dimensions of time', dt, second)
+        for force_fn, every in self.__forces:
+            if steps % every:
+                raise Exception('steps must be a multiple of %d, the steps between computing %s'
+                                % (every, force_fn))
+        state = _State(system)
+        x, u, m = state.x, state.u, state.m
+        v_units = (meter/second)._mks
+        def accel(k, x, u):
+            self.evaluations[k] += 1
+            F = self.__forces[k][0](state.vectors(x, meter._mks), state.vectors(u, v_units))
+            return state.numbers(F)/m
+        # The accelerations at the end of the last call are still right
+        # if the system has not been changed since (and the forces do
+        # not depend on anything else), and only forces added since
+        # then need to be computed.
+        a = []
+        left = self.__left
+        if left is not None and left[0] is system and numpy.array_equal(x, left[1]) and \
+           numpy.array_equal(u, left[2]) and numpy.array_equal(m, left[3]):
+            a = list(left[4])
+        # Check the units of each force the first time we compute it.
+        for k, (force_fn, every) in enumerate(self.__forces[len(a):], len(a)):
+            F = force_fn(state.vectors(x, meter._mks), state.vectors(u, v_units))
+            if type(F) != VectorArray and type(F) != vector:
+                raise Exception('the force must be a VectorArray or vector, not %s' % type(F))
+            check_units('the force function must give a force', F, Newton)
+            self.evaluations[k] += 1
+            a.append(state.numbers(F)/m)
+        dt = value(dt)
+        for n in range(steps):
+            for k, (force_fn, every) in enumerate(self.__forces):
+                if n % every == 0:
+                    u = u + a[k]*(0.5*every*dt)
+            x = x + u*dt
+            for k, (force_fn, every) in enumerate(self.__forces):
+                if (n + 1) % every == 0:
+                    a[k] = accel(k, x, u)
+                    u = u + a[k]*(0.5*every*dt)
+        state.x = x
+        state.u = u
+        state.store(sum(numpy.broadcast_to(ak, x.shape) for ak in a)*m if a else None)
+        self.__left = (system, x.copy(), u.copy(), m.copy(), a)
@@ -0,0 +1,343 @@
+"""The physical.nbody module computes forces that fall off as the
+inverse square of distance, such as gravity or the electrostatic
+(Coulomb) force, between every pair of many particles.  Adding up the
+force from every particle on every other particle takes a time
+proportional to the square of the number of particles, so instead the
+particles are sorted into a tree of cubes (an octree), and the force
+from a distant cube of particles is approximated by the force from a
+single particle holding their total mass or charge at their center.
+This is the Barnes-Hut algorithm.  When there are charges of both
+signs, the dipole moment of each cube is included as well, since a
+cube holding as much positive as negative charge has no total charge.
+
+How distant a cube must be is set by the opening angle `theta`: a
+cube is treated as a single particle when its width divided by its
+distance is less than `theta`.  A smaller `theta` gives a more
+accurate force and takes more time, and a `theta` of zero gives the
+exact sum over all pairs.
+
+.. testcode :: nbody
+
+    from physical.nbody import InverseSquareForce
+
+    G = 6.674e-11*Newton*meter**2/kg**2
+    gravity = InverseSquareForce(-G)
+    positions = VectorArray([vector(0,0,0), vector(1,0,0)])*meter
+    masses = QuantityArray([1, 2])*kg
+
+.. doctest :: nbody
+
+    >>> gravity.forces(positions, masses)
+    VectorArray([[1.3348e-10, 0.0, 0.0], [-1.3348e-10, 0.0, 0.0]]) meter*kg*second**(-2)
+    >>> gravity.forces(positions, 1*second)
+    Traceback (most recent call last):
+      ...
+    Exception: constant*charge**2/distance**2 must be a force: 1.0 meter*kg*second**(-2) vs -6.674e-11 meter*kg**(-1)
+
+"""
+
+from __future__ import division, print_function
+
+__all__ = ('InverseSquareForce',)
+
+import numpy
+
+from physical import (VectorArray, QuantityArray, scalar, check_units, units,
+                      value, meter, Newton)
+from physical.neighbors import _positions
+
+# The number of levels of the octree.  The cube at the bottom of the
+# tree is 2**-21 of the width of the top, and the position of a cube
+# fits in 63 bits.
+_DEPTH = 21
+
+# The number of leaves for which we compute forces at once, which
+# limits the memory used while walking the tree.
+_CHUNK = 256
+
+def _spread_bits(x):
+    '''Spread the lowest 21 bits of x so there are two zero bits
+    between each of them.'''
+    x = x.astype(numpy.uint64) & numpy.uint64(0x1fffff)
+    for shift, mask in ((32, 0x1f00000000ffff), (16, 0x1f0000ff0000ff),
+                        (8, 0x100f00f00f00f00f), (4, 0x10c30c30c30c30c3),
+                        (2, 0x1249249249249249)):
+        x = (x | (x << numpy.uint64(shift))) & numpy.uint64(mask)
+    return x
+
+def _expand(start, count):
+    '''The indices start[k] ... start[k]+count[k]-1 for every k, together
+    with the k each one came from.'''
+    which = numpy.repeat(numpy.arange(len(count)), count)
+    first = numpy.cumsum(count) - count
+    return which, numpy.repeat(start, count) + numpy.arange(count.sum()) - first[which]
+
+class _Level(object):
+    '''The cubes at one level of the octree.'''
+    __slots__ = ('width', 'shift', 'prefix', 'start', 'count', 'charge',
+                 'center', 'dipole', 'leaf', 'child_start', 'child_count')
+
+class _Octree(object):
+    '''An octree over the rows of data, with the particles sorted so
+    that those in each cube are contiguous.'''
+    def __init__(self, data, charges, leaf_size):
+        N = len(data)
+        lo = data.min(axis=0)
+        width = (data.max(axis=0) - lo).max()*(1 + 1e-9)
+        if width == 0:
+            width = 1.0
+        cells = numpy.clip(((data - lo)*(2**_DEPTH/width)).astype(numpy.int64),
+                           0, 2**_DEPTH - 1)
+        codes = (_spread_bits(cells[:,0]) | (_spread_bits(cells[:,1]) << numpy.uint64(1))
+                 | (_spread_bits(cells[:,2]) << numpy.uint64(2))).astype(numpy.int64)
+        self.order = numpy.argsort(codes, kind='mergesort')
+        self.codes = codes[self.order]
+        self.data = data[self.order]
+        self.charges = charges[self.order]
+        # Running sums let us find the total charge (and the center) of
+        # any contiguous run of particles.
+        weight = abs(self.charges)
+        self.mixed = (self.charges > 0).any() and (self.charges < 0).any()
+        def running(x):
+            return numpy.concatenate([numpy.zeros((1,) + x.shape[1:]), numpy.cumsum(x, axis=0)])
+        total_charge = running(self.charges)
+        total_weight = running(weight)
+        total_moment = running(weight[:,numpy.newaxis]*self.data)
+        total_dipole = running(self.charges[:,numpy.newaxis]*self.data)
+        total_position = running(self.data)
+
+        self.levels = []
+        inside = numpy.arange(N) # the particles in cubes we must divide
+        for level in range(_DEPTH + 1):
+            L = _Level()
+            L.width = width/2**level
+            L.shift = 3*(_DEPTH - level)
+            prefix = self.codes[inside] >> L.shift
+            first = numpy.ones(len(inside), dtype=bool)
+            first[1:] = prefix[1:] != prefix[:-1]
+            where = numpy.flatnonzero(first)
+            L.prefix = prefix[where]
+            L.start = inside[where]
+            L.count = numpy.diff(numpy.append(where, len(inside)))
+            end = L.start + L.count
+            L.charge = total_charge[end] - total_charge[L.start]
+            w = total_weight[end] - total_weight[L.start]
+            moment = total_moment[end] - total_moment[L.start]
+            mean = (total_position[end] - total_position[L.start])/L.count[:,numpy.newaxis]
+            # Uncharged cubes exert no force, so their center is only
+            # used for deciding whether to open them.
+            has_weight = w > 0
+            moment[has_weight] /= w[has_weight,numpy.newaxis]
+            moment[~has_weight] = mean[~has_weight]
+            L.center = moment
+            # The dipole moment about the center is zero unless the cube
+            # holds charges of both signs.
+            L.dipole = (total_dipole[end] - total_dipole[L.start]
+                        - L.charge[:,numpy.newaxis]*moment)
+            L.leaf = (L.count <= leaf_size) | (level == _DEPTH)
+            self.levels.append(L)
+            if L.leaf.all():
+                break
+            inside = inside[~numpy.repeat(L.leaf, L.count)]
+        for L, below in zip(self.levels[:-1], self.levels[1:]):
+            L.child_start = numpy.searchsorted(below.prefix, L.prefix << 3)
+            L.child_count = numpy.searchsorted(below.prefix, (L.prefix + 1) << 3) - L.child_start
+        # The leaves hold every particle once, and are the groups of
+        # particles for which we compute the field together.
+        start = numpy.concatenate([L.start[L.leaf] for L in self.levels])
+        count = numpy.concatenate([L.count[L.leaf] for L in self.levels])
+        order = numpy.argsort(start)
+        self.group_start = start[order]
+        self.group_count = count[order]
+        self.group_lo = numpy.minimum.reduceat(self.data, self.group_start, axis=0)
+        self.group_hi = numpy.maximum.reduceat(self.data, self.group_start, axis=0)
+
+    def field(self, groups, theta, softening):
+        '''The sum of q*dr/r**3 from all the other particles, for the
+        particles of a contiguous run of leaf cubes.  The particles of
+        each leaf share the walk through the tree, deciding together
+        which cubes are far enough away from all of them.'''
+        data = self.data
+        first = self.group_start[groups[0]]
+        last = self.group_start[groups[-1]] + self.group_count[groups[-1]]
+        F = numpy.zeros((last - first, 3))
+        def add(which, contribution):
+            for c in range(3):
+                F[:,c] += numpy.bincount(which - first, weights=contribution[:,c],
+                                         minlength=last - first)
+        g = groups
+        node = numpy.zeros(len(groups), dtype=int)
+        for L in self.levels:
+            # the distance from the center of each cube to the nearest
+            # corner of the box holding the particles of the group
+            c = L.center[node]
+            gap = numpy.maximum(numpy.maximum(self.group_lo[g] - c, c - self.group_hi[g]), 0)
+            d2 = numpy.einsum('ij,ij->i', gap, gap)
+            own = (self.codes[self.group_start[g]] >> L.shift) == L.prefix[node]
+            far = ~own & (L.width**2 < theta**2*d2)
+            which, target = _expand(self.group_start[g[far]], self.group_count[g[far]])
+            source = node[far][which]
+            dr = data[target] - L.center[source]
+            r2 = numpy.einsum('ij,ij->i', dr, dr) + softening**2
+            E = dr*(L.charge[source]/r2**1.5)[:,numpy.newaxis]
+            if self.mixed:
+                p = L.dipole[source]
+                E += (3*dr*(numpy.einsum('ij,ij->i', p, dr)/r2)[:,numpy.newaxis]
+                      - p)/r2[:,numpy.newaxis]**1.5
+            add(target, E)
+            near = ~far
+            # Sum directly over the particles of nearby leaves
+            leaf = near & L.leaf[node]
+            g_leaf, n_leaf = g[leaf], node[leaf]
+            count = self.group_count[g_leaf]*L.count[n_leaf]
+            which, k = _expand(numpy.zeros(len(count), dtype=int), count)
+            width = L.count[n_leaf][which]
+            target = self.group_start[g_leaf][which] + k//width
+            source = L.start[n_leaf][which] + k % width
+            others = source != target
+            target, source = target[others], source[others]
+            dr = data[target] - data[source]
+            r2 = numpy.einsum('ij,ij->i', dr, dr) + softening**2
+            add(target, dr*(self.charges[source]/r2**1.5)[:,numpy.newaxis])
+            # and look inside nearby cubes that are not leaves.
+            inner = near & ~L.leaf[node]
+            if not inner.any():
+                break
+            which, node = _expand(L.child_start[node[inner]], L.child_count[node[inner]])
+            g = g[inner][which]
+        return F
+
+def _direct_field(data, charges, softening, start=0, stop=None):
+    '''The sum of q*dr/r**3 from all the other particles, adding up
+    every pair, for the particles from start to stop.'''
+    N = len(data)
+    if stop is None:
+        stop = N
+    F = numpy.zeros((stop - start, 3))
+    rows = max(1, 10**6//N)
+    for s in range(start, stop, rows):
+        e = min(stop, s + rows)
+        dr = data[s:e,numpy.newaxis,:] - data[numpy.newaxis,:,:]
+        r2 = numpy.einsum('ijk,ijk->ij', dr, dr) + softening**2
+        r2[numpy.arange(e - s), numpy.arange(s, e)] = numpy.inf
+        F[s-start:e-start] = numpy.einsum('ijk,ij->ik', dr, charges/r2**1.5)
+    return F
+
+class InverseSquareForce(object):
+    '''A force between every pair of particles that is proportional to
+    the product of their charges (or masses), and inversely
+    proportional to the square of the distance between them.
+
+    The force on particle `i` due to particle `j` is::
+
+        constant*q[i]*q[j]*(r[i] - r[j])/abs(r[i] - r[j])**3
+
+    so gravity has `constant = -G` with the masses as charges, and the
+    electrostatic force has `constant = 1/(4*pi*epsilon_0)`.
+
+    Args:
+        constant: the constant of proportionality, such as `-G`
+        theta: the opening angle, which sets the accuracy of the force
+        softening: a distance that is added (in quadrature) to the
+            distance between every pair, to avoid infinite forces when
+            particles pass through each other
+        leaf_size: the largest number of particles in a cube of the
+            tree that is not divided further
+        direct_below: the number of particles below which the exact
+            sum over pairs is faster than the tree, and is used instead
+        pool: a `WorkerPool` to share the work of the exact sum over
+            pairs between several processes
+    Raises:
+        Exception: the softening is not a distance, or theta is negative
+    '''
+    def __init__(self, constant, theta=0.5, softening=0, leaf_size=8, direct_below=1000,
+                 pool=None):
+        check_units('softening must be a distance', softening, meter)
+        if theta < 0:
+            raise Exception('theta must not be negative, not %s' % theta)
+        self.constant = constant
+        self.theta = theta
+        self.softening = softening
+        self.leaf_size = leaf_size
+        self.direct_below = direct_below
+        self.pool = pool
+
+    def __setup(self, system, charges):
+        positions = _positions(system)
+        N = len(positions)
+        if type(charges) != QuantityArray and type(charges) != list and \
+           not hasattr(charges, 'shape'):
+            charges = QuantityArray(numpy.full(N, float(value(charges))), units(charges))
+        charges = QuantityArray(charges)
+        if len(charges) != N:
+            raise Exception('need one charge for each of the %d particles, not %d'
+                            % (N, len(charges)))
+        check_units('constant*charge**2/distance**2 must be a force',
+                    self.constant*scalar(1, charges._mks)**2/meter**2, Newton)
+        return positions._data, numpy.asarray(charges.v, dtype=float)
+
+    def __direct(self, data, charges):
+        if self.pool is None:
+            return _direct_field(data, charges, value(self.softening))
+        out, done = self.pool._run(self, '_share_field',
+                                   {'positions': data, 'charges': charges},
+                                   value(self.softening))
+        return out[0].copy()
+
+    def _share_field(self, arrays, out, k, n, softening):
+        '''Find the exact field at the k'th of n shares of the
+        particles, in a worker of a WorkerPool.'''
+        N = len(arrays['positions'])
+        start, stop = N*k//n, N*(k + 1)//n
+        out[0, start:stop] = _direct_field(arrays['positions'], arrays['charges'],
+                                           softening, start, stop)
+
+    def __result(self, field, charges):
+        F = value(self.constant)*charges[:,numpy.newaxis]*field
+        F += 0.0 # turn any -0.0 into 0.0
+        return VectorArray(F, Newton._mks)
+
+    def forces(self, system, charges):
+        '''Compute the total force on each particle, using the tree
+        unless there are fewer than `direct_below` particles.
+
+        Args:
+            system: a particle set, or a VectorArray of positions
+            charges: a QuantityArray (or list) holding the charge or
+                mass of each particle, or a single charge for all of them
+        Returns:
+            a VectorArray holding the force on each particle
+        Raises:
+            Exception: the constant times two charges divided by a
+                distance squared is not a force
+        '''
+        data, q = self.__setup(system, charges)
+        if len(data) < self.direct_below or self.theta == 0:
+            return self.__result(self.__direct(data, q), q)
+        tree = _Octree(data, q, self.leaf_size)
+        field = numpy.zeros_like(data)
+        groups = numpy.arange(len(tree.group_start))
+        for s in range(0, len(groups), _CHUNK):
+            chosen = groups[s:s+_CHUNK]
+            start = tree.group_start[chosen[0]]
+            field[tree.order[start:start + tree.group_count[chosen].sum()]] = \
+                tree.field(chosen, self.theta, value(self.softening))
+        return self.__result(field, q)
+
+    def exact_forces(self, system, charges):
+        '''Compute the total force on each particle by adding up the
+        force from every pair, which is slow for many particles, but
+        is useful for checking the accuracy of `forces`.
+
+        Args:
+            system: a particle set, or a VectorArray of positions
+            charges: a QuantityArray (or list) holding the charge or
+                mass of each particle, or a single charge for all of them
+        Returns:
+            a VectorArray holding the force on each particle
+        Raises:
+            Exception: the constant times two charges divided by a
+                distance squared is not a force
+        '''
+        data, q = self.__setup(system, charges)
+        return self.__result(self.__direct(data, q), q)
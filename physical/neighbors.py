@@ -0,0 +1,238 @@
+"""The physical.neighbors module computes short-range forces between
+many particles, such as the repulsion between the atoms of a crystal
+or the molecules of a gas.  Rather than looking at every pair of
+particles, which takes a time proportional to the square of the
+number of particles, it sorts the particles into a grid of cells and
+only looks at pairs that are in neighboring cells.  It also keeps a
+list of the nearby pairs (a Verlet list), which is only rebuilt once
+some particle has moved far enough to change it.
+
+.. testcode :: neighbors
+
+    from physical.neighbors import ShortRangeForce
+
+    L = 1*meter
+    repulsion = ShortRangeForce(2*L, lambda dr, r: 0.1*L**5*dr/r**6*Newton)
+    positions = VectorArray([vector(0,0,0), vector(1,0,0), vector(5,0,0)])*meter
+
+.. doctest :: neighbors
+
+    >>> repulsion.forces(positions)
+    VectorArray([[-0.1, 0.0, 0.0], [0.1, 0.0, 0.0], [0.0, 0.0, 0.0]]) meter*kg*second**(-2)
+
+"""
+
+from __future__ import division, print_function
+
+__all__ = ('ShortRangeForce',)
+
+import numpy
+
+from physical import (VectorArray, QuantityArray, check_units, value,
+                      meter, Newton)
+
+# The 27 offsets from a cell to itself and its neighbors.
+_OFFSETS = numpy.array([(i, j, k) for i in (-1, 0, 1)
+                        for j in (-1, 0, 1) for k in (-1, 0, 1)])
+
+def _positions(system):
+    '''The positions of a particle set, or the positions themselves.'''
+    p = getattr(system, 'pos', system)
+    if type(p) != VectorArray:
+        p = VectorArray(p)
+    check_units('positions must be distances', p, meter)
+    return p
+
+def _pairs_within(data, distance, part=(0, 1), box=None):
+    '''Find every pair of rows of data that are closer than distance,
+    returning arrays i and j with i < j.  With part = (k, n), only the
+    k'th of n nearly equal shares of the pairs is found, so that n
+    processes may share the work.  With a PeriodicBox, the distances
+    are between minimum images.'''
+    N = len(data)
+    k, n = part
+    low, high = N*k//n, N*(k + 1)//n
+    if N < 2:
+        return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+    if box is None:
+        # Place each particle in a cell, with a border of empty cells so
+        # that every neighbor of an occupied cell has a valid index.
+        cells = numpy.floor((data - data.min(axis=0))/distance).astype(int) + 1
+        shape = cells.max(axis=0) + 2
+        offsets = _OFFSETS
+    else:
+        cells, shape, offsets = box._cells(data, distance)
+    keys = (cells[:,0]*shape[1] + cells[:,1])*shape[2] + cells[:,2]
+    order = numpy.argsort(keys, kind='mergesort')
+    sorted_keys = keys[order]
+    everyone = numpy.arange(low, high)
+    found_i = []
+    found_j = []
+    for offset in offsets:
+        if box is None:
+            neighbor = keys[low:high] + (offset[0]*shape[1] + offset[1])*shape[2] + offset[2]
+        else:
+            # the cells on each face are neighbors of those on the opposite face
+            c = (cells[low:high] + offset) % shape
+            neighbor = (c[:,0]*shape[1] + c[:,1])*shape[2] + c[:,2]
+        start = numpy.searchsorted(sorted_keys, neighbor, 'left')
+        count = numpy.searchsorted(sorted_keys, neighbor, 'right') - start
+        total = count.sum()
+        if total == 0:
+            continue
+        i = numpy.repeat(everyone, count)
+        first = numpy.repeat(start, count)
+        within = numpy.arange(total) - numpy.repeat(numpy.cumsum(count) - count, count)
+        j = order[first + within]
+        if n == 1:
+            keep = i < j
+        else:
+            # Each pair is found from both of its particles, which may
+            # be in different shares, so it is kept from the lower one
+            # when i + j is even, and from the higher one when it is
+            # odd, which gives every particle a fair share of pairs.
+            keep = (i != j) & ((i < j) == ((i + j) % 2 == 0))
+            i, j = numpy.minimum(i, j), numpy.maximum(i, j)
+        found_i.append(i[keep])
+        found_j.append(j[keep])
+    if not found_i:
+        return numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int)
+    i = numpy.concatenate(found_i)
+    j = numpy.concatenate(found_j)
+    dr = data[j] - data[i]
+    if box is not None:
+        dr = box._nearest(dr)
+    close = numpy.einsum('ij,ij->i', dr, dr) < distance**2
+    return i[close], j[close]
+
+class ShortRangeForce(object):
+    '''A force between pairs of particles that vanishes beyond a
+    cutoff distance.
+
+    Args:
+        cutoff: the distance beyond which particles do not interact
+        law: a function `law(dr, r)` giving the force on the second
+            particle of each pair, where `dr` is a VectorArray holding
+            the displacement from the first particle to the second,
+            and `r` is a QuantityArray holding the distances.  The
+            first particle feels the opposite force.
+        skin: how much further than the cutoff to look when building
+            the list of neighbors.  A larger skin means the list is
+            rebuilt less often, but holds more pairs.  It defaults to
+            a tenth of the cutoff.
+        pool: a `WorkerPool` to share the work of finding the forces
+            between several processes, each of which keeps its own
+            list of neighbors
+        box: a `PeriodicBox`, in which case each particle interacts
+            with the nearest image of every other particle
+    Raises:
+        Exception: the cutoff or skin is not a distance
+    '''
+    def __init__(self, cutoff, law, skin=None, pool=None, box=None):
+        if skin is None:
+            skin = 0.1*cutoff
+        check_units('cutoff must be a distance', cutoff, meter)
+        check_units('skin must be a distance', skin, meter)
+        self.cutoff = cutoff
+        self.law = law
+        self.skin = skin
+        self.pool = pool
+        self.box = box
+        #: the number of times the list of neighbors has been built
+        self.rebuilds = 0
+        self.__reference = None
+        self.__box = None
+        self.__part = None
+        self.__i = None
+        self.__j = None
+
+    def __displacements(self, data, i, j):
+        dr = data[j] - data[i]
+        if self.box is not None:
+            dr = self.box._nearest(dr)
+        return dr
+
+    def __neighbors(self, data, part=(0, 1)):
+        reach = value(self.cutoff) + value(self.skin)
+        # the box may have been moved or resized since the list was built
+        box = None if self.box is None else numpy.concatenate(self.box._corner())
+        if self.__reference is not None and len(self.__reference) == len(data):
+            moved = data - self.__reference
+            if self.box is not None:
+                moved = self.box._nearest(moved)
+        if self.__reference is None or len(self.__reference) != len(data) or \
+           self.__part != part or (box is not None and not numpy.array_equal(box, self.__box)) or \
+           numpy.einsum('ij,ij->i', moved, moved).max() > (value(self.skin)/2)**2:
+            if self.box is not None and 2*reach > self.box._corner()[1].min():
+                raise Exception('the cutoff plus the skin must be less than half '
+                                'the width of the periodic box')
+            self.__i, self.__j = _pairs_within(data, reach, part, self.box)
+            self.__reference = data.copy()
+            self.__box = box
+            self.__part = part
+            self.rebuilds += 1
+        return self.__i, self.__j
+
+    def __close(self, data, part=(0, 1)):
+        i, j = self.__neighbors(data, part)
+        dr = self.__displacements(data, i, j)
+        close = numpy.einsum('ij,ij->i', dr, dr) < value(self.cutoff)**2
+        return i[close], j[close]
+
+    def __add_forces(self, data, i, j, total):
+        N = len(data)
+        dr = VectorArray(self.__displacements(data, i, j), meter._mks)
+        r = abs(dr)
+        F = self.law(dr, r)
+        if type(F) != VectorArray:
+            raise Exception('the force law must give a VectorArray, not %s' % type(F))
+        check_units('the force law must give a force', F, Newton)
+        for c in range(3):
+            total[:, c] += (numpy.bincount(j, weights=F._data[:, c], minlength=N)
+                            - numpy.bincount(i, weights=F._data[:, c], minlength=N))
+
+    def _share_forces(self, arrays, out, k, n, corner=None, widths=None):
+        '''Find the forces of the k'th of n shares of the pairs, in a
+        worker of a WorkerPool, returning whether the list of neighbors
+        was rebuilt.  The corner and widths of the periodic box are
+        sent each time, since the box may have changed.'''
+        data = arrays['positions']
+        if corner is not None:
+            self.box._resize(corner, widths)
+        rebuilds = self.rebuilds
+        i, j = self.__close(data, (k, n))
+        out[k] = 0
+        self.__add_forces(data, i, j, out[k])
+        return self.rebuilds != rebuilds
+
+    def pairs(self, system):
+        '''Find the pairs of particles closer than the cutoff.
+
+        Args:
+            system: a particle set, or a VectorArray of positions
+        Returns:
+            two arrays of indices i and j, with i < j
+        '''
+        return self.__close(_positions(system)._data)
+
+    def forces(self, system):
+        '''Compute the total force on each particle.
+
+        Args:
+            system: a particle set, or a VectorArray of positions
+        Returns:
+            a VectorArray holding the force on each particle
+        Raises:
+            Exception: the law does not give a force
+        '''
+        data = _positions(system)._data
+        if self.pool is not None:
+            box = () if self.box is None else self.box._corner()
+            out, rebuilt = self.pool._run(self, '_share_forces', {'positions': data}, *box)
+            if any(rebuilt):
+                self.rebuilds += 1
+            return VectorArray(out.sum(axis=0), Newton._mks)
+        i, j = self.__close(data)
+        total = numpy.zeros((len(data), 3))
+        self.__add_forces(data, i, j, total)
+        return VectorArray(total, Newton._mks)
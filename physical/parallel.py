@@ -0,0 +1,271 @@
+"""The physical.parallel module shares the work of computing forces
+between several processes, so that a computer with many cores can
+use all of them.  Python runs only one thread of a program at a time,
+so the work is done by separate worker processes, which are started
+once and then kept waiting for work.  The positions of the particles
+are copied into shared memory, which every worker can read, and each
+worker writes its part of the forces into shared memory as well, so
+that no arrays need to be sent between the processes.
+
+A WorkerPool is used by giving it to a force that knows how to share
+its work, which is currently `ShortRangeForce` and the exact sum over
+pairs of `InverseSquareForce`.  Each worker is given a share of the
+particles, and the forces found by the workers are added up.
+
+.. testcode :: parallel
+
+    from physical.parallel import WorkerPool
+    from physical.neighbors import ShortRangeForce
+
+    L = 1*meter
+    pool = WorkerPool(2)
+    repulsion = ShortRangeForce(2*L, lambda dr, r: 0.1*L**5*dr/r**6*Newton,
+                                pool=pool)
+    positions = VectorArray([vector(0,0,0), vector(1,0,0), vector(5,0,0)])*meter
+
+.. doctest :: parallel
+
+    >>> repulsion.forces(positions)
+    VectorArray([[-0.1, 0.0, 0.0], [0.1, 0.0, 0.0], [0.0, 0.0, 0.0]]) meter*kg*second**(-2)
+    >>> pool.close()
+
+The workers are started (by forking) the first time a force uses the
+pool.  A force that first uses the pool after that is copied to the
+workers that are already running, along with its force law and the
+global variables that the law uses.  Only if the force cannot be
+copied are the workers started again.  The pool only holds on to a
+force for as long as your program does, so making a new force every
+frame is fine.  If a force is changed after it has been copied, the
+workers must be started again with `restart`, except that a force in a
+periodic box sends the workers the position and size of the box each
+time.  Each use of the pool costs a fraction of a millisecond, so it
+only saves time when there are many particles.
+
+"""
+
+from __future__ import division, print_function
+
+__all__ = ('WorkerPool',)
+
+import os, sys, atexit, importlib, io, marshal, pickle, types, weakref
+
+import numpy
+
+try:
+    import multiprocessing
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    shared_memory = None
+
+# The forces that the workers being forked should start with, keyed
+# as in WorkerPool, which is only set while they are being forked.
+_forking_owners = {}
+
+def _global_names(code):
+    '''The names of the global variables that code (and any function
+    defined in it) may use.'''
+    names = set(code.co_names)
+    for c in code.co_consts:
+        if type(c) == types.CodeType:
+            names |= _global_names(c)
+    return names
+
+def _make_function(code, module, used, defaults, closure):
+    '''Rebuild a function sent by _Pickler in a worker, with the
+    globals it uses as they were when it was sent, and the worker's
+    copy of the rest of the globals of its module.'''
+    if module not in sys.modules:
+        importlib.import_module(module)
+    namespace = dict(sys.modules[module].__dict__)
+    namespace.update(used)
+    cells = None if closure is None else tuple(types.CellType(c) for c in closure)
+    return types.FunctionType(marshal.loads(code), namespace, None, defaults, cells)
+
+def _no_pool():
+    return None
+
+class _Pickler(pickle.Pickler):
+    '''Pickles a force for workers that are already running, sending
+    functions (such as force laws written as lambdas) that cannot be
+    found by name as their code, and leaving out any WorkerPool.'''
+    def reducer_override(self, obj):
+        if isinstance(obj, WorkerPool):
+            return _no_pool, ()
+        if type(obj) == types.FunctionType:
+            module = sys.modules.get(obj.__module__)
+            found = module
+            for name in obj.__qualname__.split('.'):
+                found = getattr(found, name, None)
+            if found is not obj:
+                used = dict((name, obj.__globals__[name])
+                            for name in _global_names(obj.__code__)
+                            if name in obj.__globals__ and
+                            type(obj.__globals__[name]) != types.ModuleType)
+                closure = None if obj.__closure__ is None else \
+                    [c.cell_contents for c in obj.__closure__]
+                return _make_function, (marshal.dumps(obj.__code__), obj.__module__,
+                                        used, obj.__defaults__, closure)
+        return NotImplemented
+
+def _work(connection):
+    '''The loop run by each worker process, which waits for a message
+    naming a force, one of its methods and the shared arrays, calls
+    the method, and replies with its (small) result or an error.  A
+    message may also bring new forces, and name forces that are no
+    longer needed.'''
+    owners = dict(_forking_owners)
+    blocks = {}
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        added, dropped, owner, method, shared, share, shares, args = message
+        for key in dropped:
+            owners.pop(key, None)
+        try:
+            for key, data in added.items():
+                owners[key] = pickle.loads(data)
+            arrays = {}
+            for key, (name, shape, dtype) in shared.items():
+                if name not in blocks:
+                    blocks[name] = shared_memory.SharedMemory(name=name)
+                arrays[key] = numpy.ndarray(shape, dtype, blocks[name].buf)
+            out = arrays.pop('out')
+            reply = (True, getattr(owners[owner], method)(arrays, out, share, shares, *args))
+        except Exception as e:
+            reply = (False, str(e))
+        arrays = out = None
+        used = set(name for name, shape, dtype in shared.values())
+        for name in list(blocks):
+            if name not in used:
+                blocks.pop(name).close()
+        connection.send(reply)
+    for block in blocks.values():
+        block.close()
+
+class WorkerPool(object):
+    '''A set of worker processes that share the work of computing
+    forces, reading the positions of the particles from shared
+    memory.
+
+    Args:
+        processes: the number of worker processes, which defaults to
+            the number of cores
+    Raises:
+        Exception: shared memory or forking is not available, which
+            needs Python 3.8 or later on Linux or Mac OS
+    '''
+    def __init__(self, processes=None):
+        if shared_memory is None or 'fork' not in multiprocessing.get_all_start_methods():
+            raise Exception('WorkerPool needs Python 3.8 or later on a system that can fork')
+        self.processes = processes or os.cpu_count() or 1
+        #: the number of times the workers have been started
+        self.starts = 0
+        # the key of each force that has used the pool, which is
+        # forgotten (and then dropped by the workers) when the force is
+        self.__keys = weakref.WeakKeyDictionary()
+        self.__count = 0
+        self.__dropped = []
+        self.__workers = []
+        self.__blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __stop(self):
+        for process, connection in self.__workers:
+            try:
+                connection.send(None)
+            except (IOError, OSError):
+                pass
+            connection.close()
+        for process, connection in self.__workers:
+            process.join()
+        self.__workers = []
+
+    def restart(self):
+        '''Start the workers again, with fresh copies of the forces.'''
+        self.__stop()
+        # The workers must share our resource tracker, which removes the
+        # blocks of shared memory if we crash, rather than start their
+        # own, which would remove the blocks when a worker stops.
+        resource_tracker.ensure_running()
+        context = multiprocessing.get_context('fork')
+        _forking_owners.update((key, owner) for owner, key in self.__keys.items())
+        try:
+            for k in range(self.processes):
+                ours, theirs = context.Pipe()
+                process = context.Process(target=_work, args=(theirs,))
+                process.daemon = True
+                process.start()
+                theirs.close()
+                self.__workers.append((process, ours))
+        finally:
+            _forking_owners.clear()
+        del self.__dropped[:]
+        self.starts += 1
+        atexit.unregister(self.close)
+        atexit.register(self.close)
+
+    def close(self):
+        '''Stop the workers and free the shared memory.'''
+        self.__stop()
+        for block in self.__blocks.values():
+            block.close()
+            block.unlink()
+        self.__blocks = {}
+        atexit.unregister(self.close)
+
+    def __share(self, key, shape, dtype):
+        '''An array in shared memory, which is made larger when needed.'''
+        nbytes = max(1, int(numpy.prod(shape))*numpy.dtype(dtype).itemsize)
+        block = self.__blocks.get(key)
+        if block is None or block.size < nbytes:
+            if block is not None:
+                block.close()
+                block.unlink()
+            size = nbytes if block is None else max(nbytes, 2*block.size)
+            block = self.__blocks[key] = shared_memory.SharedMemory(create=True, size=size)
+        return (block.name, tuple(shape), numpy.dtype(dtype).str), \
+            numpy.ndarray(shape, dtype, block.buf)
+
+    def _run(self, owner, method, arrays, *args):
+        '''Call owner.method(arrays, out, k, n, *args) in each worker k
+        of n, where arrays is a dict of numpy arrays copied into shared
+        memory, and out is an n x N x 3 array (for the N rows of
+        arrays['positions']) in which the workers write their results.  Returns out
+        (which is overwritten by the next call) and a list of the
+        values returned by the workers.'''
+        added = {}
+        index = self.__keys.get(owner)
+        if index is None:
+            self.__count += 1
+            index = self.__keys[owner] = self.__count
+            weakref.finalize(owner, self.__dropped.append, index)
+            if self.__workers:
+                try:
+                    data = io.BytesIO()
+                    _Pickler(data, pickle.HIGHEST_PROTOCOL).dump(owner)
+                    added[index] = data.getvalue()
+                except Exception:
+                    # the force cannot be copied, so the workers are forked again
+                    self.restart()
+        if not self.__workers:
+            self.restart()
+        dropped, self.__dropped[:] = list(self.__dropped), []
+        shared = {}
+        for key, a in arrays.items():
+            shared[key], view = self.__share(key, a.shape, a.dtype)
+            view[...] = a
+        N = len(arrays['positions'])
+        shared['out'], out = self.__share('out', (self.processes, N, 3), float)
+        for k, (process, connection) in enumerate(self.__workers):
+            connection.send((added, dropped, index, method, shared, k, self.processes, args))
+        replies = [connection.recv() for process, connection in self.__workers]
+        for ok, reply in replies:
+            if not ok:
+                raise Exception(reply)
+        return out, [reply for ok, reply in replies]
@@ -0,0 +1,117 @@
+"""The physical.periodic module makes a box periodic: a particle that
+leaves through one face comes back in through the opposite face, and
+particles near opposite faces feel each other as if they were
+neighbors.  A periodic box of a few thousand particles behaves like a
+small piece of a much larger gas or crystal, without the surface that
+a box with walls (or no box at all) would have.
+
+The displacement between two particles in a periodic box is the
+shortest one between the first particle and any of the periodic
+images of the second, which is called the minimum image.
+
+.. testcode :: periodic
+
+    from physical.periodic import PeriodicBox
+
+    cell = PeriodicBox(box(vector(0,0,0)*meter, 10*meter, 10*meter, 10*meter))
+    dr = cell.minimum_image(vector(9,0,-6)*meter)
+
+.. doctest :: periodic
+
+    >>> dr
+    <-1.0,0.0,4.0> meter
+
+"""
+
+from __future__ import division, print_function
+
+__all__ = ('PeriodicBox',)
+
+import numpy
+
+from physical import vector, scalar, VectorArray, check_units, meter
+
+class PeriodicBox(object):
+    '''A periodic box, which is axis-aligned like the box it is made
+    from, and always has the position and size that box has now.
+
+    Args:
+        box: a box (as made by `box`), or anything else with a `pos`
+            and widths `wx`, `wy` and `wz`
+    Raises:
+        Exception: the dimensions of the box are not distances
+    '''
+    def __init__(self, box):
+        check_units('box dimensions must be distances',
+                    box.pos, box.wx, box.wy, box.wz, meter)
+        self.box = box
+
+    def _corner(self):
+        '''The lowest corner and the widths of the box, as arrays.'''
+        b = self.box
+        widths = numpy.array([b.wx.v, b.wy.v, b.wz.v], dtype=float)
+        center = numpy.array([b.pos._x, b.pos._y, b.pos._z], dtype=float)
+        return center - 0.5*widths, widths
+
+    def _resize(self, corner, widths):
+        '''Give the box the lowest corner and widths found by _corner,
+        which is how a worker of a WorkerPool keeps its copy of the box
+        the same as ours.'''
+        b = self.box
+        center = corner + 0.5*widths
+        b.pos = vector(center[0], center[1], center[2], meter._mks)
+        b.wx, b.wy, b.wz = [scalar(w, meter._mks) for w in widths]
+
+    def _nearest(self, dr):
+        '''The minimum images of an N x 3 array of displacements.'''
+        corner, widths = self._corner()
+        return dr - widths*numpy.round(dr/widths)
+
+    def _cells(self, data, distance):
+        '''Sort the positions into a grid of cells at least as wide as
+        distance, returning the cell of each position, the number of
+        cells along each axis, and the offsets from a cell to each of
+        its neighbors (which may include itself only once, when there
+        are fewer than three cells along an axis).'''
+        corner, widths = self._corner()
+        shape = numpy.maximum(1, numpy.floor(widths/distance)).astype(int)
+        cells = numpy.floor((data - corner)/widths*shape).astype(int) % shape
+        steps = [sorted(set(s % n for s in (-1, 0, 1))) for n in shape]
+        offsets = numpy.array([(i, j, k) for i in steps[0]
+                               for j in steps[1] for k in steps[2]])
+        return cells, shape, offsets
+
+    def minimum_image(self, dr):
+        '''The shortest displacement that is equivalent to dr.
+
+        Args:
+            dr: a vector or VectorArray of displacements
+        Returns:
+            the minimum images, of the same type as dr
+        Raises:
+            Exception: dr is not a distance
+        '''
+        check_units('displacements must be distances', dr, meter)
+        if type(dr) == vector:
+            x = self._nearest(numpy.array([[dr._x, dr._y, dr._z]]))[0]
+            return vector(x[0], x[1], x[2], meter._mks)
+        return VectorArray(self._nearest(dr._data), meter._mks)
+
+    def wrap(self, system):
+        '''Move positions into the box, by whole widths of the box.
+
+        Args:
+            system: a particle set, whose positions are moved, or a
+                VectorArray of positions
+        Returns:
+            a VectorArray of the positions in the box
+        Raises:
+            Exception: the positions are not distances
+        '''
+        positions = getattr(system, 'pos', system)
+        check_units('positions must be distances', positions, meter)
+        corner, widths = self._corner()
+        inside = VectorArray(corner + (positions._data - corner) % widths, meter._mks)
+        if positions is not system:
+            system.pos = inside
+        return inside
@@ -0,0 +1,319 @@
+"""The physical.sleeping module lets objects that have come to rest
+fall asleep, so that a simulation of a pile of boxes or balls that has
+settled costs almost nothing.  An object falls asleep once its speed
+and acceleration have both stayed small for a while, and it is then
+left out of the collision detection, and out of the loop in which you
+add up the forces and move the objects, until something wakes it.
+
+Objects that touch each other (such as a stack of boxes) form an
+island, which only falls asleep once every object in it is at rest,
+and which wakes up all at once, since pushing the bottom of a stack
+moves the whole stack.  An island wakes up when an object that is
+awake touches it, or when you change the position or velocity of one
+of its objects.  Objects without a velocity `v`, such as the ground,
+never move, so they are never awake and never join an island.
+
+.. testcode :: sleeping
+
+    from physical.sleeping import SleepTracker
+
+    ground = box(vector(0,0,-0.5)*meter, 10*meter, 10*meter, 1*meter)
+    ball = sphere(vector(0,0,0.5)*meter, radius=0.5*meter)
+    ball.v = vector(0,0,0)*meter/second
+    tracker = SleepTracker([ground, ball])
+    dt = 0.1*second
+    for step in range(10):
+        contacts = tracker.collisions()
+        for o in tracker.awake:
+            o.pos = o.pos + o.v*dt
+        tracker.update(dt)
+
+.. doctest :: sleeping
+
+    >>> len(tracker.awake)
+    0
+    >>> ball.v = vector(1,0,0)*meter/second
+    >>> contacts = tracker.collisions()
+    >>> len(tracker.awake)
+    1
+
+"""
+
+from __future__ import division, print_function
+
+__all__ = ('SleepTracker',)
+
+import weakref
+
+import numpy
+
+from physical import check_units, value, meter, second
+from physical.contacts import CollisionDetector
+
+# An object that falls asleep has its class swapped for a subclass that
+# notes when its position or velocity is set, so that the objects that
+# are asleep need not be looked at each step to see if you have moved
+# them.  _sleepers holds the list in which to note it, and the index of
+# the object, keyed by the id of the object.
+_sleepers = {}
+_watching_classes = {}
+
+def _watching(cls):
+    '''The subclass of cls given to objects of cls that are asleep.'''
+    watching = _watching_classes.get(cls)
+    if watching is None:
+        def __setattr__(self, name, value):
+            cls.__setattr__(self, name, value)
+            if name == 'pos' or name == 'v':
+                written, k = _sleepers[id(self)]
+                written.append(k)
+        watching = type(cls.__name__, (cls,), {'__slots__': (), '__module__': cls.__module__,
+                                               '__setattr__': __setattr__})
+        _watching_classes[cls] = watching
+    return watching
+
+def _stop_watching(watched):
+    '''Give the objects that are asleep back their own classes.'''
+    for o, cls in watched.values():
+        o.__class__ = cls
+        _sleepers.pop(id(o), None)
+    watched.clear()
+
+class SleepTracker(object):
+    '''Keeps track of which of a list of spheres and boxes are awake.
+
+    Each step of a simulation, call `collisions` to find the contacts
+    of the objects that are awake, then add up the forces on and move
+    only the objects in `awake`, and then call `update` with the time
+    step.  The objects that are asleep cost nothing each step: a
+    sphere or box notices when you set its `pos` or `v`, and the
+    particles of a particle set are checked all at once with numpy.
+    Changing one component of a sleeping sphere's position (as in
+    `ball.pos.x = 3*meter`) is not noticed, so call `wake` after doing
+    that.
+
+    Args:
+        objects: a list of spheres and boxes (or particles of particle
+            sets).  Those with a velocity `v` move, and the others
+            never move.
+        speed: the speed below which an object is at rest, which
+            defaults to a centimeter per second
+        acceleration: the acceleration below which an object is at
+            rest, which defaults to ten centimeters per second squared
+        delay: how long an island must stay at rest before it falls
+            asleep, which defaults to half a second
+    Raises:
+        Exception: the thresholds or velocities have the wrong
+            dimensions
+    '''
+    def __init__(self, objects, speed=None, acceleration=None, delay=None):
+        if speed is None:
+            speed = 0.01*meter/second
+        if acceleration is None:
+            acceleration = 0.1*meter/second**2
+        if delay is None:
+            delay = 0.5*second
+        check_units('the speed must be a distance per time', speed, meter/second)
+        check_units('the delay must be a time', delay, second)
+        check_units('the acceleration must be a speed per time', acceleration, speed/second)
+        self.objects = list(objects)
+        self.speed = speed
+        self.acceleration = acceleration
+        self.delay = delay
+        N = len(self.objects)
+        self.__index = dict((id(o), k) for k, o in enumerate(self.objects))
+        self.__dynamic = numpy.array([hasattr(o, 'v') for o in self.objects], dtype=bool)
+        self.__v = numpy.zeros((N, 3))
+        for k in numpy.flatnonzero(self.__dynamic).tolist():
+            v = self.objects[k].v
+            check_units('velocities must have the units of speed', v, speed)
+            self.__v[k] = (v._x, v._y, v._z)
+        # how long each object has been at rest
+        self.__still = numpy.zeros(N)
+        self.__asleep = numpy.zeros(N, dtype=bool)
+        # the island of each object that is asleep
+        self.__island = {}
+        # The position and velocity of each sleeping object that is not
+        # a particle, which tell us whether it has really been moved
+        # when it notes that its pos or v has been set.  Those whose
+        # class cannot be swapped are in polled, and are looked at
+        # every step.
+        self.__rest = {}
+        self.__written = []
+        self.__watched = {}
+        self.__polled = set()
+        weakref.finalize(self, _stop_watching, self.__watched)
+        # For each particle set, the index in objects of each of its
+        # sleeping particles, keyed by the index of the particle in
+        # the set, and their positions when they fell asleep, in arrays
+        # that are made again when particles fall asleep or wake.
+        self.__sets = {}
+        self.__detector = CollisionDetector()
+        self.__contacts = []
+        self.__changed()
+
+    def __changed(self):
+        self.__moving = numpy.flatnonzero(self.__dynamic & ~self.__asleep)
+        #: a list of the objects that are awake, which are the only
+        #: ones you need to move
+        self.awake = [self.objects[k] for k in self.__moving.tolist()]
+
+    def __sleep(self, k, island):
+        o = self.objects[k]
+        self.__asleep[k] = True
+        self.__island[k] = island
+        self.__v[k] = 0
+        particles = getattr(o, '_set', None)
+        if particles is not None:
+            entry = self.__sets.setdefault(id(particles), [particles, {}, None])
+            entry[1][o._i] = k
+            entry[2] = None
+            return
+        p = o.pos
+        self.__rest[k] = (p._x, p._y, p._z, 0.0, 0.0, 0.0)
+        cls = type(o)
+        try:
+            o.__class__ = _watching(cls)
+        except TypeError:
+            self.__polled.add(k)
+            return
+        _sleepers[id(o)] = (self.__written, k)
+        self.__watched[k] = (o, cls)
+
+    def __wake(self, k):
+        '''Wake the island of object k, returning whether it was asleep.'''
+        if not self.__asleep[k]:
+            return False
+        for m in self.__island[k]:
+            o = self.objects[m]
+            del self.__island[m]
+            particles = getattr(o, '_set', None)
+            if particles is not None:
+                entry = self.__sets[id(particles)]
+                del entry[1][o._i]
+                entry[2] = None
+            else:
+                del self.__rest[m]
+                self.__polled.discard(m)
+                if m in self.__watched:
+                    o.__class__ = self.__watched.pop(m)[1]
+                    del _sleepers[id(o)]
+            self.__asleep[m] = False
+            self.__still[m] = 0
+            v = o.v
+            self.__v[m] = (v._x, v._y, v._z)
+        return True
+
+    def __moved(self):
+        '''The sleeping objects that have been moved since they fell
+        asleep.'''
+        objects = self.objects
+        moved = []
+        noted = set(self.__written)
+        del self.__written[:]
+        for k in noted | self.__polled:
+            rest = self.__rest.get(k)
+            if rest is not None:
+                p, v = objects[k].pos, objects[k].v
+                if (p._x, p._y, p._z, v._x, v._y, v._z) != rest:
+                    moved.append(k)
+        for entry in self.__sets.values():
+            particles, sleeping, arrays = entry
+            if not sleeping:
+                continue
+            if arrays is None:
+                index = numpy.array(list(sleeping.keys()), dtype=int)
+                arrays = entry[2] = (index, numpy.array(list(sleeping.values()), dtype=int),
+                                     particles.pos._data[index])
+            index, ks, rest = arrays
+            changed = (particles.pos._data[index] != rest).any(axis=1) | \
+                particles.v._data[index].any(axis=1)
+            moved.extend(ks[changed].tolist())
+        return moved
+
+    def wake(self, obj):
+        '''Wake an object, and every object in its island.
+
+        Args:
+            obj: one of the objects
+        '''
+        if self.__wake(self.__index[id(obj)]):
+            self.__changed()
+
+    def collisions(self):
+        '''Find the contacts of the objects that are awake, waking any
+        island that one of them touches, or whose objects you have
+        moved.
+
+        Returns:
+            a list of contacts like those of `collisions`, between two
+            objects at least one of which is awake
+        '''
+        moved = self.__moved()
+        if moved:
+            for k in moved:
+                self.__wake(k)
+            self.__changed()
+        contacts = self.__detector.collisions(self.objects, self.__moving)
+        while True:
+            woken = False
+            for c in contacts:
+                for o in (c.a, c.b):
+                    woken = self.__wake(self.__index[id(o)]) or woken
+            if not woken:
+                break
+            # The objects just woken have not moved, so this only
+            # gathers the contacts they already had.
+            self.__changed()
+            contacts = self.__detector.collisions(self.objects, self.__moving)
+        self.__contacts = contacts
+        return contacts
+
+    def update(self, dt):
+        '''Note which objects are at rest after a step, and put to sleep
+        each island that has been at rest for long enough.
+
+        Args:
+            dt: the time step just taken
+        Raises:
+            Exception: dt is not a time
+        '''
+        check_units('the time step must be a time', dt, second)
+        dt = value(dt)
+        moving = self.__moving
+        v = numpy.empty((len(moving), 3))
+        for n, k in enumerate(moving.tolist()):
+            u = self.objects[k].v
+            v[n] = (u._x, u._y, u._z)
+        a = numpy.sqrt(((v - self.__v[moving])**2).sum(axis=1))/dt
+        still = (numpy.sqrt((v**2).sum(axis=1)) < value(self.speed)) & \
+            (a < value(self.acceleration))
+        self.__still[moving] = numpy.where(still, self.__still[moving] + dt, 0)
+        self.__v[moving] = v
+        # Join the objects that touch into islands, by union and find.
+        parent = dict((k, k) for k in moving.tolist())
+        def find(k):
+            while parent[k] != k:
+                parent[k] = parent[parent[k]]
+                k = parent[k]
+            return k
+        for c in self.__contacts:
+            i, j = self.__index[id(c.a)], self.__index[id(c.b)]
+            if self.__dynamic[i] and self.__dynamic[j]:
+                for k in (i, j):
+                    parent.setdefault(k, k)
+                parent[find(i)] = find(j)
+        islands = {}
+        for k in parent:
+            islands.setdefault(find(k), []).append(k)
+        delay = value(self.delay)
+        slept = False
+        for island in islands.values():
+            if all(self.__still[k] >= delay for k in island):
+                for k in island:
+                    o = self.objects[k]
+                    o.v = 0*o.v
+                    self.__sleep(k, island)
+                slept = True
+        if slept:
+            self.__changed()
@@ -0,0 +1,240 @@
+"""The physical.springs module computes the forces of many springs
+connecting the particles of a particle set, such as the bonds of a
+crystal.  The springs are usually drawn with `helix`, and a
+SpringNetwork reads which particles each helix connects once, after
+which the forces of all the springs are found with a few array
+operations, rather than a Python loop over the helices.
+
+The springs may also connect spheres (or any objects with a `pos`),
+in which case the network gathers their positions each time, and
+gives the forces in the order of its list `objects`, so that
+
+.. code-block:: python
+
+    for o, F in zip(network.objects, network.forces()):
+        o.F += F
+
+adds them up.  This still needs a Python loop over the objects, so a
+particle set is faster when there are many of them.
+
+.. testcode :: springs
+
+    from physical.springs import SpringNetwork
+
+    balls = particles([vector(0,0,0)*meter, vector(1.5,0,0)*meter])
+    spring = helix(balls[0], balls[1], radius=0.02*meter)
+    network = SpringNetwork([spring], 10*Newton/meter, rest_length=1*meter)
+
+.. doctest :: springs
+
+    >>> network.forces(balls)
+    VectorArray([[5.0, 0.0, 0.0], [-5.0, 0.0, 0.0]]) meter*kg*second**(-2)
+
+"""
+
+from __future__ import division, print_function
+
+__all__ = ('SpringNetwork',)
+
+import numpy
+
+from physical import (VectorArray, QuantityArray, scalar, check_units, units,
+                      value, meter, Newton, Joule)
+from physical.neighbors import _positions
+
+def _per_spring(x, N, name, dimensions):
+    '''A QuantityArray with one value for each of N springs.'''
+    if type(x) == QuantityArray or type(x) == list:
+        x = QuantityArray(x)
+        if len(x) != N:
+            raise Exception('need one %s for each of the %d springs, not %d'
+                            % (name, N, len(x)))
+    else:
+        x = QuantityArray(numpy.full(N, float(value(x))), units(x))
+    check_units('%s must have dimensions of %s' % (name, dimensions[0]), x, dimensions[1])
+    return x
+
+class _StiffnessMatrix(object):
+    '''The derivative of the spring forces with respect to the
+    positions of the particles, in Newtons per meter.  It is stored as
+    one 3 x 3 block for each spring, since the force of a spring only
+    depends on the positions of its two ends.'''
+    def __init__(self, i, j, blocks, N):
+        self.i = i
+        self.j = j
+        self.blocks = blocks
+        self.N = N
+    def __scatter(self, f):
+        total = numpy.zeros((self.N, 3))
+        for c in range(3):
+            total[:, c] = (numpy.bincount(self.i, weights=f[:, c], minlength=self.N)
+                           - numpy.bincount(self.j, weights=f[:, c], minlength=self.N))
+        return total
+    def dot(self, dx):
+        '''The change in the forces when the particles move by dx, an
+        N x 3 array.'''
+        return self.__scatter(numpy.einsum('sab,sb->sa', self.blocks, dx[self.j] - dx[self.i]))
+    def diagonal(self):
+        '''The diagonal of the matrix, as an N x 3 array.'''
+        d = numpy.einsum('saa->sa', self.blocks)
+        total = numpy.zeros((self.N, 3))
+        for c in range(3):
+            total[:, c] = -(numpy.bincount(self.i, weights=d[:, c], minlength=self.N)
+                            + numpy.bincount(self.j, weights=d[:, c], minlength=self.N))
+        return total
+
+class SpringNetwork(object):
+    '''Springs that obey Hooke's law, connecting pairs of particles
+    from one particle set, or pairs of spheres.
+
+    Args:
+        springs: a list of helices (or of pairs of particles), each of
+            which connects two particles of the same particle set, or
+            two spheres (or other objects with a `pos`)
+        stiffness: the spring constant, either one for all springs,
+            or a QuantityArray (or list) with one for each spring
+        rest_length: the length at which each spring exerts no force,
+            either one for all springs, or a QuantityArray (or list)
+            with one for each spring.  It defaults to the length of
+            each spring when the network is created.
+    Raises:
+        Exception: the ends of a spring are not particles of one set
+            or objects with a position, or the dimensions are wrong
+    '''
+    def __init__(self, springs, stiffness, rest_length=None):
+        ends = [(s.pos1, s.pos2) if hasattr(s, 'pos1') else tuple(s) for s in springs]
+        self.particles = None
+        #: the objects the springs connect, in the order of the forces,
+        #: if they are not particles of a set
+        self.objects = None
+        index = {}
+        for a, b in ends:
+            for end in (a, b):
+                particles = getattr(end, '_set', None)
+                if particles is None:
+                    if self.particles is not None or not hasattr(end, 'pos'):
+                        raise Exception('springs must connect particles of one set, or '
+                                        'objects with a position, not %s' % (end,))
+                    if self.objects is None:
+                        self.objects = []
+                    if id(end) not in index:
+                        index[id(end)] = len(self.objects)
+                        self.objects.append(end)
+                elif self.objects is not None:
+                    raise Exception('springs must connect particles of one set, or '
+                                    'objects that are not particles, not both')
+                elif self.particles is None:
+                    self.particles = particles
+                elif particles is not self.particles:
+                    raise Exception('springs must connect particles of the same set')
+        if self.objects is None:
+            index = None
+        #: the index of the first particle of each spring
+        self.i = numpy.array([a._i if index is None else index[id(a)] for a, b in ends],
+                             dtype=int)
+        #: the index of the second particle of each spring
+        self.j = numpy.array([b._i if index is None else index[id(b)] for a, b in ends],
+                             dtype=int)
+        N = len(ends)
+        self.stiffness = _per_spring(stiffness, N, 'stiffness',
+                                     ('force per distance', Newton/meter))
+        if rest_length is None:
+            data = self.__system(None)._data if N else numpy.zeros((0, 3))
+            dr = data[self.j] - data[self.i]
+            rest_length = QuantityArray(numpy.sqrt(numpy.einsum('ij,ij->i', dr, dr)),
+                                        meter._mks)
+        self.rest_length = _per_spring(rest_length, N, 'rest length',
+                                       ('distance', meter))
+
+    def __len__(self):
+        return len(self.i)
+
+    def __system(self, system):
+        '''The positions of system, or those of the objects the springs
+        connect.'''
+        if system is None:
+            system = self.particles
+            if self.objects is not None:
+                system = VectorArray([o.pos for o in self.objects])
+        return _positions(system)
+
+    def __stretch(self, data):
+        dr = data[self.j] - data[self.i]
+        dist = numpy.sqrt(numpy.einsum('ij,ij->i', dr, dr))
+        return dr, dist, dist - self.rest_length.v
+
+    def lengths(self, system=None):
+        '''The length of each spring.
+
+        Args:
+            system: a particle set, or a VectorArray of positions,
+                which defaults to the particles (or objects) the
+                springs connect
+        Returns:
+            a QuantityArray of the lengths
+        '''
+        dr, dist, stretch = self.__stretch(self.__system(system)._data)
+        return QuantityArray(dist, meter._mks)
+
+    def forces(self, system=None):
+        '''Compute the total force of the springs on each particle.
+
+        Args:
+            system: a particle set, or a VectorArray of positions,
+                which defaults to the particles (or objects) the
+                springs connect
+        Returns:
+            a VectorArray holding the force on each particle
+        '''
+        data = self.__system(system)._data
+        dr, dist, stretch = self.__stretch(data)
+        # the force on the first particle of each spring, which pulls
+        # it toward the second when the spring is stretched
+        F = dr*(self.stiffness.v*stretch/dist)[:,numpy.newaxis]
+        N = len(data)
+        total = numpy.zeros((N, 3))
+        for c in range(3):
+            total[:, c] = (numpy.bincount(self.i, weights=F[:, c], minlength=N)
+                           - numpy.bincount(self.j, weights=F[:, c], minlength=N))
+        return VectorArray(total, Newton._mks)
+
+    def stiffness_matrix(self, system=None, definite=False):
+        '''Find how the forces of the springs change as the particles
+        move, which is needed to take implicit time steps.
+
+        Args:
+            system: a particle set, or a VectorArray of positions,
+                which defaults to the particles (or objects) the
+                springs connect
+            definite: if True, leave out the sideways instability of
+                compressed springs, so that the matrix is negative
+                definite (any small motion of the particles gives a
+                restoring force)
+        Returns:
+            an object with a `dot(dx)` method giving the change in the
+            force on each particle when they are moved by dx, in
+            Newtons per meter, and a `diagonal()` method
+        '''
+        data = self.__system(system)._data
+        dr, dist, stretch = self.__stretch(data)
+        n = dr/dist[:,numpy.newaxis]
+        along = n[:,:,numpy.newaxis]*n[:,numpy.newaxis,:]
+        sideways = stretch/dist
+        if definite:
+            sideways = numpy.maximum(0, sideways)
+        across = sideways[:,numpy.newaxis,numpy.newaxis]*(numpy.eye(3) - along)
+        blocks = self.stiffness.v[:,numpy.newaxis,numpy.newaxis]*(along + across)
+        return _StiffnessMatrix(self.i, self.j, blocks, len(data))
+
+    def energy(self, system=None):
+        '''Compute the total energy stored in the springs.
+
+        Args:
+            system: a particle set, or a VectorArray of positions,
+                which defaults to the particles (or objects) the
+                springs connect
+        Returns:
+            the energy, in Joules
+        '''
+        dr, dist, stretch = self.__stretch(self.__system(system)._data)
+        return scalar(0.5*(self.stiffness.v*stretch**2).sum(), Joule._mks)
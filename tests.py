@@ -1,6 +1,16 @@
 import unittest
 
 from physical import *
+from physical.neighbors import ShortRangeForce
+from physical.nbody import InverseSquareForce
+from physical.springs import SpringNetwork
+from physical.integrators import (integrate, AdaptiveIntegrator, ImplicitIntegrator,
+                                  MultirateIntegrator)
+from physical.constraints import DistanceConstraints
+from physical.periodic import PeriodicBox
+from physical.hardspheres import HardSpheres
+from physical.contacts import collisions, CollisionDetector
+from physical.sleeping import SleepTracker
 
 class TestUnits(unittest.TestCase):
     def test_add(self):
@@ -60,8 +70,15 @@ class TestUnits(unittest.TestCase):
     def test_sqrt(self):
         b = 4*meter
         self.assertEqual(sqrt(b)**2, b)
+        self.assertEqual(sqrt(meter)*sqrt(meter), meter)
+        self.assertEqual(repr(sqrt(meter/second)), '1.0 meter**(0.5)*second**(-0.5)')
         with self.assertRaises(Exception):
             sqrt(vector(1,2,3))
+        with self.assertRaises(Exception):
+            sqrt(meter) + meter
+        self.assertEqual((meter**(1/3.))**3, meter)
+        with self.assertRaises(Exception):
+            meter**0.3
     def test_division(self):
         a = 2*meter
         b = 4*meter
@@ -99,6 +116,15 @@ class TestUnits(unittest.TestCase):
         with self.assertRaises(Exception):
             a = vector(0,0,0)*meter
             a.x + 3
+    def test_numpy_numbers(self):
+        import numpy
+        two = numpy.float64(2)
+        self.assertEqual(meter*two, 2*meter)
+        self.assertEqual(meter/numpy.int64(2), 0.5*meter)
+        self.assertEqual(vector(1,2,3)*meter*two, vector(2,4,6)*meter)
+        self.assertEqual(vector(1,2,3)*meter/two, vector(0.5,1,1.5)*meter)
+        with self.assertRaises(Exception):
+            meter + two
     def test_xsetter(self):
         v = vector(2,2,2)*meter
         self.assertEqual(v.x, 2*meter)
@@ -137,6 +163,971 @@ class TestUnits(unittest.TestCase):
         with self.assertRaises(Exception):
             a.cross(5*meter)
 
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            (2*meter).w = 3
+        with self.assertRaises(AttributeError):
+            vector(1,2,3).w = 4
+        import physical
+        s = physical._Sphere(vector(0,0,0)*meter, 1*meter, color.red)
+        s.v = vector(1,0,0)*meter/second
+        self.assertEqual(s.v, vector(1,0,0)*meter/second)
+
+class TestVectorArray(unittest.TestCase):
+    def test_conversion(self):
+        vs = [vector(0,1,2)*meter, vector(2,1,0)*meter, vector(0,0,0)]
+        a = VectorArray(vs)
+        self.assertEqual(len(a), 3)
+        self.assertEqual(a[0], vs[0])
+        self.assertEqual(a.vectors(), [vs[0], vs[1], vector(0,0,0)*meter])
+        with self.assertRaises(Exception):
+            VectorArray([vector(1,0,0)*meter, vector(1,0,0)*second])
+    def test_add(self):
+        a = VectorArray([vector(0,1,2), vector(2,1,0)])*meter
+        b = VectorArray([vector(2,1,0), vector(0,1,2)])*meter
+        self.assertTrue((a+b == vector(2,2,2)*meter).all())
+        self.assertTrue((a-b)[0] == vector(-2,0,2)*meter)
+        self.assertTrue((a + vector(1,1,1)*meter)[1] == vector(3,2,1)*meter)
+        with self.assertRaises(Exception):
+            a + b/second
+        with self.assertRaises(Exception):
+            a - 3*meter
+    def test_mul(self):
+        a = VectorArray([vector(0,1,2), vector(2,1,0)])*meter
+        self.assertEqual((a*2)[1], vector(4,2,0)*meter)
+        self.assertEqual((2*a)[1], vector(4,2,0)*meter)
+        self.assertEqual((a/(2*second))[1], vector(1,0.5,0)*meter/second)
+        self.assertEqual((second*a)[0], vector(0,1,2)*meter*second)
+        with self.assertRaises(Exception):
+            a*a
+        with self.assertRaises(Exception):
+            (2*meter)/a
+    def test_products(self):
+        a = VectorArray([vector(0,1,2), vector(2,1,0)])*meter
+        b = vector(2,1,0)*meter
+        self.assertEqual(list(a.dot(b)/meter**2), [1, 5])
+        self.assertEqual(a.cross(b)[0], vector(-2,4,-2)*meter**2)
+        self.assertEqual(list(abs(a)/meter), [sqrt(5), sqrt(5)])
+        self.assertTrue(abs(abs(a.normalized()[1]) - 1) < 1e-12)
+        with self.assertRaises(Exception):
+            a.dot(5*meter)
+
+class TestQuantityArray(unittest.TestCase):
+    def test_arithmetic(self):
+        d = QuantityArray([1, 2, 3])*meter
+        self.assertEqual(list((d + 1*meter)/meter), [2, 3, 4])
+        self.assertEqual(list((d*d)/meter**2), [1, 4, 9])
+        self.assertEqual(list(sqrt(d*d)/meter), [1, 2, 3])
+        self.assertEqual(list(2*meter/d), [2, 1, 2/3])
+        self.assertEqual((d*vector(0,0,1)*second)[2], vector(0,0,3)*meter*second)
+        with self.assertRaises(Exception):
+            d + 1
+        with self.assertRaises(Exception):
+            d - 1*second
+        with self.assertRaises(Exception):
+            exp(d)
+    def test_reductions(self):
+        d = QuantityArray([3*meter, 1*meter, 2*meter])
+        self.assertEqual(d.sum(), 6*meter)
+        self.assertEqual(d.mean(), 2*meter)
+        self.assertEqual(d.min(), 1*meter)
+        self.assertEqual(d.max(), 3*meter)
+    def test_comparison(self):
+        d = QuantityArray([3, 1, 2])*meter
+        self.assertEqual(list(d > 1.5*meter), [True, False, True])
+        self.assertEqual(list(d > 0), [True, True, True])
+        self.assertEqual(d[d < 2.5*meter].sum(), 3*meter)
+        with self.assertRaises(Exception):
+            d < 3*second
+        d[d > 1.5*meter] = 0*meter
+        self.assertEqual(d.sum(), 1*meter)
+        with self.assertRaises(Exception):
+            d[0] = 3*second
+    def test_from_vectors(self):
+        r = VectorArray([vector(3,4,0), vector(0,0,2)])*meter
+        self.assertEqual(type(abs(r)), QuantityArray)
+        self.assertEqual(abs(r).max(), 5*meter)
+        self.assertEqual(r.x.sum(), 3*meter)
+
+class TestUnitChecking(unittest.TestCase):
+    def test_every_call_is_checked(self):
+        # a line that has run many times still catches a change of units
+        for i in range(201):
+            v = 1*second if i == 200 else 1*meter
+            if i == 200:
+                with self.assertRaises(Exception):
+                    check_units('must be a distance', v, meter)
+            else:
+                self.assertTrue(check_units('must be a distance', v, meter))
+    def test_decorators(self):
+        from physical import units_match
+        @units_match('arguments to f must match')
+        def f(a, b, c):
+            return a + b
+        self.assertEqual(f(1*meter, 2*meter, 0), 3*meter)
+        self.assertEqual(f(c=1*meter, b=2*meter, a=3*meter), 5*meter)
+        with self.assertRaises(Exception):
+            f(1*meter, 2*meter, 3*second)
+        @dimensionless('arguments to g must be dimensionless')
+        def g(x, *rest):
+            return len(rest)
+        self.assertEqual(g(1, 2.0, 3), 2)
+        with self.assertRaises(Exception):
+            g(1, 2*meter)
+        # lambdas, and arguments named like builtins
+        first = units_match('arguments must match')(lambda a, b: a)
+        self.assertEqual(first(1*meter, 2*meter), 1*meter)
+        self.assertEqual(first.__name__, '<lambda>')
+        with self.assertRaises(Exception):
+            first(1*meter, 2*second)
+        same = dimensionless('x must be dimensionless')(lambda x: x)
+        self.assertEqual(same(2), 2)
+        with self.assertRaises(Exception):
+            same(2*meter)
+        @units_match('arguments to h must match')
+        def h(type, getattr, _plain):
+            return type
+        self.assertEqual(h(1*meter, 2*meter, 3*meter), 1*meter)
+        with self.assertRaises(Exception):
+            h(1*meter, 2*meter, 3*second)
+        @dimensionless('arguments to k must be dimensionless')
+        def k(_check, type):
+            return _check + type
+        self.assertEqual(k(1, 2), 3)
+        with self.assertRaises(Exception):
+            k(1, 2*meter)
+
+class TestMutableVectors(unittest.TestCase):
+    def tearDown(self):
+        mutable_vectors(False)
+    def test_in_place(self):
+        mutable_vectors()
+        a = vector(1,0,0)*meter
+        original = id(a)
+        a += vector(0,1,0)*meter
+        a -= vector(1,0,0)*meter
+        a *= 2/second
+        self.assertEqual(a, vector(0,2,0)*meter/second)
+        self.assertEqual(id(a), original)
+        t = 0*second
+        t += 0.5*second
+        self.assertEqual(t, 0.5*second)
+        with self.assertRaises(Exception):
+            a += vector(0,1,0)*meter
+        with self.assertRaises(Exception):
+            t += 1
+    def test_aliasing(self):
+        mutable_vectors()
+        a = vector(1,0,0)*meter
+        b = a
+        a += vector(0,1,0)*meter
+        self.assertEqual(b, vector(1,0,0)*meter)
+        self.assertEqual(a, vector(1,1,0)*meter)
+        x = meter
+        x += meter
+        self.assertEqual(meter, 1*meter)
+
+class TestParticles(unittest.TestCase):
+    def make(self, n):
+        import physical
+        return physical._ParticleSet([vector(i,0,0)*meter for i in range(n)],
+                                     0.1*meter, color.red)
+    def test_whole_set(self):
+        p = self.make(3)
+        self.assertEqual(len(p), 3)
+        p.v = vector(0,0,1)*meter/second
+        p.pos += p.v*(2*second)
+        self.assertEqual(p.pos[2], vector(2,0,2)*meter)
+        self.assertEqual(p.radius.max(), 0.1*meter)
+        with self.assertRaises(Exception):
+            p.pos = p.v
+        with self.assertRaises(Exception):
+            p.v = VectorArray([vector(0,0,1)])*meter/second
+        with self.assertRaises(Exception):
+            p.v = vector(0,0,1)*meter
+        with self.assertRaises(Exception):
+            p.F = p.v
+        p.F = vector(0,0,0)
+        self.assertEqual(p.F[0], vector(0,0,0)*Newton)
+    def test_elements(self):
+        p = self.make(3)
+        b = p[1]
+        self.assertTrue(p[1] is b)
+        b.pos += vector(0,1,0)*meter
+        b.F = vector(0,0,1)*Newton
+        b.m = 2*kg
+        self.assertEqual(p.pos[1], vector(1,1,0)*meter)
+        self.assertEqual(p.F[1], vector(0,0,1)*Newton)
+        self.assertEqual(p[1].m, 2*kg)
+        for q in p:
+            q.F = q.F + vector(1,0,0)*Newton
+        self.assertEqual(p.F.x.sum(), 3*Newton)
+        with self.assertRaises(Exception):
+            b.pos = vector(0,0,1)*second
+        with self.assertRaises(Exception):
+            b.v = vector(0,0,1)*meter
+        b.F = vector(0,0,0)
+        self.assertEqual(p.F[1], vector(0,0,0)*Newton)
+    def test_components(self):
+        import physical
+        p = self.make(3)
+        with self.assertRaises(Exception) as e:
+            p[1].pos.x = 3*meter
+        self.assertTrue('assign a whole vector to p.pos' in str(e.exception))
+        with self.assertRaises(Exception):
+            p[1].v.z = 1*meter/second
+        self.assertEqual(p.pos[1], vector(1,0,0)*meter)
+        p[1].pos = vector(3,0,0)*meter
+        self.assertEqual(p.pos[1], vector(3,0,0)*meter)
+        # vectors computed from a particle's are ordinary vectors
+        dr = p[1].pos - p[0].pos
+        dr.x = 1*meter
+        # and the vectors nobody holds are forgotten
+        for step in range(1000):
+            p[step % 3].pos = p[step % 3].pos + vector(0,0,1)*meter
+        self.assertTrue(len(physical._particle_vectors) < 200)
+        kept = p[2].pos
+        for step in range(1000):
+            p[0].v
+        with self.assertRaises(Exception):
+            kept.y = 1*meter
+
+class TestNeighbors(unittest.TestCase):
+    def test_matches_direct_sum(self):
+        import numpy
+        L = 1*meter
+        law = lambda dr, r: 0.1*L**5*dr/r**6*Newton
+        force = ShortRangeForce(2*L, law, skin=0.5*L)
+        data = numpy.random.RandomState(0).uniform(0, 6, (200, 3))
+        for step in range(3):
+            positions = VectorArray(data)*meter
+            F = force.forces(positions)
+            direct = numpy.zeros_like(data)
+            for i in range(len(data)):
+                dr = data - data[i]
+                r = numpy.sqrt((dr**2).sum(axis=1))
+                near = (r > 0) & (r < 2)
+                direct[i] = -(0.1*dr[near]/r[near,numpy.newaxis]**6).sum(axis=0)
+            self.assertTrue(numpy.allclose(F._data, direct))
+            data = data + 0.1
+        self.assertEqual(force.rebuilds, 2)
+    def test_units(self):
+        force = ShortRangeForce(2*meter, lambda dr, r: dr*Newton)
+        positions = VectorArray([vector(0,0,0), vector(1,0,0)])*meter
+        with self.assertRaises(Exception):
+            force.forces(positions)
+        with self.assertRaises(Exception):
+            ShortRangeForce(2*second, lambda dr, r: dr/r*Newton)
+
+class TestNBody(unittest.TestCase):
+    def test_matches_exact_sum(self):
+        import numpy
+        random = numpy.random.RandomState(0)
+        positions = VectorArray(random.normal(size=(500, 3)))*meter
+        for charges in (QuantityArray(random.uniform(1, 2, 500))*kg,
+                        QuantityArray(random.choice([-1.0, 1.0], 500))*kg):
+            force = InverseSquareForce(-Newton*meter**2/kg**2, theta=0.5,
+                                       direct_below=0)
+            F = force.forces(positions, charges)._data
+            exact = force.exact_forces(positions, charges)._data
+            typical = numpy.sqrt((exact**2).sum(axis=1).mean())
+            self.assertTrue(abs(F - exact).max() < 0.05*typical)
+            force.theta = 0
+            self.assertTrue(numpy.allclose(force.forces(positions, charges)._data, exact))
+    def test_units(self):
+        G = 6.674e-11*Newton*meter**2/kg**2
+        positions = VectorArray([vector(0,0,0), vector(2,0,0)])*meter
+        F = InverseSquareForce(-G).forces(positions, 1*kg)
+        self.assertEqual(F[1], -G*kg**2/(2*meter)**2*vector(1,0,0))
+        with self.assertRaises(Exception):
+            InverseSquareForce(-G).forces(positions, 1*second)
+        with self.assertRaises(Exception):
+            InverseSquareForce(-G, softening=1*second)
+
+class TestParallel(unittest.TestCase):
+    def setUp(self):
+        try:
+            from physical.parallel import WorkerPool
+            self.pool = WorkerPool(3)
+        except Exception as e:
+            self.skipTest(str(e))
+    def tearDown(self):
+        if self.pool is not None:
+            self.pool.close()
+    def test_matches_serial(self):
+        import numpy
+        L = 1*meter
+        law = lambda dr, r: 0.1*L**5*dr/r**6*Newton
+        serial = ShortRangeForce(2*L, law)
+        shared = ShortRangeForce(2*L, law, pool=self.pool)
+        data = numpy.random.RandomState(0).uniform(0, 8, (500, 3))
+        for step in range(3):
+            positions = VectorArray(data + 0.3*step)*meter
+            self.assertTrue(numpy.allclose(shared.forces(positions)._data,
+                                           serial.forces(positions)._data))
+        self.assertEqual(shared.rebuilds, serial.rebuilds)
+        charges = QuantityArray(numpy.random.RandomState(1).uniform(1, 2, 500))*kg
+        G = Newton*meter**2/kg**2
+        self.assertTrue(numpy.allclose(
+            InverseSquareForce(G, pool=self.pool).exact_forces(positions, charges)._data,
+            InverseSquareForce(G).exact_forces(positions, charges)._data))
+        with self.assertRaises(Exception):
+            ShortRangeForce(2*L, lambda dr, r: dr, pool=self.pool).forces(positions)
+    def test_resized_box(self):
+        import physical
+        b = physical._Box(vector(0,0,0)*meter, 20*meter, 20*meter, 20*meter, color.white)
+        force = ShortRangeForce(2*meter, lambda dr, r: dr/r*Newton, box=PeriodicBox(b),
+                                pool=self.pool)
+        pair = VectorArray([vector(-4.5,0,0), vector(4.5,0,0)])*meter
+        self.assertEqual(abs(force.forces(pair)).max(), 0*Newton)
+        # the workers see the box as it is now
+        b.wx = 10*meter
+        F = force.forces(pair)
+        self.assertTrue(abs(F[0] - vector(1,0,0)*Newton) < 1e-12*Newton)
+        self.assertTrue(abs(F[1] + vector(1,0,0)*Newton) < 1e-12*Newton)
+    def test_new_forces(self):
+        import gc, numpy, threading, weakref
+        global _strength
+        L = 1*meter
+        positions = VectorArray(numpy.random.RandomState(0).uniform(0, 8, (300, 3)))*meter
+        expected = ShortRangeForce(2*L, lambda dr, r: 0.1*L**5*dr/r**6*Newton).forces(positions)
+        forces = []
+        for frame in range(4):
+            # a new force each frame, whose law uses a global that changes
+            _strength = 0.1*(frame + 1)
+            force = ShortRangeForce(2*L, lambda dr, r: _strength*L**5*dr/r**6*Newton,
+                                    pool=self.pool)
+            self.assertTrue(numpy.allclose(force.forces(positions)._data,
+                                           (frame + 1)*expected._data))
+            forces.append(weakref.ref(force))
+            del force
+        gc.collect()
+        self.assertEqual(self.pool.starts, 1)
+        self.assertEqual([f() for f in forces], [None]*4)
+        # a force that cannot be copied to the workers starts them again
+        lock = threading.Lock()
+        force = ShortRangeForce(2*L, lambda dr, r: lock and 0.1*L**5*dr/r**6*Newton,
+                                pool=self.pool)
+        self.assertTrue(numpy.allclose(force.forces(positions)._data, expected._data))
+        self.assertEqual(self.pool.starts, 2)
+        # a closed pool is not kept alive
+        del force
+        pool = weakref.ref(self.pool)
+        self.pool.close()
+        self.pool = None
+        gc.collect()
+        self.assertTrue(pool() is None)
+
+class TestPeriodic(unittest.TestCase):
+    def test_matches_direct_sum(self):
+        import numpy, physical
+        cell = PeriodicBox(physical._Box(vector(1,2,3)*meter, 10*meter, 7*meter, 5*meter,
+                                         color.white))
+        L = 1*meter
+        force = ShortRangeForce(2*L, lambda dr, r: 0.1*L**5*dr/r**6*Newton, box=cell)
+        data = numpy.random.RandomState(0).uniform(-20, 20, (300, 3))
+        F = force.forces(VectorArray(data)*meter)._data
+        widths = numpy.array([10, 7, 5])
+        dr = data[numpy.newaxis,:,:] - data[:,numpy.newaxis,:]
+        dr -= widths*numpy.round(dr/widths)
+        r = numpy.sqrt((dr**2).sum(axis=2))
+        r[(r == 0) | (r >= 2)] = numpy.inf
+        self.assertTrue(numpy.allclose(F, -(0.1*dr/r[:,:,numpy.newaxis]**6).sum(axis=1)))
+        inside = cell.wrap(VectorArray(data)*meter)
+        self.assertTrue(((inside._data >= [-4, -1.5, 0.5]) &
+                         (inside._data < [6, 5.5, 5.5])).all())
+        self.assertTrue(numpy.allclose(force.forces(inside)._data, F))
+        self.assertEqual(cell.minimum_image(vector(9,0,-6)*meter), vector(-1,0,-1)*meter)
+        with self.assertRaises(Exception):
+            ShortRangeForce(3*L, lambda dr, r: dr/r*Newton, box=cell).forces(inside)
+    def test_resized_box(self):
+        import physical
+        b = physical._Box(vector(0,0,0)*meter, 20*meter, 20*meter, 20*meter, color.white)
+        law = lambda dr, r: dr/r*Newton
+        force = ShortRangeForce(2*meter, law, box=PeriodicBox(b))
+        pair = VectorArray([vector(-4.5,0,0), vector(4.5,0,0)])*meter
+        self.assertEqual(abs(force.forces(pair)).max(), 0*Newton)
+        # the two particles are now next to each other across the faces
+        b.wx = 10*meter
+        self.assertEqual(list(force.forces(pair) ==
+                              ShortRangeForce(2*meter, law, box=PeriodicBox(b)).forces(pair)),
+                         [True, True])
+        self.assertEqual(force.forces(pair)[0], vector(1,0,0)*Newton)
+
+class TestHardSpheres(unittest.TestCase):
+    def test_gas(self):
+        import numpy, physical
+        walls = physical._Box(vector(0,0,0)*meter, 12*meter, 12*meter, 12*meter, color.white)
+        grid = numpy.mgrid[0:4,0:4,0:4].reshape(3, -1).T*2.5 - 3.75
+        gas = physical._ParticleSet([vector(*p)*meter for p in grid.tolist()],
+                                    0.5*meter, color.red)
+        gas.v = VectorArray(numpy.random.RandomState(0).normal(size=(64, 3)))*meter/second
+        gas.m = QuantityArray(numpy.linspace(1, 2, 64))*kg
+        def energy():
+            return (0.5*gas.m.v*(gas.v._data**2).sum(axis=1)).sum()
+        before = energy()
+        engine = HardSpheres(walls)
+        for frame in range(20):
+            engine.advance(gas, 0.5*second)
+        self.assertTrue(engine.collisions > 0)
+        self.assertTrue(engine.wall_collisions > 0)
+        self.assertAlmostEqual(energy(), before)
+        self.assertEqual(engine.t, 10*second)
+        x = gas.pos._data
+        dr = x[:,numpy.newaxis,:] - x[numpy.newaxis,:,:]
+        r = numpy.sqrt((dr**2).sum(axis=2)) + 2*numpy.eye(64)
+        self.assertTrue(r.min() > 1 - 1e-9)
+        self.assertTrue((abs(x) <= 5.5 + 1e-9).all())
+        gas.v = -gas.v
+        engine.advance(gas, 0.5*second)
+        gas[0].pos = gas[1].pos
+        with self.assertRaises(Exception):
+            engine.advance(gas, 0.5*second)
+
+class TestCollisions(unittest.TestCase):
+    def test_contacts(self):
+        import physical
+        ground = physical._Box(vector(0,0,-0.5)*meter, 10*meter, 10*meter, 1*meter, color.green)
+        crate = physical._Box(vector(2.8,0,0.4)*meter, 1*meter, 1*meter, 1*meter, color.white)
+        balls = [physical._Sphere(vector(x,0,0.9)*meter, 1*meter, color.red)
+                 for x in (0, 1.5, 10)]
+        detector = CollisionDetector()
+        found = detector.collisions([ground, crate] + balls)
+        pairs = [(c.a, c.b) for c in found]
+        self.assertEqual(pairs, [(ground, crate), (ground, balls[0]), (ground, balls[1]),
+                                 (crate, balls[1]), (balls[0], balls[1])])
+        self.assertEqual(found[0].normal, vector(0,0,1))
+        self.assertTrue(abs(found[0].depth - 0.1*meter) < 1e-12*meter)
+        self.assertEqual(found[3].normal, vector(-1,0,0))
+        self.assertTrue(abs(found[4].depth - 0.5*meter) < 1e-12*meter)
+        self.assertEqual(detector.collisions([ground, crate] + balls)[4].b, balls[1])
+        self.assertEqual(detector.tested, 0)
+        balls[1].pos = vector(1.5,0,5)*meter
+        self.assertEqual(len(detector.collisions([ground, crate] + balls)), 2)
+        balls[2].pos = vector(2,0,0.9)*meter
+        self.assertEqual(len(detector.collisions([ground, crate] + balls)), 4)
+        self.assertEqual(detector.tested, 3)
+        balls[0].pos = vector(0,0,0.8)*meter
+        found = detector.collisions([ground, crate] + balls, moving=[2])
+        self.assertEqual([(c.a, c.b) for c in found], [(ground, balls[0])])
+        self.assertTrue(abs(found[0].depth - 0.2*meter) < 1e-12*meter)
+        with self.assertRaises(Exception):
+            collisions([ground, vector(0,0,0)*meter])
+
+class TestSleeping(unittest.TestCase):
+    def settle(self, tracker, steps):
+        dt = 0.01*second
+        g = vector(0,0,-9.8)*meter/second**2
+        for step in range(steps):
+            contacts = tracker.collisions()
+            for o in tracker.awake:
+                o.F = g*kg
+            for c in contacts:
+                # a stiff damped spring pushing the objects apart
+                dv = getattr(c.b, 'v', 0*c.b.pos/second) - getattr(c.a, 'v', 0*c.a.pos/second)
+                F = (1000*Newton/meter*c.depth - 20*kg/second*dv.dot(c.normal))*c.normal
+                if hasattr(c.b, 'v'):
+                    c.b.F = c.b.F + F
+                if hasattr(c.a, 'v'):
+                    c.a.F = c.a.F - F
+            for o in tracker.awake:
+                o.v = o.v + o.F/kg*dt
+                o.pos = o.pos + o.v*dt
+            tracker.update(dt)
+    def test_pile_sleeps_and_wakes(self):
+        import physical
+        ground = physical._Box(vector(0,0,-0.5)*meter, 20*meter, 20*meter, 1*meter, color.green)
+        stack = [physical._Sphere(vector(0,0,0.5 + 1.1*k)*meter, 0.5*meter, color.red)
+                 for k in range(3)]
+        loner = physical._Sphere(vector(5,0,0.6)*meter, 0.5*meter, color.red)
+        for o in stack + [loner]:
+            o.v = vector(0,0,0)*meter/second
+        tracker = SleepTracker([ground] + stack + [loner])
+        self.assertEqual(len(tracker.awake), 4)
+        self.settle(tracker, 400)
+        self.assertEqual(tracker.awake, [])
+        self.assertEqual(stack[2].v, vector(0,0,0)*meter/second)
+        # moving the top of the stack wakes the whole stack, but not the loner
+        stack[2].pos = stack[2].pos + vector(0,0,0.01)*meter
+        tracker.collisions()
+        self.assertEqual(tracker.awake, stack)
+        self.settle(tracker, 200)
+        self.assertEqual(tracker.awake, [])
+        # a ball rolling into the loner wakes it
+        loner.v = vector(0,0,0)*meter/second
+        visitor = physical._Sphere(vector(4.2,0,0.5)*meter, 0.5*meter, color.blue)
+        visitor.v = vector(1,0,0)*meter/second
+        tracker = SleepTracker([ground] + stack + [loner, visitor])
+        self.settle(tracker, 100)
+        self.assertTrue(loner in tracker.awake)
+        tracker.wake(stack[0])
+        self.assertTrue(all(o in tracker.awake for o in stack))
+    def test_sleepers_are_not_polled(self):
+        import physical
+        ground = physical._Box(vector(0,0,-0.5)*meter, 100*meter, 100*meter, 1*meter, color.green)
+        balls = [physical._Sphere(vector(2*k,0,0.5)*meter, 0.5*meter, color.red)
+                 for k in range(20)]
+        for b in balls:
+            b.v = vector(0,0,0)*meter/second
+        tracker = SleepTracker([ground] + balls)
+        self.settle(tracker, 100)
+        self.assertEqual(tracker.awake, [])
+        # a sleeping ball is still a sphere, but is no longer read each step
+        self.assertTrue(isinstance(balls[0], physical._Sphere))
+        self.assertEqual(type(balls[0]).__name__, '_Sphere')
+        class Spy(physical._Sphere):
+            __slots__ = ()
+            reads = 0
+            def __getattribute__(self, name):
+                if name == 'pos':
+                    Spy.reads += 1
+                return physical._Sphere.__getattribute__(self, name)
+        spy = Spy(vector(0,5,0.5)*meter, 0.5*meter, color.red)
+        spy.v = vector(0,0,0)*meter/second
+        tracker = SleepTracker([ground] + balls + [spy])
+        self.settle(tracker, 100)
+        self.assertEqual(tracker.awake, [])
+        Spy.reads = 0
+        self.settle(tracker, 10)
+        self.assertEqual(Spy.reads, 0)
+        # setting a position to what it was does not wake a ball
+        balls[3].pos = balls[3].pos
+        tracker.collisions()
+        self.assertEqual(tracker.awake, [])
+        balls[3].v = vector(1,0,0)*meter/second
+        tracker.collisions()
+        self.assertEqual(tracker.awake, [balls[3]])
+        self.assertTrue(type(balls[3]) is physical._Sphere)
+    def test_particles_sleep_and_wake(self):
+        import physical
+        ground = physical._Box(vector(0,0,-0.5)*meter, 100*meter, 100*meter, 1*meter, color.green)
+        balls = physical._ParticleSet([vector(2*k,0,0.5)*meter for k in range(10)],
+                                      0.5*meter, color.red)
+        tracker = SleepTracker([ground] + list(balls))
+        self.settle(tracker, 100)
+        self.assertEqual(tracker.awake, [])
+        balls.pos = balls.pos + VectorArray([vector(0,0,0.01*(k == 4)) for k in range(10)])*meter
+        tracker.collisions()
+        self.assertEqual(tracker.awake, [balls[4]])
+    def test_units(self):
+        import physical
+        ball = physical._Sphere(vector(0,0,0)*meter, 0.5*meter, color.red)
+        ball.v = vector(0,0,0)*meter
+        with self.assertRaises(Exception):
+            SleepTracker([ball])
+        ball.v = vector(0,0,0)*meter/second
+        with self.assertRaises(Exception):
+            SleepTracker([ball], delay=1*meter)
+        with self.assertRaises(Exception):
+            SleepTracker([ball], speed=1*second)
+        with self.assertRaises(Exception):
+            SleepTracker([ball]).update(1*meter)
+
+class TestSprings(unittest.TestCase):
+    def test_matches_helix_loop(self):
+        import physical
+        balls = physical._ParticleSet([vector(i,j,0)*meter for i in range(3) for j in range(3)],
+                                      0.2*meter, color.blue)
+        springs = [physical._Helix(balls[a], balls[b], 0.02*meter, color.white, 1*meter, 5)
+                   for a, b in ((0,1), (1,2), (0,3), (3,6), (4,5), (1,4))]
+        balls.pos += VectorArray([vector(0.1*i, 0.01*i**2, 0.02) for i in range(9)])*meter
+        k = 10*Newton/meter
+        network = SpringNetwork(springs, k, rest_length=1*meter)
+        for b in balls:
+            b.F = vector(0,0,0)*Newton
+        energy = 0*Joule
+        for h in springs:
+            dr = h.pos2.pos - h.pos1.pos
+            F = k*(abs(dr) - 1*meter)*dr/abs(dr)
+            h.pos2.F -= F
+            h.pos1.F += F
+            energy += 0.5*k*(abs(dr) - 1*meter)**2
+        self.assertTrue(abs(abs(network.forces() - balls.F).max()) < 1e-12*Newton)
+        self.assertTrue(abs(network.energy() - energy) < 1e-12*Joule)
+        self.assertEqual(network.rest_length[0], 1*meter)
+    def test_units(self):
+        import physical
+        balls = physical._ParticleSet([vector(0,0,0)*meter, vector(1,0,0)*meter],
+                                      0.2*meter, color.blue)
+        network = SpringNetwork([(balls[0], balls[1])], 1*Newton/meter)
+        self.assertEqual(network.rest_length[0], 1*meter)
+        with self.assertRaises(Exception):
+            SpringNetwork([(balls[0], balls[1])], 1*Newton)
+        with self.assertRaises(Exception):
+            SpringNetwork([(balls[0], vector(0,0,0)*meter)], 1*Newton/meter)
+    def test_spheres(self):
+        import physical
+        balls = [physical._Sphere(vector(i,0.1*i**2,0)*meter, 0.2*meter, color.blue)
+                 for i in range(4)]
+        springs = [physical._Helix(balls[a], balls[b], 0.02*meter, color.white, 1*meter, 5)
+                   for a, b in ((2,1), (0,1), (2,3), (0,3))]
+        k = 10*Newton/meter
+        network = SpringNetwork(springs, k, rest_length=1*meter)
+        self.assertEqual(network.objects, [balls[2], balls[1], balls[0], balls[3]])
+        for b in balls:
+            b.F = vector(0,0,0)*Newton
+        for h in springs:
+            dr = h.pos2.pos - h.pos1.pos
+            F = k*(abs(dr) - 1*meter)*dr/abs(dr)
+            h.pos2.F -= F
+            h.pos1.F += F
+        for b, F in zip(network.objects, network.forces()):
+            self.assertTrue(abs(F - b.F) < 1e-12*Newton)
+        # the network reads the positions each time
+        balls[3].pos = vector(3,0,0)*meter
+        self.assertEqual(network.lengths()[3], 3*meter)
+        with self.assertRaises(Exception):
+            SpringNetwork([(balls[0], physical._ParticleSet([vector(0,0,0)*meter],
+                                                            0.2*meter, color.blue)[0])],
+                          1*Newton/meter)
+
+class TestIntegrate(unittest.TestCase):
+    def oscillator(self, method, dt, steps):
+        import physical
+        k = 4*Newton/meter
+        balls = physical._ParticleSet([vector(1,0,0)*meter], 0.1*meter, color.red)
+        balls.m = 1*kg
+        integrate(balls, lambda pos, v: -k*pos, dt, method=method, steps=steps)
+        energy = 0.5*k*abs(balls.pos[0])**2 + 0.5*balls.m[0]*abs(balls.v[0])**2
+        return balls, energy
+    def test_methods(self):
+        import math
+        exact = 2*Joule
+        for method in ('semi-implicit', 'verlet', 'rk4'):
+            balls, energy = self.oscillator(method, 0.1*second, 1000)
+            self.assertTrue(abs(energy - exact) < 0.15*exact)
+        balls, energy = self.oscillator('euler', 0.1*second, 1000)
+        self.assertTrue(energy > 1000*exact)
+        balls, energy = self.oscillator('rk4', 0.01*second, 1000)
+        self.assertTrue(abs(balls.pos[0].x - math.cos(20)*meter) < 1e-6*meter)
+        self.assertTrue(abs(balls.F[0].x + 4*math.cos(20)*Newton) < 1e-5*Newton)
+        with self.assertRaises(Exception):
+            self.oscillator('leapfrog', 0.1*second, 1)
+    def test_single_object(self):
+        class Ball(object):
+            pass
+        ball = Ball()
+        ball.pos = vector(0,0,10)*meter
+        ball.v = vector(1,0,0)*meter/second
+        ball.m = 2*kg
+        g = vector(0,0,-9.8)*meter/second**2
+        integrate(ball, lambda pos, v: ball.m*g, 0.01*second, steps=100)
+        self.assertTrue(abs(ball.pos - vector(1,0,5.1)*meter) < 1e-9*meter)
+        with self.assertRaises(Exception):
+            integrate(ball, lambda pos, v: g, 0.01*second)
+        with self.assertRaises(Exception):
+            integrate(ball, lambda pos, v: ball.m*g, 0.01*meter)
+    def test_adaptive(self):
+        import math
+        class Ball(object):
+            pass
+        ball = Ball()
+        ball.pos = vector(1,0,0)*meter
+        ball.v = vector(0,0,0)*meter/second
+        ball.m = 1*kg
+        k = 4*Newton/meter
+        solver = AdaptiveIntegrator(lambda pos, v: -k*pos)
+        for frame in range(100):
+            solver.advance(ball, 0.1*second)
+        self.assertTrue(abs(solver.t - 10*second) < 1e-9*second)
+        self.assertTrue(abs(ball.pos.x - math.cos(20)*meter) < 1e-4*meter)
+        # steps are longer than frames, between which we interpolate
+        self.assertTrue(solver.evaluations < 600)
+        self.assertTrue(solver.step_sizes.max() > 0.1*second)
+        self.assertTrue(solver.times[-1] + solver.step_sizes[-1] >= 10*second)
+        # changing the velocity between frames starts a new step
+        ball.v = -ball.v
+        solver.advance(ball, math.pi*second)
+        self.assertTrue(abs(ball.pos.x - math.cos(20)*meter) < 1e-4*meter)
+        with self.assertRaises(Exception):
+            AdaptiveIntegrator(lambda pos, v: -k*pos, atol=1e-6*second)
+    def test_events(self):
+        import math
+        class Ball(object):
+            pass
+        ball = Ball()
+        ball.pos = vector(-1,0,16)*meter
+        ball.v = vector(2,0,0)*meter/second
+        ball.m = 1*kg
+        g = vector(0,0,-9.8)*meter/second**2
+        solver = AdaptiveIntegrator(lambda pos, v: ball.m*g)
+        def bounce(ball):
+            ball.v = vector(ball.v.x, ball.v.y, -ball.v.z)
+        solver.add_event(lambda ball: ball.pos.z, bounce, direction=-1)
+        solver.add_event(lambda ball: ball.pos.z - 20*meter, lambda ball: True)
+        for frame in range(200):
+            solver.advance(ball, 0.03*second)
+        fall = math.sqrt(2*16/9.8)
+        self.assertEqual(len(solver.events), 2)
+        self.assertTrue(abs(solver.events[0][0] - fall*second) < 1e-8*second)
+        self.assertTrue(abs(solver.events[1][0] - 3*fall*second) < 1e-8*second)
+        self.assertTrue(abs(ball.pos.z - (16 - 4.9*(4*fall - 6)**2)*meter) < 1e-6*meter)
+        # a bounce watched in both directions is not caught again on
+        # the way back up
+        ball.pos = vector(0,0,16)*meter
+        ball.v = vector(0,0,0)*meter/second
+        solver = AdaptiveIntegrator(lambda pos, v: ball.m*g)
+        solver.add_event(lambda ball: ball.pos.z, bounce)
+        for frame in range(200):
+            solver.advance(ball, 0.03*second)
+        self.assertEqual(len(solver.events), 2)
+        self.assertTrue(abs(solver.events[1][0] - 3*fall*second) < 1e-8*second)
+        self.assertTrue(abs(ball.pos.z - (16 - 4.9*(4*fall - 6)**2)*meter) < 1e-6*meter)
+        # stop at the moment of an event
+        solver = AdaptiveIntegrator(lambda pos, v: ball.m*g)
+        solver.add_event(lambda ball: ball.v.z, lambda ball: True)
+        self.assertTrue(solver.advance(ball, 10*second))
+        self.assertTrue(abs(ball.v.z) < 1e-6*meter/second)
+        solver.add_event(lambda ball: ball.v, None)
+        with self.assertRaises(Exception):
+            solver.advance(ball, 1*second)
+    def test_implicit(self):
+        import numpy
+        import physical
+        N = 10
+        def chain():
+            balls = physical._ParticleSet([vector(i,0,0)*meter for i in range(N)],
+                                          0.2*meter, color.blue)
+            network = SpringNetwork([(balls[i], balls[i+1]) for i in range(N-1)],
+                                    10*Newton/meter)
+            balls.m = 0.1*kg
+            wiggle = numpy.random.RandomState(0).normal(scale=0.01, size=(N, 3))
+            balls.pos += VectorArray(wiggle)*meter
+            return balls, network
+        # The stiffness matrix gives the change in the forces
+        balls, network = chain()
+        dx = numpy.random.RandomState(1).normal(scale=1e-7, size=(N, 3))
+        change = network.forces(balls.pos + VectorArray(dx)*meter) - network.forces(balls)
+        K = network.stiffness_matrix(balls)
+        self.assertTrue(numpy.allclose(K.dot(dx), change._data, atol=1e-12))
+        # a time step far too long for explicit methods
+        balls, network = chain()
+        integrate(balls, lambda pos, v: network.forces(pos), 0.5*second, steps=20)
+        self.assertTrue(network.energy() > 1e6*Joule)
+        balls, network = chain()
+        energy = network.energy()
+        solver = ImplicitIntegrator(network)
+        solver.advance(balls, 0.5*second, steps=20)
+        self.assertTrue(network.energy() < energy)
+        self.assertTrue(solver.damping > 0.9)
+        balls, network = chain()
+        solver = ImplicitIntegrator(network, method='implicit-midpoint')
+        solver.advance(balls, 0.5*second, steps=20)
+        self.assertTrue(abs(solver.damping) < 1e-3)
+        with self.assertRaises(Exception):
+            ImplicitIntegrator(network, method='explicit')
+    def test_multirate(self):
+        import physical
+        def ball():
+            balls = physical._ParticleSet([vector(1,0,0)*meter], 0.1*meter, color.red)
+            balls.v = vector(0,1,0)*meter/second
+            return balls
+        stiff = lambda pos, v: -100*Newton/meter*pos
+        weak = lambda pos, v: -1*Newton/meter*pos
+        # with every force computed every step, this is velocity Verlet
+        verlet = ball()
+        integrate(verlet, lambda pos, v: stiff(pos, v) + weak(pos, v), 0.01*second, steps=100)
+        balls = ball()
+        solver = MultirateIntegrator()
+        solver.add_force(stiff)
+        solver.add_force(weak)
+        solver.advance(balls, 0.01*second, steps=100)
+        self.assertTrue(abs(abs(balls.pos - verlet.pos).max()) < 1e-12*meter)
+        balls = ball()
+        solver = MultirateIntegrator()
+        solver.add_force(stiff)
+        solver.add_force(weak, every=5)
+        def energy():
+            return 0.5*101*Newton/meter*abs(balls.pos[0])**2 + 0.5*kg*abs(balls.v[0])**2
+        start = energy()
+        solver.advance(balls, 0.01*second, steps=1000)
+        self.assertTrue(abs(energy() - start) < 0.01*start)
+        self.assertEqual(solver.evaluations, [1001, 201])
+        # advancing a frame at a time reuses the forces from the last frame
+        frames = ball()
+        solver = MultirateIntegrator()
+        solver.add_force(stiff)
+        solver.add_force(weak, every=5)
+        for frame in range(100):
+            solver.advance(frames, 0.01*second, steps=5)
+        self.assertEqual(solver.evaluations, [501, 101])
+        balls = ball()
+        whole = MultirateIntegrator()
+        whole.add_force(stiff)
+        whole.add_force(weak, every=5)
+        whole.advance(balls, 0.01*second, steps=500)
+        self.assertTrue(abs(abs(balls.pos - frames.pos).max()) < 1e-12*meter)
+        frames.v = vector(0,0,0)*meter/second
+        solver.advance(frames, 0.01*second, steps=5)
+        self.assertEqual(solver.evaluations, [507, 103])
+        # a force added later is computed on its own
+        solver.add_force(lambda pos, v: -2*Newton/meter*pos, every=5)
+        solver.advance(frames, 0.01*second, steps=5)
+        self.assertEqual(solver.evaluations, [512, 104, 2])
+        # and after a reset every force is computed afresh
+        solver.reset()
+        solver.advance(frames, 0.01*second, steps=5)
+        self.assertEqual(solver.evaluations, [518, 106, 4])
+        with self.assertRaises(Exception):
+            solver.advance(balls, 0.01*second, steps=3)
+        with self.assertRaises(Exception):
+            solver.add_force(weak, every=0.5)
+
+class TestConstraints(unittest.TestCase):
+    def test_chain(self):
+        import numpy, physical
+        g = vector(0,0,-9.8)*meter/second**2
+        chain = physical._ParticleSet([vector(i+1,0,0)*meter for i in range(5)],
+                                      0.1*meter, color.red)
+        links = [physical._Cylinder(vector(0,0,0)*meter, chain[0], 0.02*meter, color.white)]
+        links += [(chain[i], chain[i+1]) for i in range(4)]
+        rods = DistanceConstraints(links)
+        def energy():
+            return (0.5*(chain.v._data**2).sum() + 9.8*chain.pos._data[:,2].sum())
+        before = energy()
+        integrate(chain, lambda pos, v: 1*kg*g, 0.01*second, steps=200, constraints=rods)
+        x = numpy.concatenate([[[0, 0, 0]], chain.pos._data])
+        lengths = numpy.sqrt(((x[1:] - x[:-1])**2).sum(axis=1))
+        self.assertTrue(abs(lengths - 1).max() < 1e-9)
+        dx = x[1:] - x[:-1]
+        dv = numpy.concatenate([[[0, 0, 0]], chain.v._data])
+        dv = dv[1:] - dv[:-1]
+        self.assertTrue(abs((dx*dv).sum(axis=1)).max() < 1e-6)
+        self.assertTrue(abs(energy() - before) < 0.05)
+        with self.assertRaises(Exception):
+            integrate(chain, lambda pos, v: 1*kg*g, 0.01*second, method='rk4',
+                      constraints=rods)
+    def test_units(self):
+        import physical
+        balls = physical._ParticleSet([vector(0,0,0)*meter, vector(2,0,0)*meter],
+                                      0.2*meter, color.blue)
+        self.assertEqual(DistanceConstraints([(balls[0], balls[1])]).length[0], 2*meter)
+        with self.assertRaises(Exception):
+            DistanceConstraints([(balls[0], balls[1])], length=1*second)
+        with self.assertRaises(Exception):
+            DistanceConstraints([(balls[0], vector(0,0,0)*second)])
+    def test_contradictory(self):
+        import physical
+        balls = physical._ParticleSet([vector(0,0,0)*meter, vector(1,0,0)*meter],
+                                      0.1*meter, color.red)
+        balls.v = VectorArray([vector(0,1,0), vector(0,-1,0)])*meter/second
+        rods = DistanceConstraints([(balls[0], balls[1]), (balls[0], balls[1])],
+                                   length=QuantityArray([1.0, 1.1])*meter)
+        with self.assertRaises(Exception) as caught:
+            integrate(balls, lambda pos, v: 0*pos*Newton/meter, 0.01*second,
+                      constraints=rods)
+        self.assertTrue('cannot all be satisfied' in str(caught.exception))
+
+class TestFuse(unittest.TestCase):
+    def test_vectors(self):
+        g = vector(0,0,-9.8)*meter/second**2
+        def drag(v, terminal):
+            return -abs(v)*v*abs(g)/terminal**2
+        fused = fuse(drag)
+        v = vector(3,4,0)*meter/second
+        for i in range(2):
+            self.assertEqual(fused(v, 50*meter/second), drag(v, 50*meter/second))
+        vs = VectorArray([v, 2*v])
+        self.assertEqual(fused(vs, 50*meter/second)[1], drag(2*v, 50*meter/second))
+    def test_units(self):
+        @fuse
+        def f(a, b, x):
+            return a.cross(b) + a*abs(a)*sin(x), sqrt(a.dot(a))
+        a = vector(1,0,0)*meter
+        b = vector(0,1,0)*meter
+        self.assertEqual(f(a, b, 0), (vector(0,0,1)*meter**2, 1*meter))
+        with self.assertRaises(Exception):
+            f(a, b/second, 0)
+        with self.assertRaises(Exception):
+            f(a, b, 1*second)
+    def test_fallback(self):
+        @fuse
+        def larger(a, b):
+            if a > b:
+                return a
+            return b
+        self.assertEqual(larger(1*meter, 2*meter), 2*meter)
+        self.assertEqual(larger(3*meter, 2*meter), 3*meter)
+        # a function that cannot be fused is still only run once
+        calls = []
+        @fuse
+        def noisy(a, b):
+            calls.append(a)
+            return a*b if abs(a) > 1*meter else b
+        self.assertEqual(noisy(2*meter, 3*second), 6*meter*second)
+        self.assertEqual(len(calls), 1)
+        # errors in the function are not hidden
+        @fuse
+        def typo(v):
+            return v.magnitude
+        with self.assertRaises(AttributeError):
+            typo(vector(1,0,0)*meter)
+    def test_keywords(self):
+        @fuse
+        def push(v, k=2):
+            return k*v
+        v = vector(1,2,0)*meter
+        self.assertEqual(push(v), 2*v)
+        self.assertEqual(push(v, k=3), 3*v)
+        self.assertEqual(push(k=4, v=v), 4*v)
+        with self.assertRaises(TypeError):
+            push(v, q=3)
+    def test_array_constants(self):
+        offset = VectorArray([vector(1,0,0), vector(0,2,0)])*meter
+        w = QuantityArray([2, 3])
+        for a, b in ((offset, None), (None, offset)):
+            def shift(v):
+                return (a if a is not None else v) + (b if b is not None else v)
+            self.assertEqual(list(fuse(shift)(vector(0,0,1)*meter) == shift(vector(0,0,1)*meter)),
+                             [True, True])
+        def left(v):
+            return w*v - offset
+        def right(v):
+            return v*w - offset
+        v = vector(0,0,1)*meter
+        for f in (left, right):
+            fused = fuse(f)
+            self.assertEqual(type(fused(v)), VectorArray)
+            self.assertEqual(list(fused(v) == f(v)), [True, True])
+        def weights(s):
+            return w*s, s/w, s - w*meter
+        s = 2*meter
+        for got, expected in zip(fuse(weights)(s), weights(s)):
+            self.assertEqual(type(got), QuantityArray)
+            self.assertEqual(list(got == expected), [True, True])
+
+class TestInfer(unittest.TestCase):
+    def test_errors(self):
+        from physical.infer import infer_units
+        r = infer_units('''
+s = sphere(vector(0,0,1)*meter, radius=2*meter)
+s.v = vector(0,0,0)*meter/second
+t = 0*second
+dt = 0.01*second
+while t < 10*second:
+    s.pos += s.v*dt
+    s.pos += s.v
+    if t > 5:
+        print(sin(t))
+    t += dt
+''')
+        self.assertEqual(sorted(line for line, err in r.errors), [8, 9, 10])
+        self.assertTrue(7 in r.proven)
+        self.assertTrue(11 in r.proven)
+        self.assertFalse(8 in r.proven)
+    def test_functions(self):
+        from physical.infer import infer_units
+        r = infer_units('''
+g = vector(0,0,-9.8)*meter/second**2
+def drag(v, terminal):
+    return -abs(v)*v*abs(g)/terminal**2
+v = vector(0,0,0)*meter/second
+a = g + drag(v, 50*meter/second)
+b = g + drag(v, 50*meter)
+''')
+        self.assertEqual([line for line, err in r.errors], [7])
+        self.assertTrue(6 in r.proven)
+
 class TestVisualization(unittest.TestCase):
     def test_windowsize(self):
         camera.windowsize = (200,200)